@@ -1,10 +1,142 @@
-from flask import Flask, request, jsonify, render_template
-import json
-import pandas as pd
+from flask import Flask, request, jsonify, render_template, send_file, url_for
+from concurrent.futures import ThreadPoolExecutor
 import os
+import shutil
+import sys
+import threading
+import time
+import uuid
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from trace_compiler import (DEFAULT_PLAN_PATH, PlanCache, cache_key, compile_trace, iter_plan_services, read_alibaba_2021,
+                            read_alibaba_2022, read_plan_header, write_plan)
+
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads'))
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", "2"))
+# Finished jobs are forgotten, and their plans deleted, once they are older than JOB_TTL seconds or
+# more than MAX_JOBS of them are kept
+JOB_TTL = int(os.getenv("JOB_TTL", str(24 * 3600)))
+MAX_JOBS = int(os.getenv("MAX_JOBS", "100"))
 
 app = Flask(__name__)
 
+# Conversions run in a background pool; jobs maps a job ID to its status, progress and summary
+executor = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS)
+jobs = {}
+jobs_lock = threading.Lock()
+# Re-uploading a trace restores its plan from the cache instead of converting it again
+plan_cache = PlanCache()
+
+
+def update_job(job_id, **fields):
+    with jobs_lock:
+        jobs[job_id].update(fields)
+
+
+def prune_jobs():
+    """
+    Forget the finished jobs past JOB_TTL or beyond the MAX_JOBS most recent ones, and delete their directories.
+    """
+    now = time.time()
+    with jobs_lock:
+        finished = sorted((job['finished'], job_id) for job_id, job in jobs.items() if 'finished' in job)
+        expired = [job_id for finished_at, job_id in finished if now - finished_at > JOB_TTL]
+        expired += [job_id for _, job_id in finished[:max(0, len(finished) - MAX_JOBS)] if job_id not in expired]
+        for job_id in expired:
+            del jobs[job_id]
+    for job_id in expired:
+        shutil.rmtree(os.path.join(UPLOAD_DIR, job_id), ignore_errors=True)
+
+
+def summarize(containers_json, service_calls):
+    """
+    Summary returned instead of the plan: service, call counts and time span of the compiled trace.
+    service_calls yields (service, calls) one service at a time, so plans are summarized as a stream.
+    """
+    calling_services = 0
+    calls = 0
+    start = end = None
+    for service, timestamps in service_calls:
+        calling_services += 1
+        for timestamp, entries in timestamps.items():
+            timestamp = int(timestamp)
+            start = timestamp if start is None else min(start, timestamp)
+            end = timestamp if end is None else max(end, timestamp)
+            calls += sum(entry.get('count', 1) for entry in entries)
+    return {
+        "services": len(containers_json),
+        "calling_services": calling_services,
+        "calls": calls,
+        "start": start,
+        "end": end,
+        "time_span": end - start if start is not None else 0
+    }
+
+
+def convert_job(job_id, reader, *paths):
+    """
+    Convert the uploaded CSVs into the job's plan, then publish it as the plan read by containers/create.py.
+    """
+    job_dir = os.path.dirname(paths[0])
+    plan_path = os.path.join(job_dir, 'plan.jsonl')
+    try:
+        update_job(job_id, status="running", stage="hashing", progress=0.05)
+        key = cache_key(paths, {"source": reader.__name__})
+
+        if plan_cache.restore(key, {'plan.jsonl': plan_path}):
+            update_job(job_id, stage="restoring", progress=0.6)
+            summary = summarize(read_plan_header(plan_path)['containers'], iter_plan_services(plan_path))
+        else:
+            update_job(job_id, stage="reading", progress=0.1)
+            trace = reader(*paths)
+
+            update_job(job_id, stage="compiling", progress=0.4)
+            containers_json, result = compile_trace(trace)
+
+            update_job(job_id, stage="writing", progress=0.8)
+            write_plan(plan_path, containers_json, result, trace.source)
+            plan_cache.put(key, {'plan.jsonl': plan_path})
+            summary = summarize(containers_json, result.items())
+
+        # Replace the shared plan atomically, so concurrent jobs never leave it half written
+        staging_path = f"{DEFAULT_PLAN_PATH}.{job_id}"
+        shutil.copyfile(plan_path, staging_path)
+        os.replace(staging_path, DEFAULT_PLAN_PATH)
+
+        update_job(job_id, status="done", stage="done", progress=1.0, summary=summary, plan_path=plan_path, finished=time.time())
+    except Exception as e:
+        update_job(job_id, status="failed", stage="failed", error=str(e), finished=time.time())
+    finally:
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def submit_upload(reader, files):
+    """
+    Stream the uploaded files to disk and queue their conversion. Returns the 202 response of the job.
+    """
+    prune_jobs()
+    job_id = uuid.uuid4().hex
+    job_dir = os.path.join(UPLOAD_DIR, job_id)
+    os.makedirs(job_dir)
+
+    paths = []
+    for name, file in files:
+        path = os.path.join(job_dir, f"{name}.csv")
+        file.save(path)
+        paths.append(path)
+
+    with jobs_lock:
+        jobs[job_id] = {"status": "queued", "stage": "queued", "progress": 0.0}
+    executor.submit(convert_job, job_id, reader, *paths)
+
+    return jsonify({
+        "job_id": job_id,
+        "status_url": url_for('job_status', job_id=job_id),
+        "plan_url": url_for('job_plan', job_id=job_id)
+    }), 202
+
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -15,150 +147,43 @@ def v2022_form():
 
 @app.route('/upload', methods=['POST'])
 def upload():
-    file1 = request.files['file1']
-    file2 = request.files['file2']
+    file1 = request.files.get('file1')
+    file2 = request.files.get('file2')
 
     if not file1 or not file2:
-        return "Both files are required"
-
-    def read_and_sort_csv(file):
-        df = pd.read_csv(file)
-        sorted_df = df.sort_values(by='timestamp')
-        return sorted_df
-
-    # Process the first CSV to generate calls.json
-    df1 = read_and_sort_csv(file1)
-    result = {}
-    containers = set()
-
-    for _, row in df1.iterrows():
-        timestamp = row['timestamp']
-        um = row['um']
-        dm = row['dm']
-        rpctype = row['rpctype']
-
-        if '?' in um or '?' in dm:
-            continue
-        containers.update([um, dm])
-
-        if um not in result:
-            result[um] = {}
-
-        if timestamp not in result[um]:
-            result[um][timestamp] = []
-        result[um][timestamp].append({
-            "dm_service": dm,
-            "communication_type": rpctype
-        })
-
-    # Process the second CSV to generate containers.json
-    df2 = pd.read_csv(file2)
-    ms_replicas = {}
-
-    for _, row in df2.iterrows():
-        msname = row['msName']
-        msinstanceid = row['msinstanceid']
-
-        if msname not in ms_replicas:
-            ms_replicas[msname] = set()
+        return "Both files are required", 400
 
-        ms_replicas[msname].add(msinstanceid)
+    # The first CSV holds the calls and the second one the instances of every service
+    return submit_upload(read_alibaba_2021, [('calls', file1), ('instances', file2)])
 
-    # Debugging: Print to console to verify content
-    print("ms_replicas:", ms_replicas)
-
-    containers_json = [
-        {"msName": msname, "replicas": len(instances)}
-        for msname, instances in ms_replicas.items()
-    ]
+@app.route('/v2022', methods=['POST'])
+def v2022():
+    file = request.files.get('file')
 
-    # Debugging: Print to console to verify content
-    print("containers_json:", containers_json)
+    if not file:
+        return "File is required", 400
 
-    # output_directory = os.path.join(os.getcwd(), 'containers')
-    # os.makedirs(output_directory, exist_ok=True)
+    return submit_upload(read_alibaba_2022, [('calls', file)])
 
-    # Write calls.json
-    with open('../containers/calls.json', 'w') as f:
-        json.dump(result, f, indent=4)
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    with jobs_lock:
+        job = jobs.get(job_id)
+        job = {key: value for key, value in job.items() if key not in ('plan_path', 'finished')} if job else None
 
-    # Write containers.json
-    with open('../containers/containers.json', 'w') as f:
-        json.dump(containers_json, f, indent=4)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify({"job_id": job_id, **job})
 
-    # Debugging: Confirm that the file was written
-    
-    return jsonify({
-        "calls": result,
-        "containers": containers_json
-    })
+@app.route('/jobs/<job_id>/plan')
+def job_plan(job_id):
+    with jobs_lock:
+        plan_path = jobs.get(job_id, {}).get('plan_path')
 
-@app.route('/v2022', methods=['POST'])
-def v2022():
-    file = request.files['file']
-
-    if not file:
-        return "File is required"
-
-    def read_and_sort_csv(file):
-        df = pd.read_csv(file)
-        sorted_df = df.sort_values(by='timestamp')
-        return sorted_df
-
-    # Process the CSV to generate the required output
-    df = read_and_sort_csv(file)
-    result = {}
-    service_replicas = {}
-
-    for _, row in df.iterrows():
-        timestamp = row['timestamp']
-        um = row['um']
-        dm = row['dm']
-        uminstanceid = row['uminstanceid']
-        dminstanceid = row['dminstanceid']
-        rpctype = row['rpctype']
-
-        if '?' in um or '?' in dm:
-            continue
-
-        # Update replicas for um
-        if um not in service_replicas:
-            service_replicas[um] = set()
-        service_replicas[um].add(uminstanceid)
-
-        # Update replicas for dm
-        if dm not in service_replicas:
-            service_replicas[dm] = set()
-        service_replicas[dm].add(dminstanceid)
-
-        # Build the call graph
-        if um not in result:
-            result[um] = {}
-        if timestamp not in result[um]:
-            result[um][timestamp] = []
-        result[um][timestamp].append({
-            "dm_service": dm,
-            "communication_type": rpctype
-        })
-
-    # Generate containers.json
-    containers_json = [
-        {"msName": service, "replicas": len(instances)}
-        for service, instances in service_replicas.items()
-    ]
-
-    # Write calls.json
-    with open('../containers/calls.json', 'w') as f:
-        json.dump(result, f, indent=4)
-
-    # Write containers.json
-    with open('../containers/containers.json', 'w') as f:
-        json.dump(containers_json, f, indent=4)
-
-    return jsonify({
-        "calls": result,
-        "containers": containers_json
-    })
+    if plan_path is None:
+        return jsonify({"error": "No plan for this job yet"}), 404
+    # send_file streams the plan from disk instead of building the response in memory
+    return send_file(plan_path, mimetype='application/x-ndjson', as_attachment=True, download_name='plan.jsonl')
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', debug=True, port=3000)
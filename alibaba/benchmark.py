@@ -0,0 +1,130 @@
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from trace_compiler import Trace, compile_trace, expand_counts
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+
+def legacy_v2021(calls_df, instances_df):
+    """
+    Row by row conversion that /upload used before the trace compiler, kept as the reference output.
+    """
+    result = {}
+    for _, row in calls_df.sort_values(by='timestamp').iterrows():
+        timestamp = row['timestamp']
+        um = row['um']
+        dm = row['dm']
+        if '?' in um or '?' in dm:
+            continue
+        result.setdefault(um, {}).setdefault(timestamp, []).append({
+            "dm_service": dm,
+            "communication_type": row['rpctype']
+        })
+
+    ms_replicas = {}
+    for _, row in instances_df.iterrows():
+        ms_replicas.setdefault(row['msName'], set()).add(row['msinstanceid'])
+    containers_json = [{"msName": msname, "replicas": len(instances)} for msname, instances in ms_replicas.items()]
+    return containers_json, result
+
+
+def legacy_v2022(df):
+    """
+    Row by row conversion that /v2022 used before the trace compiler, kept as the reference output.
+    """
+    result = {}
+    service_replicas = {}
+    for _, row in df.sort_values(by='timestamp').iterrows():
+        timestamp = row['timestamp']
+        um = row['um']
+        dm = row['dm']
+        if '?' in um or '?' in dm:
+            continue
+        service_replicas.setdefault(um, set()).add(row['uminstanceid'])
+        service_replicas.setdefault(dm, set()).add(row['dminstanceid'])
+        result.setdefault(um, {}).setdefault(timestamp, []).append({
+            "dm_service": dm,
+            "communication_type": row['rpctype']
+        })
+    containers_json = [{"msName": service, "replicas": len(instances)} for service, instances in service_replicas.items()]
+    return containers_json, result
+
+
+def compiled_v2021(calls_df, instances_df):
+    instances = instances_df[['msName', 'msinstanceid']].set_axis(['service', 'instance'], axis=1)
+    return compile_trace(Trace('alibaba-2021', calls_df, instances))
+
+
+def compiled_v2022(df):
+    return compile_trace(Trace('alibaba-2022', df, None))
+
+
+def tile(df, repeat):
+    """
+    Stack `repeat` copies of the trace, each shifted past the end of the previous one.
+    """
+    if repeat <= 1:
+        return df
+    span = int(df['timestamp'].max() - df['timestamp'].min()) + 1
+    return pd.concat([df.assign(timestamp=df['timestamp'] + i * span) for i in range(repeat)], ignore_index=True)
+
+
+def normalize_calls(calls):
+    """
+    Calls with collapsed entries expanded and the entries of every timestamp sorted, since collapsing
+    moves identical calls of one timestamp next to each other.
+    """
+    return {
+        um: {str(timestamp): sorted(entries, key=lambda entry: (entry['dm_service'], entry['communication_type']))
+             for timestamp, entries in service_calls.items()}
+        for um, service_calls in expand_counts(calls).items()
+    }
+
+
+def time_call(func, *args):
+    start = time.perf_counter()
+    output = func(*args)
+    return time.perf_counter() - start, output
+
+
+def run_case(name, legacy_func, compiled_func, *frames):
+    legacy_time, legacy_output = time_call(legacy_func, *frames)
+    compiled_time, compiled_output = time_call(compiled_func, *frames)
+    # Compare the serialized output since timestamps are only strings once written
+    legacy_containers, legacy_calls = legacy_output
+    compiled_containers, compiled_calls = compiled_output
+    identical = (json.dumps(legacy_containers) == json.dumps(compiled_containers)
+                 and json.dumps(normalize_calls(legacy_calls)) == json.dumps(normalize_calls(compiled_calls)))
+    print(f"{name:<40} rows={len(frames[0]):>9} legacy={legacy_time:8.3f}s compiled={compiled_time:8.3f}s "
+          f"speedup={legacy_time / max(compiled_time, 1e-9):7.1f}x identical={identical}")
+    return identical
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the trace compiler against the row by row conversion it replaced.")
+    parser.add_argument('--repeat', type=int, default=1, help="Tile every trace this many times to emulate larger shards.")
+    args = parser.parse_args()
+
+    identical = True
+    calls_df = tile(pd.read_csv(os.path.join(DATA_DIR, 'v2021', 'callGraph_data.csv')), args.repeat)
+    instances_df = pd.read_csv(os.path.join(DATA_DIR, 'v2021', 'msName_msInstanceid.csv'))
+    identical &= run_case('v2021/callGraph_data.csv', legacy_v2021, compiled_v2021, calls_df, instances_df)
+
+    for path in sorted(glob.glob(os.path.join(DATA_DIR, 'v2022', 'filtered_um_*.csv'))):
+        df = tile(pd.read_csv(path), args.repeat)
+        identical &= run_case(f"v2022/{os.path.basename(path)}", legacy_v2022, compiled_v2022, df)
+
+    if not identical:
+        raise SystemExit("Compiled output differs from the legacy conversion.")
+
+
+if __name__ == '__main__':
+    main()
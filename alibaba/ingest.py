@@ -0,0 +1,174 @@
+import argparse
+import glob
+import heapq
+import os
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from trace_compiler import DEFAULT_PLAN_PATH, PlanWriter, collapse_entries, drop_unknown_services
+
+COLUMNS = ['timestamp', 'um', 'dm', 'rpctype', 'uminstanceid', 'dminstanceid']
+
+
+def run_key(line):
+    """
+    Sort key of a run line: (um, timestamp). Every run is ordered by timestamp within each upstream
+    service, so the merged stream comes out already grouped into per-service call plans.
+    """
+    um, timestamp, _ = line.split('\t', 2)
+    return um, int(timestamp)
+
+
+def sort_shard(path, run_dir, chunk_rows):
+    """
+    Read one shard in chunks of at most chunk_rows rows, drop unknown services and write every chunk
+    as a sorted run file. Returns the run paths and the instance IDs seen for every service.
+    """
+    run_paths = []
+    instances = {}
+    shard_name = os.path.basename(path).split('.')[0]
+
+    for chunk_index, chunk in enumerate(pd.read_csv(path, usecols=COLUMNS, chunksize=chunk_rows)):
+        chunk['timestamp'] = pd.to_numeric(chunk['timestamp'], errors='coerce')
+        chunk = drop_unknown_services(chunk.dropna(subset=['timestamp']))
+        if chunk.empty:
+            continue
+        chunk = chunk.astype({'timestamp': 'int64'})
+
+        for service_column, instance_column in (('um', 'uminstanceid'), ('dm', 'dminstanceid')):
+            for service, service_instances in chunk.groupby(service_column, sort=False)[instance_column].unique().items():
+                instances.setdefault(service, set()).update(service_instances)
+
+        chunk = chunk.sort_values(by=['um', 'timestamp'], kind='stable')
+        run_path = os.path.join(run_dir, f"{shard_name}-{chunk_index}.tsv")
+        chunk[['um', 'timestamp', 'dm', 'rpctype']].to_csv(run_path, sep='\t', header=False, index=False)
+        run_paths.append(run_path)
+
+    return run_paths, instances
+
+
+def merge_runs(run_paths, output_path):
+    """
+    k-way merge of sorted run files into a single sorted run. Only one line per run is held in memory.
+    """
+    files = [open(path) for path in run_paths]
+    try:
+        with open(output_path, 'w') as output:
+            output.writelines(heapq.merge(*files, key=run_key))
+    finally:
+        for file in files:
+            file.close()
+    for path in run_paths:
+        os.remove(path)
+    return output_path
+
+
+def reduce_runs(executor, run_paths, run_dir, fan_in):
+    """
+    Merge runs in parallel batches of fan_in until at most fan_in are left, so the number of files
+    open at once stays bounded however many runs the shards produced.
+    """
+    generation = 0
+    while len(run_paths) > fan_in:
+        batches = [run_paths[i:i + fan_in] for i in range(0, len(run_paths), fan_in)]
+        futures = [
+            executor.submit(merge_runs, batch, os.path.join(run_dir, f"merge-{generation}-{index}.tsv"))
+            for index, batch in enumerate(batches)
+        ]
+        run_paths = [future.result() for future in futures]
+        print(f"Merge pass {generation}: {len(batches)} runs left.")
+        generation += 1
+    return run_paths
+
+
+def write_plan_calls(run_paths, writer):
+    """
+    Stream the final merge into the plan, one service line at a time. Only the calls of the current
+    (um, timestamp) are buffered, and identical calls among them are collapsed into one entry with a
+    count. Returns the number of calls written.
+    """
+    files = [open(path) for path in run_paths]
+    total_calls = 0
+    current_um = None
+    current_timestamp = None
+    entries = []
+
+    try:
+        for line in heapq.merge(*files, key=run_key):
+            um, timestamp, dm, rpctype = line.rstrip('\n').split('\t')
+            if um != current_um:
+                if current_um is not None:
+                    writer.write_timestamp(current_timestamp, collapse_entries(entries))
+                    writer.end_service()
+                writer.begin_service(um)
+                current_um, current_timestamp, entries = um, timestamp, []
+            elif timestamp != current_timestamp:
+                writer.write_timestamp(current_timestamp, collapse_entries(entries))
+                current_timestamp, entries = timestamp, []
+            entries.append((dm, rpctype))
+            total_calls += 1
+        if current_um is not None:
+            writer.write_timestamp(current_timestamp, collapse_entries(entries))
+            writer.end_service()
+    finally:
+        for file in files:
+            file.close()
+    return total_calls
+
+
+def ingest(shard_paths, plan_path, chunk_rows, workers, fan_in, tmp_dir=None):
+    """
+    Compile a set of Alibaba 2022 call graph shards into the plan at plan_path.
+    """
+    with tempfile.TemporaryDirectory(dir=tmp_dir) as run_dir, ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(sort_shard, path, run_dir, chunk_rows) for path in shard_paths]
+
+        run_paths = []
+        service_instances = {}
+        for path, future in zip(shard_paths, futures):
+            shard_runs, shard_instances = future.result()
+            run_paths.extend(shard_runs)
+            for service, instances in shard_instances.items():
+                service_instances.setdefault(service, set()).update(instances)
+            print(f"Sorted {path} into {len(shard_runs)} runs.")
+
+        # Replicas are known once every shard is sorted, so the plan header can go first
+        containers = [
+            {"msName": service, "replicas": len(instances)}
+            for service, instances in sorted(service_instances.items())
+        ]
+        run_paths = reduce_runs(executor, run_paths, run_dir, fan_in)
+
+        with PlanWriter(plan_path, containers, 'alibaba-2022') as writer:
+            total_calls = write_plan_calls(run_paths, writer)
+
+    print(f"Wrote {total_calls} calls for {len(containers)} services to {plan_path}.")
+    return total_calls, containers
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest a directory of Alibaba 2022 call graph shards into a plan.")
+    parser.add_argument('shard_dir', help="Directory holding the trace shards.")
+    parser.add_argument('--pattern', default='*.csv*', help="Glob of the shard files inside shard_dir (gzip shards are read as is).")
+    parser.add_argument('--output', default=DEFAULT_PLAN_PATH, help="Plan file to write (default: containers/plan.jsonl).")
+    parser.add_argument('--chunk-rows', type=int, default=500_000, help="Rows parsed per chunk; bounds the memory of every worker.")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Number of worker processes.")
+    parser.add_argument('--fan-in', type=int, default=64, help="Maximum number of runs merged at once.")
+    parser.add_argument('--tmp-dir', default=None, help="Directory for the sorted runs (defaults to the system temp dir).")
+    args = parser.parse_args()
+
+    shard_paths = sorted(glob.glob(os.path.join(args.shard_dir, args.pattern)))
+    if not shard_paths:
+        raise SystemExit(f"No shards matching '{args.pattern}' found in {args.shard_dir}")
+    if args.fan_in < 2:
+        raise SystemExit("--fan-in must be at least 2")
+
+    ingest(shard_paths, args.output, args.chunk_rows, args.workers, args.fan_in, args.tmp_dir)
+
+
+if __name__ == '__main__':
+    main()
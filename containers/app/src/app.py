@@ -1,6 +1,6 @@
+import bisect
 import threading
 import time
-import json
 import os
 import redis
 import sys
@@ -19,32 +19,29 @@ from communication_type.db.db_call_client import simulate_db_call
 
 from communication_type.memcached.memcached_client import redis_crud_with_logging
 
+from call_plan import PodCallPlan, find_plan_file
+
 CONTAINER_NAME = os.environ.get("CONTAINER_NAME")
 REDIS_IP = os.environ.get("REDIS_IP_ADDRESS")
 CONTAINER_JOB = os.environ.get("CONTAINER_JOB")
 NAMESPACE = os.environ.get("NAMESPACE")
 KAFKA_REPLICAS = int(os.environ.get("KAFKA_REPLICAS"))
 POD_NAME = os.environ.get("POD_NAME")
+# Prepended to every topic and consumer group, so every run of a sweep has Kafka topics of its own
+KAFKA_TOPIC_PREFIX = os.environ.get("KAFKA_TOPIC_PREFIX", "")
 
 redis_client = redis.StrictRedis(host=f'{REDIS_IP}', port=6379)
 start_time = ''
 
 
-def get_timestamp_to_call(start_time, calls_list):
+def get_timestamp_to_call(start_time, plan, position):
+    """Return the current replay time and the end of the calls that are due from position on."""
     timestamp = (time.time_ns() - start_time) // 1_000_000   # Convert to milliseconds
-    timestamps = []
-    for _ in range(0, len(calls_list)):
-        if calls_list[0] > timestamp:
-            break
-        timestamps.append(calls_list.pop(0))
-    return timestamp, timestamps
+    return timestamp, bisect.bisect_right(plan.timestamps, timestamp, position)
 
 
-def get_containers_to_call(calls, timestamps):
-    containers = []
-    for tempTimeStamp in timestamps:
-        containers.extend(calls[str(tempTimeStamp)])
-    return containers
+def get_containers_to_call(plan, position, end):
+    return [plan.call(index) for index in range(position, end)]
 
 
 async def call_containers(containers, timestamp, start_time):
@@ -52,7 +49,8 @@ async def call_containers(containers, timestamp, start_time):
     timestamp_actual = str(start_time // 1_000_000 + timestamp)
     tasks = []
 
-    for container in containers:
+    # Collapsed entries stand for `count` identical calls, fanned out here
+    for container in (container for container in containers for _ in range(container.get('count', 1))):
         dm_service = container['dm_service']
         communication_type = container['communication_type']
         json_data = {
@@ -68,7 +66,7 @@ async def call_containers(containers, timestamp, start_time):
                 case 'mc':
                     tasks.append(asyncio.create_task(redis_crud_with_logging(dm_service, NAMESPACE, json_data)))
                 case 'mq':
-                    tasks.append(asyncio.create_task(produce_kafka_messages(NAMESPACE, 'kafka-instance', 'kafka', dm_service, json_data, KAFKA_REPLICAS)))
+                    tasks.append(asyncio.create_task(produce_kafka_messages(NAMESPACE, 'kafka-instance', 'kafka', f'{KAFKA_TOPIC_PREFIX}{dm_service}', json_data, KAFKA_REPLICAS)))
                 case 'rpc':
                     tasks.append(asyncio.create_task(contact_rpc_server(json_data)))
                 case 'db':
@@ -89,9 +87,9 @@ async def call_containers(containers, timestamp, start_time):
         await asyncio.gather(*tasks)
 
 
-async def sleep_according_to_call_list(calls_list, start_time):
-    if calls_list:
-        sleep_time_sec = (calls_list[0] - (time.time_ns() - start_time) // 1_000_000) / 1_000
+async def sleep_according_to_call_list(plan, position, start_time):
+    if position < len(plan):
+        sleep_time_sec = (plan.timestamps[position] - (time.time_ns() - start_time) // 1_000_000) / 1_000
         if sleep_time_sec < 0:
             await asyncio.sleep(0.00001)
         else:
@@ -101,10 +99,9 @@ async def sleep_according_to_call_list(calls_list, start_time):
         return 'not_slept'
 
 
-async def contact_containers(calls):
-    calls_list = list(map(int, calls.keys()))
-    calls_list.sort()
-    print(calls_list, file=sys.stderr)
+async def contact_containers(plan):
+    position = 0
+    print(f"Replaying {len(plan)} calls", file=sys.stderr)
     
     while True:
         if redis_client.exists('start_time'):
@@ -114,12 +111,13 @@ async def contact_containers(calls):
         await asyncio.sleep(0.000001)
     if CONTAINER_JOB == '0':
         while True:
-            timestamp, timestamps = get_timestamp_to_call(start_time, calls_list)
-            print(timestamp, timestamps, file=sys.stderr)
-            containers = get_containers_to_call(calls, timestamps)
+            timestamp, end = get_timestamp_to_call(start_time, plan, position)
+            print(timestamp, list(plan.timestamps[position:end]), file=sys.stderr)
+            containers = get_containers_to_call(plan, position, end)
+            position = end
             if containers:
                 await call_containers(containers, timestamp, start_time)
-            if await sleep_according_to_call_list(calls_list, start_time) == 'not_slept':
+            if await sleep_according_to_call_list(plan, position, start_time) == 'not_slept':
                 break
 
     else:    
@@ -144,8 +142,9 @@ async def contact_containers(calls):
         bg_thread.start()
         
         while True:
-            timestamp, timestamps = get_timestamp_to_call(start_time, calls_list)
-            containers = get_containers_to_call(calls, timestamps)
+            timestamp, end = get_timestamp_to_call(start_time, plan, position)
+            containers = get_containers_to_call(plan, position, end)
+            position = end
             if containers:
                 # Pause the background task
                 stop_event.set()
@@ -158,22 +157,21 @@ async def contact_containers(calls):
                 bg_thread = threading.Thread(target=background_task)
                 bg_thread.start()
             
-            if await sleep_according_to_call_list(calls_list, start_time) == 'not_slept':
+            if await sleep_according_to_call_list(plan, position, start_time) == 'not_slept':
                 break
 
 
 if __name__ == "__main__":
-    # Load the contact data from a JSON file
-    kafka_process = start_kafka_consumer_process(NAMESPACE, 'kafka-instance', 'kafka', f'{CONTAINER_NAME}-group', CONTAINER_NAME, CONTAINER_NAME, KAFKA_REPLICAS)
+    # Load this pod's shard of the call plan
+    kafka_process = start_kafka_consumer_process(NAMESPACE, 'kafka-instance', 'kafka', f'{KAFKA_TOPIC_PREFIX}{CONTAINER_NAME}-group', f'{KAFKA_TOPIC_PREFIX}{CONTAINER_NAME}', CONTAINER_NAME, KAFKA_REPLICAS)
     flask_process = start_flask_process()
     grpc_process = run_grpc_server_process()
     while True:
-        print("Waiting for calls.json")
-        if os.path.exists('data/calls.json'):
-            print("calls.json found")
-            with open('data/calls.json') as f:
-                calls = json.load(f)[POD_NAME]
+        print(f"Waiting for the call plan of {POD_NAME}")
+        plan_path = find_plan_file('data', POD_NAME)
+        if plan_path:
+            print(f"{plan_path} found")
+            plan = PodCallPlan(plan_path, POD_NAME)
             break
         time.sleep(1)
-    print(calls)
-    asyncio.run(contact_containers(calls))
+    asyncio.run(contact_containers(plan))
@@ -0,0 +1,209 @@
+import gzip
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Binary call plan shared by create.py (which encodes it) and the workers (which memory-map it).
+#
+#   magic b'CPLN' | version u32 | header length u64 | JSON header | padding to 8 bytes | pod sections
+#
+# The JSON header holds the string table of destination services, the communication types and, for
+# every pod, the offset (from the end of the header padding) and number of calls of its section. A
+# section stores the pod's calls sorted by timestamp as four little-endian columns, each starting on an
+# 8 byte boundary:
+#
+#   int64 timestamps[count] | int32 destination ids[count] | uint32 multiplicities[count] | uint8 communication types[count]
+#
+# A multiplicity is the number of identical calls the entry stands for; the worker fans them out.
+#
+# create.py writes one shard per StatefulSet ordinal (calls-<pod name>.bin, holding a single pod section),
+# so a worker only maps, and only waits for, its own share of the trace.
+#
+# Shards can be stored compressed (calls-<pod name>.bin.gz or .bin.zst); the worker then decompresses its
+# shard in a streaming way into memory instead of mapping it. Shards below a size threshold stay
+# uncompressed, since opening a decompressor costs them more than the transfer it saves.
+MAGIC = b'CPLN'
+VERSION = 2
+PREAMBLE = struct.Struct('<4sIQ')
+CODECS = {'none': '', 'gzip': '.gz', 'zstd': '.zst'}
+DEFAULT_LEVELS = {'gzip': 1, 'zstd': 1}
+# zstd when the zstandard package is installed: it compresses and decompresses faster than gzip
+DEFAULT_CODEC = 'gzip' if zstandard is None else 'zstd'
+READ_SIZE = 1024 * 1024
+
+
+def plan_file_name(pod_name, codec='none'):
+    return f"calls-{pod_name}.bin{CODECS[codec]}"
+
+
+def find_plan_file(directory, pod_name):
+    """
+    Path of the pod's shard in directory, whatever its codec, or None if it is not there yet.
+    """
+    for codec in CODECS:
+        path = os.path.join(directory, plan_file_name(pod_name, codec))
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def require_zstd():
+    if zstandard is None:
+        raise RuntimeError("zstd plans need the zstandard package (pip install zstandard)")
+
+
+def compress_plan(data, codec, level=None):
+    if codec == 'none':
+        return data
+    level = DEFAULT_LEVELS[codec] if level is None else level
+    if codec == 'gzip':
+        return gzip.compress(data, compresslevel=level, mtime=0)
+    if codec == 'zstd':
+        require_zstd()
+        return zstandard.ZstdCompressor(level=level).compress(data)
+    raise ValueError(f"Unknown plan codec {codec}, expected one of {list(CODECS)}")
+
+
+def read_compressed_plan(path):
+    """
+    Decompress a .gz or .zst plan READ_SIZE bytes at a time.
+    """
+    if path.endswith(CODECS['gzip']):
+        stream = gzip.open(path, 'rb')
+    elif path.endswith(CODECS['zstd']):
+        require_zstd()
+        stream = zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+    else:
+        raise ValueError(f"{path} is not a compressed plan")
+    data = bytearray()
+    with stream:
+        while True:
+            chunk = stream.read(READ_SIZE)
+            if not chunk:
+                break
+            data += chunk
+    return data
+
+
+def align(offset, boundary=8):
+    return (offset + boundary - 1) // boundary * boundary
+
+
+def little_endian(values):
+    if sys.byteorder == 'big':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def encode_call_plan(pod_calls):
+    """
+    Encode {pod_name: {timestamp: [{dm_service, communication_type[, count]}]}} into the binary call plan.
+    """
+    strings = {}
+    types = {}
+    sections = []
+    for pod_name, calls in pod_calls.items():
+        timestamps = array('q')
+        destinations = array('i')
+        multiplicities = array('I')
+        communication_types = array('B')
+        for timestamp in sorted(calls, key=int):
+            for call in calls[timestamp]:
+                timestamps.append(int(timestamp))
+                destinations.append(strings.setdefault(call['dm_service'], len(strings)))
+                multiplicities.append(call.get('count', 1))
+                communication_types.append(types.setdefault(call['communication_type'], len(types)))
+        sections.append((pod_name, timestamps, destinations, multiplicities, communication_types))
+    if len(types) > 256:
+        raise ValueError("A call plan supports at most 256 communication types")
+
+    # Section offsets are relative to the first 8 byte boundary after the header
+    pods = {}
+    section_offset = 0
+    for pod_name, timestamps, *_ in sections:
+        count = len(timestamps)
+        pods[pod_name] = {"offset": section_offset, "count": count}
+        section_offset += align(align(count * 8) + 2 * align(count * 4) + count)
+    header = json.dumps({"strings": list(strings), "types": list(types), "pods": pods}, separators=(',', ':')).encode()
+
+    output = bytearray(PREAMBLE.pack(MAGIC, VERSION, len(header)))
+    output += header
+    output += b'\0' * (align(len(output)) - len(output))
+    for _, *columns in sections:
+        for column in columns:
+            output += little_endian(column)
+            output += b'\0' * (align(len(output)) - len(output))
+    return bytes(output)
+
+
+def compress_shard(pod_name, data, codec, level=None, min_bytes=0):
+    """
+    (file name, data) of a shard compressed with codec, or left uncompressed when smaller than min_bytes.
+    """
+    if len(data) < min_bytes:
+        codec = 'none'
+    return plan_file_name(pod_name, codec), compress_plan(data, codec, level)
+
+
+def encode_call_plan_shards(pod_calls, codec='none', level=None, min_bytes=0):
+    """
+    Encode every pod of {pod_name: calls} into its own plan, compressed with codec when it holds at least
+    min_bytes. Returns {file name: encoded plan}.
+    """
+    return dict(compress_shard(pod_name, encode_call_plan({pod_name: calls}), codec, level, min_bytes)
+                for pod_name, calls in pod_calls.items())
+
+
+class PodCallPlan:
+    """
+    The calls of one pod, backed by a read-only memory map of the plan file, or by the decompressed plan
+    for compressed files. Columns are exposed as memoryviews, so nothing is copied until calls are
+    dispatched.
+    """
+
+    def __init__(self, path, pod_name):
+        if sys.byteorder != 'little':
+            raise RuntimeError("Binary call plans can only be memory-mapped on little-endian hosts")
+        if path.endswith(tuple(extension for extension in CODECS.values() if extension)):
+            self.buffer = read_compressed_plan(path)
+        else:
+            with open(path, 'rb') as f:
+                self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, header_length = PREAMBLE.unpack_from(self.buffer, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} call plan")
+        header = json.loads(bytes(self.buffer[PREAMBLE.size:PREAMBLE.size + header_length]))
+        self.strings = header['strings']
+        self.types = header['types']
+
+        section = header['pods'].get(pod_name, {"offset": 0, "count": 0})
+        offset = align(PREAMBLE.size + header_length) + section['offset']
+        count = section['count']
+        view = memoryview(self.buffer)
+        destinations_offset = offset + align(count * 8)
+        multiplicities_offset = destinations_offset + align(count * 4)
+        types_offset = multiplicities_offset + align(count * 4)
+        self.timestamps = view[offset:offset + count * 8].cast('q')
+        self.destinations = view[destinations_offset:destinations_offset + count * 4].cast('i')
+        self.multiplicities = view[multiplicities_offset:multiplicities_offset + count * 4].cast('I')
+        self.communication_types = view[types_offset:types_offset + count].cast('B')
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def call(self, index):
+        return {
+            'dm_service': self.strings[self.destinations[index]],
+            'communication_type': self.types[self.communication_types[index]],
+            'count': self.multiplicities[index]
+        }
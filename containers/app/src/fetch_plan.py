@@ -0,0 +1,55 @@
+import hashlib
+import os
+import time
+
+import requests
+
+from call_plan import CODECS, plan_file_name
+
+# Init container of the workers: fetches this pod's plan shard from the plan server into data/, where
+# app.py waits for it. The service manifest gives the content hash of the shard, which is stored as
+# objects/<sha256>, so only the pod's own share of the trace is downloaded.
+PLAN_SERVER_URL = os.environ.get("PLAN_SERVER_URL")
+CONTAINER_NAME = os.environ.get("CONTAINER_NAME")
+POD_NAME = os.environ.get("POD_NAME")
+RETRY_DELAY = 2
+RETRIES = 150
+
+
+def get_with_retries(url):
+    for _ in range(RETRIES):
+        try:
+            response = requests.get(url, timeout=60)
+            if response.status_code == 200:
+                return response
+            print(f"GET {url} returned {response.status_code}, retrying")
+        except requests.RequestException as e:
+            print(f"GET {url} failed ({e}), retrying")
+        time.sleep(RETRY_DELAY)
+    raise RuntimeError(f"Could not fetch {url}")
+
+
+def fetch_plan(directory='data'):
+    manifest = get_with_retries(f"{PLAN_SERVER_URL}/manifests/{CONTAINER_NAME}.json").json()
+    for codec in CODECS:
+        file_name = plan_file_name(POD_NAME, codec)
+        if file_name in manifest['files']:
+            break
+    else:
+        raise RuntimeError(f"The plan manifest of {CONTAINER_NAME} has no shard for {POD_NAME}")
+
+    entry = manifest['files'][file_name]
+    data = get_with_retries(f"{PLAN_SERVER_URL}/objects/{entry['sha256']}").content
+    if hashlib.sha256(data).hexdigest() != entry['sha256']:
+        raise RuntimeError(f"{file_name} does not match its sha256 in the plan manifest")
+
+    os.makedirs(directory, exist_ok=True)
+    part_path = os.path.join(directory, f"{file_name}.part")
+    with open(part_path, 'wb') as f:
+        f.write(data)
+    os.replace(part_path, os.path.join(directory, file_name))
+    print(f"Fetched {file_name} ({len(data)} bytes)")
+
+
+if __name__ == "__main__":
+    fetch_plan()
@@ -0,0 +1,67 @@
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+BRINGUP_WORKERS = int(os.getenv("BRINGUP_WORKERS", "16"))  # Steps running against the API at the same time
+
+
+class BringUp:
+    """
+    The steps of a deployment as a dependency graph. run() starts every step as soon as the steps it
+    depends on are done, at most `workers` at a time, and stops starting new ones after a failure.
+    """
+
+    def __init__(self, workers=BRINGUP_WORKERS):
+        self.workers = workers
+        self.steps = {}
+        self.results = {}
+
+    def add(self, name, func, after=()):
+        """
+        Add the step `name`, running func() once every step of `after` is done. Returns the name, so it can
+        be used in the `after` of later steps.
+        """
+        if name in self.steps:
+            raise ValueError(f"Step '{name}' is defined twice")
+        self.steps[name] = (func, tuple(after))
+        return name
+
+    def run(self):
+        """
+        Run every step. Returns {step: result}; raises if a step failed.
+        """
+        for name, (_, after) in self.steps.items():
+            for dependency in after:
+                if dependency not in self.steps:
+                    raise ValueError(f"Step '{name}' depends on the unknown step '{dependency}'")
+
+        pending = dict(self.steps)
+        running = {}
+        failures = {}
+        start = time.time()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while pending or running:
+                if not failures:
+                    for name, (func, after) in list(pending.items()):
+                        if all(dependency in self.results for dependency in after):
+                            running[executor.submit(func)] = name
+                            del pending[name]
+                if not running:
+                    if pending and not failures:
+                        raise ValueError(f"The steps {', '.join(sorted(pending))} depend on each other")
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        self.results[name] = future.result()
+                        print(f"[bring-up {time.time() - start:7.1f}s] {name} done ({len(self.results)}/{len(self.steps)})")
+                    except Exception as e:
+                        failures[name] = e
+                        print(f"[bring-up {time.time() - start:7.1f}s] {name} failed: {e}")
+
+        if failures:
+            skipped = f", {len(pending)} steps not started" if pending else ""
+            raise RuntimeError(f"Bring-up failed in {', '.join(sorted(failures))}{skipped}") from next(iter(failures.values()))
+        return self.results
@@ -1,118 +1,112 @@
-import math
+import hashlib
 import os
 import json
 import random
 from collections import defaultdict
 from kubernetes import client, config
 from kubernetes.client import V1EnvVar, V1EnvVarSource, V1ObjectFieldSelector, V1PersistentVolumeClaimVolumeSource, V1Container, V1ObjectMeta, V1PodSpec, V1Service, V1ServiceSpec, V1ServicePort, V1StatefulSet, V1StatefulSetSpec, V1PodTemplateSpec, V1LabelSelector, V1Volume, V1ConfigMapVolumeSource, V1VolumeMount, V1SecurityContext, V1Lifecycle, V1LifecycleHandler, V1ExecAction
-from kafka_setup import deploy_kafka_environment, create_topics_http_request
-from utils import wait_for_pods_ready, port_forward_and_exec_func, get_or_create_namespace, wait_for_all_jobs_to_complete, delete_completed_jobs, wait_for_job_completion, get_docker_image_with_pre_suffix, delete_all_configmaps
+from kafka_setup import deploy_kafka_environment, create_topics_http_request, delete_topics_http_request
+from utils import wait_for_pods_ready, port_forward_and_exec_func, get_or_create_namespace, wait_for_job_completion, wait_for_statefulset_ready, wait_for_deployment_ready, get_docker_image_with_pre_suffix
 from dotenv import load_dotenv
 from redis_setup import deploy_redis_environment, set_start_time_redis
 import psycopg2
 import random
+import sys
 import time
+import zlib
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from trace_compiler import DEFAULT_PLAN_PATH, PlanCache, ServiceGraph, cache_key, index_plan, read_plan_header, rename_plan
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app', 'src'))
+from call_plan import DEFAULT_CODEC, encode_call_plan_shards
+from plan_loader import PlanLoader
+from bringup import BRINGUP_WORKERS, BringUp
+from plan_server_setup import deploy_plan_server_environment, plan_server_url, wait_for_plan_server_pod
+from manifests import ServerSideApplier
 
 
 load_dotenv()  # take environment variables from .env.
 
 dockerUsername = os.getenv("DOCKER_USERNAME")
-MAX_K8S_API_LIMIT = 512 * 1024  # 3MB limit in bytes
+SPLIT_WINDOW_MS = int(os.getenv("SPLIT_WINDOW_MS", "1000"))  # Window of the least_loaded split and of the imbalance report
+PLAN_COMPRESSION = os.getenv("PLAN_COMPRESSION", DEFAULT_CODEC)  # Codec of the plan shards on the plan server: none, gzip or zstd
+PLAN_COMPRESSION_MIN_BYTES = int(os.getenv("PLAN_COMPRESSION_MIN_BYTES", "4096"))  # Smaller shards are stored uncompressed
+PLAN_COMPRESSION_LEVEL = int(os.getenv("PLAN_COMPRESSION_LEVEL")) if os.getenv("PLAN_COMPRESSION_LEVEL") else None
+STORAGE_CLASS = os.getenv("STORAGE_CLASS", "nfs-client")
+WORKER_COMPONENT = "worker"
 
 def read_container_names(file_path):
     with open(file_path, 'r') as file:
         return json.load(file)
 
-def get_and_rename_containers(containersFile="containers.json", callsFile="calls.json"):
-    mappedContainersFile = containersFile.split(".")[0] + "_mapped.json"
-    
-    containers = read_container_names(containersFile)
-    
-    if os.path.isfile(mappedContainersFile):
+def containers_hash(containers):
+    return hashlib.sha256(json.dumps(containers, sort_keys=True).encode()).hexdigest()
+
+def get_and_rename_containers(planFile=DEFAULT_PLAN_PATH, mappedContainersFile="containers_mapped.json", mappedCallsFile="calls_mapped.jsonl"):
+    # The plan is compiled by trace_compiler (alibaba/app.py, alibaba/ingest.py, deathstarbench/processData.py)
+    containers = read_plan_header(planFile)['containers']
+
+    # The mapping is only reused when it was made for the same containers (its hash is kept next to it)
+    inputsHash = containers_hash(containers)
+    hashFile = mappedContainersFile + ".sha256"
+    mappedHash = None
+    if os.path.isfile(mappedContainersFile) and os.path.isfile(hashFile):
+        with open(hashFile) as f:
+            mappedHash = f.read().strip()
+    if mappedHash == inputsHash:
         with open(mappedContainersFile) as f:
             renamed_containers = json.load(f)
-        
-        with open(callsFile) as f:
-            calls = json.load(f)
-        
-        for um in list(calls.keys()):
-            for timestamp in calls[um]:
-                for i, dm_entry in enumerate(calls[um][timestamp]):
-                    dm_service = dm_entry['dm_service']
-                    if dm_service not in renamed_containers:
-                        print(f"Warning: {dm_service} not found in renamed_containers. Skipping.")
-                        continue
-                    calls[um][timestamp][i]['dm_service'] = renamed_containers[dm_service]["mappedName"]
-            if um in renamed_containers:
-                calls[renamed_containers[um]['mappedName']] = calls.pop(um)
-            else:
-                print(f"Warning: {um} not found in renamed_containers. Skipping.")
-        
-        with open(callsFile.split(".")[0] + "_mapped.json", "w") as f:
-            json.dump(calls, f, indent=4)
-        return renamed_containers, calls
-    
-    renamed_containers = {container['msName']: {"mappedName" : f"s{i}", "containerIndex": i, **container} for i, container in enumerate(containers, 1)}
-    
-    with open(callsFile) as f:
-        calls = json.load(f)
-    
-    for um in list(calls.keys()):
-        for timestamp in calls[um]:
-            for i, dm_entry in enumerate(calls[um][timestamp]):
-                dm_service = dm_entry['dm_service']
-                if dm_service not in renamed_containers:
-                    print(f"Warning: {dm_service} not found in renamed_containers. Skipping.")
-                    continue
-                calls[um][timestamp][i]['dm_service'] = renamed_containers[dm_service]["mappedName"]
-        if um in renamed_containers:
-            calls[renamed_containers[um]['mappedName']] = calls.pop(um)
-        else:
-            print(f"Warning: {um} not found in renamed_containers. Skipping.")
-    
-    with open(callsFile.split(".")[0] + "_mapped.json", "w") as f:
-        json.dump(calls, f, indent=4)
-    
-    with open(mappedContainersFile, 'w') as f:
-        json.dump(renamed_containers, f, indent=4)
-
-    return renamed_containers, calls
-
-def extract_remove_memcached_db_containers(renamed_containers, calls):
+    else:
+        if os.path.isfile(mappedContainersFile):
+            print(f"{mappedContainersFile} was made for other containers. Mapping them again.")
+        renamed_containers = {container['msName']: {"mappedName" : f"s{i}", "containerIndex": i, **container} for i, container in enumerate(containers, 1)}
+        with open(mappedContainersFile, 'w') as f:
+            json.dump(renamed_containers, f, indent=4)
+        with open(hashFile, 'w') as f:
+            f.write(inputsHash + "\n")
+
+    # Renamed calls are cached by the content of the plan and of the mapping, so repeat experiments on
+    # the same trace skip the renaming
+    cache = PlanCache()
+    key = cache_key([planFile, mappedContainersFile], {"artifact": "mapped"})
+    if cache.restore(key, {"calls_mapped.jsonl": mappedCallsFile}):
+        print(f"Renamed calls restored from the cache ({key[:12]}).")
+        calls = index_plan(mappedCallsFile)
+        return renamed_containers, calls, ServiceGraph.from_calls(calls)
+
+    # Rename and index the service graph in a single streaming pass; calls are read back one service
+    # at a time when needed
+    names = {name: details['mappedName'] for name, details in renamed_containers.items()}
+    graph = ServiceGraph()
+    calls = rename_plan(planFile, mappedCallsFile, names, graph)
+
+    cache.put(key, {"containers_mapped.json": mappedContainersFile, "calls_mapped.jsonl": mappedCallsFile})
+    return renamed_containers, calls, graph
+
+def extract_remove_memcached_db_containers(renamed_containers, graph):
     db_values = {}
     memcached_values = {}
 
     # Create a reverse mapping from mapped names (e.g., s1, s2) to original names (e.g., USER, MS_41019)
     reverse_mapping = {details['mappedName']: original_name for original_name, details in renamed_containers.items()}
 
-    # Iterate through the calls to filter based on the communication type
-    for um in calls:
-        for timestamp, dm_entries in calls[um].items():
-            for entry in dm_entries:
-                comm_type = entry.get('communication_type', '').strip().lower()  # Normalize the comm_type to lowercase and remove extra spaces
-                dm_service = entry['dm_service']  # This will be something like s2, s3, etc.
-
-                # Debug: print communication type and service to ensure values are correct
-                #print(f"Processing service: {dm_service}, communication_type: {comm_type}")
-
-                # Reverse lookup to find the original service name from the mapped name
-                if dm_service in reverse_mapping:
-                    original_service = reverse_mapping[dm_service]
-                    #print(f"Mapped service {dm_service} to original service {original_service}.")
-
-                    # Check if the original service is in renamed_containers and handle accordingly
-                    if original_service in renamed_containers:
-                        if comm_type == 'db':
-                            # Store the service in db_values and then remove it from renamed_containers
-                            db_values[original_service] = renamed_containers[original_service]
-                            del renamed_containers[original_service]  # Delete after storing
-                        elif comm_type == 'mc':
-                            # Store the service in memcached_values and then remove it from renamed_containers
-                            memcached_values[original_service] = renamed_containers[original_service]
-                            del renamed_containers[original_service]  # Delete after storing
-                #else:
-                    
-                    #print(f"Service {dm_service} NOT found in reverse mapping. Skipping.")
+    # The graph index knows the communication types every service is called with, in the order they
+    # first appear in the plan; the first db or mc type decides where the service goes
+    for dm_service, communication_types in graph.inbound_types.items():
+        if dm_service not in reverse_mapping:
+            continue
+        original_service = reverse_mapping[dm_service]
+        for comm_type in communication_types:
+            comm_type = comm_type.strip().lower()  # Normalize the comm_type to lowercase and remove extra spaces
+            if comm_type == 'db':
+                # Store the service in db_values and then remove it from renamed_containers
+                db_values[original_service] = renamed_containers.pop(original_service)
+                break
+            elif comm_type == 'mc':
+                # Store the service in memcached_values and then remove it from renamed_containers
+                memcached_values[original_service] = renamed_containers.pop(original_service)
+                break
 
     return db_values, memcached_values
 
@@ -131,24 +125,38 @@ def addContainerJob(containers):
             case '3':
                 print("You can enter the containers that are working in ranges like 1-5, 7-10")
                 print("1-1(includes both 1 and 1), 1-4(includes 1, 2, 3, 4)")
-                containersWorking = input("Enter the containers that are working: ").replace(" ", "").split(",")
+                containersWorking = parse_container_ranges(input("Enter the containers that are working: "))
                 print(containersWorking)
-                for i in range(len(containersWorking)):
-                    start, end = containersWorking[i].split("-")
-                    containersWorking[i] = [int(start), int(end)]
-                for container in containers:
-                    addedJob = False
-                    for workingRange in containersWorking:
-                        if workingRange[0] <= containers[container]['containerIndex'] <= workingRange[1]:
-                            addedJob = True
-                            containers[container]["containerJob"] = 1
-                            break
-                    if not addedJob:
-                        containers[container]["containerJob"] = 0
-                return containers 
+                return assign_container_jobs(containers, containersWorking)
             case _:
                 print("Invalid choice. Please try again.")
 
+def parse_container_ranges(ranges):
+    """
+    Parse container index ranges like "1-5, 7-10" (both ends included) into [[1, 5], [7, 10]].
+    """
+    containersWorking = []
+    for workingRange in ranges.replace(" ", "").split(","):
+        if workingRange:
+            start, end = workingRange.split("-")
+            containersWorking.append([int(start), int(end)])
+    return containersWorking
+
+def assign_container_jobs(containers, containersWorking):
+    """
+    Containers whose index is in one of the ranges of containersWorking are working, the others sleep.
+    """
+    for container in containers:
+        addedJob = False
+        for workingRange in containersWorking:
+            if workingRange[0] <= containers[container]['containerIndex'] <= workingRange[1]:
+                addedJob = True
+                containers[container]["containerJob"] = 1
+                break
+        if not addedJob:
+            containers[container]["containerJob"] = 0
+    return containers
+
 def create_config_map(v1, namespace, config_name, data):
     config_map = client.V1ConfigMap(
         metadata=client.V1ObjectMeta(name=config_name, namespace=namespace),
@@ -194,7 +202,7 @@ def create_logging_statefulset(apps_v1, namespace, redis_ip, storageclass):
             metadata=client.V1ObjectMeta(name="logging-data"),
             spec=client.V1PersistentVolumeClaimSpec(
                 access_modes=["ReadWriteOnce"],
-                resources=client.V1ResourceRequirements(
+                resources=client.V1VolumeResourceRequirements(
                     requests={"storage": "1Gi"}
                 ),
                 storage_class_name=storageclass
@@ -256,7 +264,7 @@ def create_db_service(v1, namespace, service_name):
 
 from kubernetes import client
 
-def create_redis_insert_job(batch_v1, namespace, job_name, service_name):
+def create_redis_insert_job(batch_v1, v1, namespace, job_name, service_name):
     """
     Creates a Kubernetes Job to insert random data into Redis.
     """
@@ -310,8 +318,7 @@ insert_random_data_into_redis("{service_name}", "{namespace}")
     )
 
     # Create the ConfigMap in the specified namespace
-    core_v1 = client.CoreV1Api()
-    core_v1.create_namespaced_config_map(namespace=namespace, body=config_map)
+    v1.create_namespaced_config_map(namespace=namespace, body=config_map)
 
     # Define the Job container to run the Python script
     container = client.V1Container(
@@ -349,7 +356,7 @@ insert_random_data_into_redis("{service_name}", "{namespace}")
     print(f"Kubernetes Job '{job_name}' created in namespace '{namespace}'.")
 
 
-def create_postgres_insert_job(batch_v1, namespace, job_name, service_name):
+def create_postgres_insert_job(batch_v1, v1, namespace, job_name, service_name):
     """
     Creates a Kubernetes Job to insert random data into PostgreSQL.
     """
@@ -358,6 +365,7 @@ def create_postgres_insert_job(batch_v1, namespace, job_name, service_name):
     python_script = f"""\
 import psycopg2
 import random
+import sys
 import time
 
 def insert_random_data_into_db(service_name, namespace):
@@ -418,8 +426,7 @@ insert_random_data_into_db("{service_name}", "{namespace}")
     )
 
     # Create the ConfigMap in the specified namespace
-    core_v1 = client.CoreV1Api()
-    core_v1.create_namespaced_config_map(namespace=namespace, body=config_map)
+    v1.create_namespaced_config_map(namespace=namespace, body=config_map)
 
     # Define the Job container to run the Python script
     container = client.V1Container(
@@ -468,30 +475,12 @@ def create_headless_service(v1, namespace, service_name):
     v1.create_namespaced_service(namespace=namespace, body=service)
     print(f"Headless service '{service_name}' created.")
 
-def calculate_storage_size(data_str):
-    # Calculate the size of the JSON data in bytes
-    data_length = len(data_str)
-    
-    # Convert bytes to MiB (1 MiB = 1024 * 1024 bytes)
-    size_in_mib = math.ceil(data_length / (1024 * 1024))
-    
-    # Convert to GiB if needed (optional, but usually MiB is fine for most uses)
-    # size_in_gib = math.ceil(size_in_mib / 1024)
-    
-    # Choose to use GiB or MiB based on your requirements
-    # For simplicity, we'll use MiB here
-    return f"{size_in_mib + 100}Mi"
-
-def create_pvc(v1, namespace, pvc_name, storage_class, access_mode=["ReadOnlyMany"], data_str=None):
-    size="1Gi"
-    if data_str:
-        size = calculate_storage_size(data_str)
-
+def create_pvc(v1, namespace, pvc_name, storage_class, access_mode=["ReadOnlyMany"], size="1Gi"):
     pvc = client.V1PersistentVolumeClaim(
         metadata=client.V1ObjectMeta(name=pvc_name, namespace=namespace),
         spec=client.V1PersistentVolumeClaimSpec(
             access_modes=access_mode,
-            resources=client.V1ResourceRequirements(
+            resources=client.V1VolumeResourceRequirements(
                 requests={'storage': size}
             ),
             storage_class_name=storage_class
@@ -501,118 +490,6 @@ def create_pvc(v1, namespace, pvc_name, storage_class, access_mode=["ReadOnlyMan
     v1.create_namespaced_persistent_volume_claim(namespace=namespace, body=pvc)
     print(f"PersistentVolumeClaim '{pvc_name}' created in namespace '{namespace}'.")
 
-def split_data(data_str, chunk_size=MAX_K8S_API_LIMIT):
-    """
-    Splits the data_str into chunks of chunk_size (3MB by default).
-    """
-    return [data_str[i:i + chunk_size] for i in range(0, len(data_str), chunk_size)]
-
-def chunk_terminator_next(index):
-    """
-    Add a unique terminator to the end of each chunk to ensure that the chunks are processed in order.
-    """
-    return f"&&__NEXT_CHUNK_{index}__&&"
-
-def create_job_with_chunk(batch_v1, namespace, job_name, pvc_name, chunk, chunk_index, isLastChunk, check_value=None):
-    """
-    Create a single Kubernetes Job to write a chunk of data to the PVC.
-    Continuously check the file's last N characters, where N is the length of `check_value`,
-    waiting until `check_value` is present before deleting those characters and writing the chunk.
-    """
-    chunk_job_name = f"{job_name}-{chunk_index}"
-
-    # Get the length of the check_value
-    check_value_length = len(check_value) + 1 if check_value else 0
-
-    # Create a script with the necessary commands
-    script_commands = []
-    if check_value:
-        script_commands.append(f'while [ "$(tail -c {check_value_length} /data/calls.json)" != "{check_value}" ]; do sleep 1; done;')
-        script_commands.append(r"sed -i '$ s/.\{" + str(check_value_length - 1) + r"\}$//' /data/calls.json")
-    
-    if not isLastChunk:
-        chunk += chunk_terminator_next(chunk_index + 1)
-    
-    script_commands.append(f'echo "{chunk}" >> /data/calls.json')
-
-    script_content = '\n'.join(script_commands)
-
-    # Create the ConfigMap with the script
-    config_map = client.V1ConfigMap(
-        metadata=client.V1ObjectMeta(name=f'{chunk_job_name}-script', namespace=namespace),
-        data={'script.sh': script_content}
-    )
-
-    # Apply the ConfigMap
-    core_v1 = client.CoreV1Api()
-    core_v1.create_namespaced_config_map(namespace=namespace, body=config_map)
-
-    # Create the job definition
-    job = client.V1Job(
-        metadata=client.V1ObjectMeta(name=chunk_job_name, namespace=namespace),
-        spec=client.V1JobSpec(
-            template=client.V1PodTemplateSpec(
-                spec=client.V1PodSpec(
-                    containers=[
-                        client.V1Container(
-                            name='populate-container',
-                            image='busybox',
-                            command=['sh', '/scripts/script.sh'],
-                            volume_mounts=[
-                                client.V1VolumeMount(
-                                    mount_path='/scripts',
-                                    name='script-volume'
-                                ),
-                                client.V1VolumeMount(
-                                    mount_path='/data',
-                                    name='my-pvc'
-                                )
-                            ]
-                        )
-                    ],
-                    restart_policy='Never',
-                    volumes=[
-                        client.V1Volume(
-                            name='script-volume',
-                            config_map=client.V1ConfigMapVolumeSource(
-                                name=f'{chunk_job_name}-script'
-                            )
-                        ),
-                        client.V1Volume(
-                            name='my-pvc',
-                            persistent_volume_claim=client.V1PersistentVolumeClaimVolumeSource(
-                                claim_name=pvc_name
-                            )
-                        )
-                    ]
-                )
-            ),
-            backoff_limit=0
-        )
-    )
-
-    # Create the job in Kubernetes
-    batch_v1.create_namespaced_job(namespace=namespace, body=job)
-    print(f"Job '{chunk_job_name}' created in namespace '{namespace}' to write chunk {chunk_index} after check_value is found and deleted in PVC '{pvc_name}'.")
-
-
-
-def create_jobs_with_data(batch_v1, namespace, job_name, pvc_name, data_str):
-    """
-    Split data_str into chunks and create multiple jobs, each handling one chunk.
-    """
-    # Split the data into chunks within the Kubernetes API limit
-    data_chunks = split_data(data_str)
-    chunks_numbers = len(data_chunks)
-    create_job_with_chunk(batch_v1, namespace, job_name, pvc_name, data_chunks[0], 0, 1 == chunks_numbers)
-
-    # Create a job for each chunk and wait for its completion before proceeding to the next
-    if chunks_numbers > 1:
-        for chunk_index, chunk in enumerate(data_chunks[1:], 1):
-            create_job_with_chunk(batch_v1, namespace, job_name, pvc_name, chunk, chunk_index, chunk_index + 1 == chunks_numbers, check_value=chunk_terminator_next(chunk_index))
-
-    print(f"Total {chunks_numbers} jobs created to handle the data.")
-
 def create_db_headless_service(v1, namespace, container_name):
     service = V1Service(
         metadata=V1ObjectMeta(name=f"{container_name}-headless-service", namespace=namespace, labels={"app": container_name}),
@@ -884,7 +761,8 @@ def create_redis_statefulset(apps_v1, namespace, container_name, pvc_name, repli
     apps_v1.create_namespaced_stateful_set(namespace=namespace, body=replica_stateful_set)
     print(f"Replica Redis StatefulSet '{container_name}-replica' created in namespace '{namespace}' with {replicas} replicas.")
 
-def create_container_statefulset(apps_v1, namespace, container_name, pvc_name, kafka_replicas, redis_ip, container_job, replicas=1):
+def create_container_statefulset(apps_v1, namespace, container_name, plan_server_url, kafka_replicas, redis_ip, container_job, replicas=1, topic_prefix=""):
+    pod_name_env = V1EnvVar(name="POD_NAME", value_from=V1EnvVarSource(field_ref=V1ObjectFieldSelector(field_path="metadata.name")))
     container = V1Container(
         name=container_name,
         image=get_docker_image_with_pre_suffix("flask-contact-container"),
@@ -894,31 +772,44 @@ def create_container_statefulset(apps_v1, namespace, container_name, pvc_name, k
             V1EnvVar(name="CONTAINER_JOB", value=str(container_job)),
             V1EnvVar(name="NAMESPACE", value=namespace),
             V1EnvVar(name="KAFKA_REPLICAS", value=str(kafka_replicas)),
-            V1EnvVar(name="POD_NAME", value_from=V1EnvVarSource(field_ref=V1ObjectFieldSelector(field_path="metadata.name"))),
+            V1EnvVar(name="KAFKA_TOPIC_PREFIX", value=topic_prefix),
+            pod_name_env,
         ],
         volume_mounts=[V1VolumeMount(mount_path="/app/data", name="data-volume")],
         image_pull_policy="Always"
     )
 
-    volume = V1Volume(
-        name="data-volume",
-        persistent_volume_claim=V1PersistentVolumeClaimVolumeSource(claim_name=pvc_name)
+    # The init container fetches this pod's plan shard from the plan server before the worker starts
+    fetch_plan_container = V1Container(
+        name="fetch-plan",
+        image=get_docker_image_with_pre_suffix("flask-contact-container"),
+        command=["python", "fetch_plan.py"],
+        env=[
+            V1EnvVar(name="CONTAINER_NAME", value=container_name),
+            V1EnvVar(name="PLAN_SERVER_URL", value=plan_server_url),
+            pod_name_env,
+        ],
+        volume_mounts=[V1VolumeMount(mount_path="/app/data", name="data-volume")],
+        image_pull_policy="Always"
     )
 
-    pod_spec = V1PodSpec(containers=[container], volumes=[volume])
-    template = V1PodTemplateSpec(metadata=V1ObjectMeta(labels={"app": container_name}), spec=pod_spec)
+    volume = V1Volume(name="data-volume", empty_dir=client.V1EmptyDirVolumeSource())
+
+    pod_spec = V1PodSpec(init_containers=[fetch_plan_container], containers=[container], volumes=[volume])
+    # Workers are labelled apart from the shared services, so a sweep can replace all of them at once
+    template = V1PodTemplateSpec(metadata=V1ObjectMeta(labels={"app": container_name, "component": WORKER_COMPONENT}), spec=pod_spec)
 
     stateful_set_spec = V1StatefulSetSpec(
         service_name=f"{container_name}-service",
         replicas=replicas,
         selector=V1LabelSelector(match_labels={"app": container_name}),
         template=template,
-        pod_management_policy="OrderedReady",
+        pod_management_policy="Parallel",
         update_strategy=client.V1StatefulSetUpdateStrategy(type="RollingUpdate")
     )
 
     stateful_set = V1StatefulSet(
-        metadata=V1ObjectMeta(name=f"{container_name}-statefulset", namespace=namespace),
+        metadata=V1ObjectMeta(name=f"{container_name}-statefulset", namespace=namespace, labels={"component": WORKER_COMPONENT}),
         spec=stateful_set_spec
     )
     
@@ -952,147 +843,264 @@ def split_calls_to_replicas(data, replicas, mappedName, choice):
 
     # Convert data into a list of calls, each with a timestamp
     calls = [(t, call) for t, calls_list in data.items() for call in calls_list]
+
+    # A collapsed call stands for `count` identical calls; they are assigned one by one, and the calls a
+    # replica gets from one entry are collapsed again into a single entry
+    def add_calls(statefulset_index, timestamp, call, count):
+        entry = {"dm_service": call["dm_service"], "communication_type": call["communication_type"]}
+        if count > 1:
+            entry["count"] = count
+        result[f"{mappedName}-statefulset-{statefulset_index}"][timestamp].append(entry)
     
     if choice == "1":
         # Distribute calls in a round-robin fashion
-        for idx, (timestamp, call) in enumerate(calls):
-            statefulset_index = idx % replicas
-            result[f"{mappedName}-statefulset-{statefulset_index}"][timestamp].append(call)
+        idx = 0
+        for timestamp, call in calls:
+            count = call.get("count", 1)
+            for offset in range(min(count, replicas)):
+                add_calls((idx + offset) % replicas, timestamp, call, count // replicas + (offset < count % replicas))
+            idx += count
     
     elif choice == "0":
         # Distribute calls randomly
         for timestamp, call in calls:
-            statefulset_index = random.randint(0, replicas - 1)
-            result[f"{mappedName}-statefulset-{statefulset_index}"][timestamp].append(call)
+            counts = defaultdict(int)
+            for _ in range(call.get("count", 1)):
+                counts[random.randint(0, replicas - 1)] += 1
+            for statefulset_index, count in counts.items():
+                add_calls(statefulset_index, timestamp, call, count)
+    
+    elif choice == "2":
+        # Time-windowed least-loaded: every call goes to the replica with the fewest calls in the current
+        # window (ties go to the replica with the fewest calls overall), which evens out the peak rates
+        window_loads = [0] * replicas
+        total_loads = [0] * replicas
+        current_window = None
+        for timestamp, call in sorted(calls, key=lambda timestamp_call: int(timestamp_call[0])):
+            window = int(timestamp) // SPLIT_WINDOW_MS
+            if window != current_window:
+                window_loads = [0] * replicas
+                current_window = window
+            counts = defaultdict(int)
+            for _ in range(call.get("count", 1)):
+                statefulset_index = min(range(replicas), key=lambda i: (window_loads[i], total_loads[i]))
+                window_loads[statefulset_index] += 1
+                total_loads[statefulset_index] += 1
+                counts[statefulset_index] += 1
+            for statefulset_index, count in counts.items():
+                add_calls(statefulset_index, timestamp, call, count)
+    
+    elif choice == "3":
+        # Trace-ID affinity: all the calls of a trace go to the same replica. Plans compiled without trace
+        # IDs (python -m trace_compiler ... --keep-trace-ids) fall back to round robin per call
+        idx = 0
+        for timestamp, call in calls:
+            count = call.get("count", 1)
+            if call.get("traceid") is not None:
+                add_calls(zlib.crc32(str(call["traceid"]).encode()) % replicas, timestamp, call, count)
+            else:
+                for offset in range(min(count, replicas)):
+                    add_calls((idx + offset) % replicas, timestamp, call, count // replicas + (offset < count % replicas))
+                idx += count
     
     else:
-        raise ValueError("Invalid choice. Please select 'random' or 'round_robin'.")
+        raise ValueError("Invalid choice. Please select 'random', 'round_robin', 'least_loaded' or 'trace_affinity'.")
     
     return result
 
+def replica_peak_rates(result, window_ms=SPLIT_WINDOW_MS):
+    """
+    Peak number of calls every replica makes in one window of window_ms.
+    """
+    peaks = {}
+    for pod_name, pod_calls in result.items():
+        windows = defaultdict(int)
+        for timestamp, entries in pod_calls.items():
+            windows[int(timestamp) // window_ms] += sum(entry.get("count", 1) for entry in entries)
+        peaks[pod_name] = max(windows.values(), default=0)
+    return peaks
+
+def report_split_imbalance(mappedName, result):
+    """
+    Print the per-replica peak rates of a split and their imbalance (highest peak over mean peak; 1.0 is
+    perfectly even). Returns the imbalance.
+    """
+    peaks = replica_peak_rates(result)
+    mean_peak = sum(peaks.values()) / len(peaks) if peaks else 0
+    imbalance = max(peaks.values()) / mean_peak if mean_peak else 1.0
+    print(f"{mappedName}: peak calls per {SPLIT_WINDOW_MS}ms by replica {list(peaks.values())}, imbalance {imbalance:.2f}")
+    return imbalance
+
+def run_insert_job(batch_v1, v1, namespace, job_name, create_job, service_name):
+    """
+    Run one data insert job to completion, then delete it with its script ConfigMap.
+    """
+    create_job(batch_v1, v1, namespace, job_name, service_name)
+    wait_for_job_completion(batch_v1, namespace, job_name)
+    v1.delete_namespaced_config_map(name=f"{job_name}-script", namespace=namespace)
+    batch_v1.delete_namespaced_job(name=job_name, namespace=namespace, body=client.V1DeleteOptions(propagation_policy='Foreground'))
+
+def create_memcached(v1, apps_v1, namespace, storage_class, container_keys):
+    memcached_mappedName = container_keys['mappedName']
+    replicas = container_keys.get('replicas', 1)
+
+    # Step 1: Create headless service for the Redis container (for replication)
+    create_memcached_service(v1, namespace, memcached_mappedName)
+    create_container_service(v1, namespace, memcached_mappedName, [{ "port": 6379, "target_port": 6379, 'name': 'redis-port' }])
+
+    # Step 2: Create Redis StatefulSet with replication support
+    pvc_name = f"{memcached_mappedName}-pvc"
+    create_pvc(v1, namespace, pvc_name, storage_class, access_mode=["ReadWriteOnce"])
+    create_redis_statefulset(apps_v1, namespace, memcached_mappedName, pvc_name, replicas=replicas)
+
+def deploy_memcached(v1, apps_v1, batch_v1, namespace, storage_class, container_keys):
+    memcached_mappedName = container_keys['mappedName']
+    create_memcached(v1, apps_v1, namespace, storage_class, container_keys)
+
+    # Step 3: Fill the master with data
+    wait_for_statefulset_ready(apps_v1, namespace, f"{memcached_mappedName}-master")
+    run_insert_job(batch_v1, v1, namespace, f"{memcached_mappedName}-insert-job", create_redis_insert_job, memcached_mappedName)
+
+def create_db(v1, apps_v1, namespace, storage_class, container_keys):
+    db_mappedName = container_keys['mappedName']
+    replicas = container_keys.get('replicas', 1)
+
+    # Step 1: Create headless service for PostgreSQL container (for replication)
+    create_db_headless_service(v1, namespace, db_mappedName)
+    create_container_service(v1, namespace, db_mappedName, [{ "port": 5432, "target_port": 5432, 'name': 'postgresql' }])
+
+    # Step 2: Create PostgreSQL StatefulSet with replication support
+    pvc_name = f"{db_mappedName}-pvc"
+    create_pvc(v1, namespace, pvc_name, storage_class, access_mode=["ReadWriteOnce"])
+    create_postgres_statefulset(apps_v1, namespace, db_mappedName, pvc_name, replicas=replicas)
+
+def deploy_db(v1, apps_v1, batch_v1, namespace, storage_class, container_keys):
+    db_mappedName = container_keys['mappedName']
+    create_db(v1, apps_v1, namespace, storage_class, container_keys)
+
+    # Step 3: Fill the primary with data
+    wait_for_statefulset_ready(apps_v1, namespace, f"{db_mappedName}-primary")
+    run_insert_job(batch_v1, v1, namespace, f"{db_mappedName}-insert-job", create_postgres_insert_job, db_mappedName)
+
+def create_logging(v1, apps_v1, namespace, redis_ip, storage_class):
+    create_logging_statefulset(apps_v1, namespace, redis_ip, storage_class)
+    create_logging_service(v1, namespace)
+
+def create_container(v1, apps_v1, namespace, containerKeys, kafka_replicas, redis_ip, topic_prefix=""):
+    mappedName = containerKeys['mappedName']
+    # Create services for each container
+    create_container_service(v1, namespace, mappedName, [{ "port": 80, "target_port": 80, 'name': 'flask-service' }, { "port": 50051, "target_port": 50051, "name": 'grpc-service' }])
+    # Use apps_v1 for creating StatefulSets
+    create_container_statefulset(apps_v1, namespace, mappedName, plan_server_url(namespace), kafka_replicas, redis_ip=redis_ip, container_job=containerKeys['containerJob'], replicas=containerKeys['replicas'], topic_prefix=topic_prefix)
+
+def load_plans(v1, namespace, renamed_containers, calls, graph, choice):
+    # Plans are streamed onto the plan server in the background while the next ones are split
+    plan_loader = PlanLoader(v1, namespace, wait_for_plan_server_pod(v1, namespace))
+    for container in renamed_containers:
+        containerKeys = renamed_containers[container]
+        mappedName = containerKeys['mappedName']
+        replicas = containerKeys['replicas']
+
+        # Services that make no calls get an empty plan without reading the calls back
+        serviceCalls = calls.get(mappedName, {}) if graph.outbound.get(mappedName) else {}
+        split = split_calls_to_replicas(serviceCalls, replicas, mappedName, choice)
+        report_split_imbalance(mappedName, split)
+        # One compressed plan shard per replica, so every pod only reads its own calls
+        data = encode_call_plan_shards(split, PLAN_COMPRESSION, PLAN_COMPRESSION_LEVEL, PLAN_COMPRESSION_MIN_BYTES)
+
+        # Load the plan of other containers onto the plan server
+        plan_loader.submit(mappedName, data)
+    return plan_loader.wait()
+
+def deploy_kafka(namespace, v1, apps_v1, rbac_v1, kafka_external_gateway_nodeport, kafka_replicas, gateway_replicas):
+    kafka_environment = deploy_kafka_environment(namespace, v1, apps_v1, rbac_v1, kafka_external_gateway_nodeport, kafka_replicas, gateway_replicas)
+    # Topics are created through the gateway, once the brokers are up
+    wait_for_statefulset_ready(apps_v1, namespace, kafka_environment[1])
+    wait_for_deployment_ready(apps_v1, namespace, "kafka-external-gateway")
+    return kafka_environment
+
+def create_topics(namespace, kafka_environment, renamed_containers, kafka_external_gateway_nodeport, node_ip, topic_prefix=""):
+    (kafka_replicas, kafka_statefulset_name, kafka_headless_service_name, kakfa_gateway_service_name) = kafka_environment
+    topics = [{ "name": f"{topic_prefix}{containerKeys['mappedName']}", "partitions": 1, "replication_factor": kafka_replicas } for containerKeys in renamed_containers.values()]
+    create_topics_http_request(topics, namespace, kafka_statefulset_name, kakfa_gateway_service_name, kafka_headless_service_name, kafka_external_gateway_nodeport, node_ip)
+
+def delete_topics(namespace, kafka_environment, topic_prefix, kafka_external_gateway_nodeport, node_ip):
+    (kafka_replicas, kafka_statefulset_name, kafka_headless_service_name, kakfa_gateway_service_name) = kafka_environment
+    delete_topics_http_request(topic_prefix, namespace, kafka_statefulset_name, kakfa_gateway_service_name, kafka_headless_service_name, kafka_external_gateway_nodeport, node_ip)
+
+def deploy_redis(namespace, v1, apps_v1):
+    deploy_redis_environment(namespace, v1, apps_v1)
+    wait_for_deployment_ready(apps_v1, namespace, "redis-deployment")
+    return 'redis-service'
+
 def main():
     NAMESPACE = os.getenv("KUBERNETES_NAMESPACE", "static-application")
     KAFKA_EXTERNAL_GATEWAY_NODEPORT = int(os.getenv("KAFKA_EXTERNAL_GATEWAY_NODEPORT", "32092"))
     NODE_IP = os.getenv("NODE_IP", "localhost")
-    STORAGE_CLASS = "nfs-client"
     config.load_kube_config()
+    # Bring-up steps share the API client, so give it one connection per concurrent step
+    configuration = client.Configuration.get_default_copy()
+    configuration.connection_pool_maxsize = BRINGUP_WORKERS
+    client.Configuration.set_default(configuration)
 
-    v1 = client.CoreV1Api()
-    apps_v1 = client.AppsV1Api()  # Correct API object for StatefulSets
-    rbac_v1 = client.RbacAuthorizationV1Api()
-    batch_v1 = client.BatchV1Api()
-
-    get_or_create_namespace(NAMESPACE)
+    # Objects are server-side applied, so running this again updates the experiment instead of failing
+    applier = ServerSideApplier()
+    v1 = applier.api(client.CoreV1Api())
+    apps_v1 = applier.api(client.AppsV1Api())  # Correct API object for StatefulSets
+    rbac_v1 = applier.api(client.RbacAuthorizationV1Api())
+    batch_v1 = applier.api(client.BatchV1Api())
 
-    # Deploy Kafka and get kafka_replicas
-    (kafka_replicas, kafka_statefulset_name, kafka_headless_service_name, kakfa_gateway_service_name) = deploy_kafka_environment(NAMESPACE, v1, apps_v1, rbac_v1, KAFKA_EXTERNAL_GATEWAY_NODEPORT)
+    get_or_create_namespace(v1, NAMESPACE)
 
-    renamed_containers, calls = get_and_rename_containers()
-
-    # Deploy Redis and get redis_ip
-    deploy_redis_environment(NAMESPACE, v1, apps_v1)
-    redis_service_name = 'redis-service'
-    wait_for_pods_ready(NAMESPACE)
-
-    # Call logging service setup (after Redis is ready)
-    print(redis_service_name)
-    create_logging_statefulset(apps_v1, NAMESPACE, redis_service_name, STORAGE_CLASS)
-    create_logging_service(v1, NAMESPACE)
+    # Get containers and calls data, and ask every question before the bring-up starts
+    renamed_containers, calls, graph = get_and_rename_containers()
+    db_values, memcached_values = extract_remove_memcached_db_containers(renamed_containers, graph)
 
-    # Get containers and calls data
-    db_values, memcached_values = extract_remove_memcached_db_containers(renamed_containers, calls)
-    
     # Random or round robin choice
-    choice = input("Do you want random assignment of calls between instance IDs or round robin assignment?\n (Enter 0 for 'random' or 1 for 'round_robin'): ").strip().lower()
-
-    # Define topics for Kafka (includes DB containers)
-    topics = []
-
-    # Handle other containers
-    for container in renamed_containers:
-        containerKeys = renamed_containers[container]
-        mappedName = containerKeys['mappedName']
-        replicas = containerKeys['replicas']
-        topics.append({ "name": mappedName, "partitions": 1, "replication_factor": kafka_replicas })
+    choice = input("How should calls be assigned between instance IDs?\n (Enter 0 for 'random', 1 for 'round_robin', 2 for 'least_loaded' per time window or 3 for 'trace_affinity'): ").strip().lower()
 
-        pvc_name = f"{mappedName}-pvc"
-        job_name = f"{mappedName}-job"
-        data = split_calls_to_replicas(calls.get(mappedName, {}), replicas, mappedName, choice)
-        data_str = json.dumps(data).replace('"', '\\"')
+    # Assign container jobs
+    renamed_containers = addContainerJob(renamed_containers)
 
-        # Create PVC and Jobs for other containers
-        create_pvc(v1, NAMESPACE, pvc_name, STORAGE_CLASS, data_str=data_str)
-        create_jobs_with_data(batch_v1, NAMESPACE, job_name, pvc_name, data_str)
+    kafka_replicas = int(input("Enter the number of Kafka replicas: "))
+    gateway_replicas = int(input("Enter the number of Kafka External Gateway replicas: "))
 
-    # Handle DB containers differently
-    for service_name, container_keys in memcached_values.items():
-        memcached_mappedName = container_keys['mappedName']
-        replicas = container_keys.get('replicas', 1)
+    # Bring-up as a dependency graph: independent steps run at the same time
+    bringup = BringUp()
+    kafka = bringup.add("kafka", lambda: deploy_kafka(NAMESPACE, v1, apps_v1, rbac_v1, KAFKA_EXTERNAL_GATEWAY_NODEPORT, kafka_replicas, gateway_replicas))
+    redis = bringup.add("redis", lambda: deploy_redis(NAMESPACE, v1, apps_v1))
+    plan_server = bringup.add("plan-server", lambda: deploy_plan_server_environment(NAMESPACE, v1, apps_v1, STORAGE_CLASS))
 
-        # Step 1: Create headless service for PostgreSQL container (for replication)
-        create_memcached_service(v1, NAMESPACE, memcached_mappedName)
-        create_container_service(v1, NAMESPACE, memcached_mappedName, [{ "port": 6379, "target_port": 6379, 'name': 'redis-port' }])
+    # Call logging service setup (after Redis is ready)
+    bringup.add("logging", lambda: create_logging(v1, apps_v1, NAMESPACE, bringup.results[redis], STORAGE_CLASS), after=[redis])
 
-        # # Step 2: Create PostgreSQL StatefulSet with replication support
-        pvc_name = f"{memcached_mappedName}-pvc"
-        create_pvc(v1, NAMESPACE, pvc_name, STORAGE_CLASS, access_mode=["ReadWriteOnce"])
-        create_redis_statefulset(apps_v1, NAMESPACE, memcached_mappedName, pvc_name, replicas=replicas)
+    plans = bringup.add("plans", lambda: load_plans(v1, NAMESPACE, renamed_containers, calls, graph, choice), after=[plan_server])
 
     # Handle DB containers differently
-    for service_name, container_keys in db_values.items():
-        db_mappedName = container_keys['mappedName']
-        replicas = container_keys.get('replicas', 1)
-
-        # Step 1: Create headless service for PostgreSQL container (for replication)
-        create_db_headless_service(v1, NAMESPACE, db_mappedName)
-        create_container_service(v1, NAMESPACE, db_mappedName, [{ "port": 5432, "target_port": 5432, 'name': 'postgresql' }])
-
-        # Step 2: Create PostgreSQL StatefulSet with replication support
-        pvc_name = f"{db_mappedName}-pvc"
-        create_pvc(v1, NAMESPACE, pvc_name, STORAGE_CLASS, access_mode=["ReadWriteOnce"])
-        create_postgres_statefulset(apps_v1, NAMESPACE, db_mappedName, pvc_name, replicas=replicas)
-    wait_for_all_jobs_to_complete(batch_v1, NAMESPACE)
-    delete_all_configmaps(v1, NAMESPACE)
-    delete_completed_jobs(batch_v1, v1, NAMESPACE)
-    wait_for_pods_ready(NAMESPACE)
-
     for service_name, container_keys in memcached_values.items():
-        db_mappedName = container_keys['mappedName']
-        create_redis_insert_job(batch_v1, NAMESPACE, f"{db_mappedName}-insert-job", db_mappedName)
-
+        bringup.add(f"memcached {container_keys['mappedName']}", lambda container_keys=container_keys: deploy_memcached(v1, apps_v1, batch_v1, NAMESPACE, STORAGE_CLASS, container_keys))
     for service_name, container_keys in db_values.items():
-        db_mappedName = container_keys['mappedName']
-        create_postgres_insert_job(batch_v1, NAMESPACE, f"{db_mappedName}-insert-job", db_mappedName)
-    wait_for_all_jobs_to_complete(batch_v1, NAMESPACE)
-    delete_all_configmaps(v1, NAMESPACE)
-    delete_completed_jobs(batch_v1, v1, NAMESPACE)
-    
-    create_topics_http_request(topics, NAMESPACE, kafka_statefulset_name, kakfa_gateway_service_name, kafka_headless_service_name, KAFKA_EXTERNAL_GATEWAY_NODEPORT, NODE_IP)
+        bringup.add(f"db {container_keys['mappedName']}", lambda container_keys=container_keys: deploy_db(v1, apps_v1, batch_v1, NAMESPACE, STORAGE_CLASS, container_keys))
 
-    # Assign container jobs
-    renamed_containers = addContainerJob(renamed_containers)
+    # Define topics for Kafka
+    topics = bringup.add("topics", lambda: create_topics(NAMESPACE, bringup.results[kafka], renamed_containers, KAFKA_EXTERNAL_GATEWAY_NODEPORT, NODE_IP), after=[kafka])
 
-    # Handle non-DB containers
+    # Handle non-DB containers: their init containers fetch the loaded plans and they consume the topics
     for container_name in renamed_containers:
         containerKeys = renamed_containers[container_name]
-        mappedName = containerKeys['mappedName']
-        containerJob = containerKeys['containerJob']
-        replicas = containerKeys['replicas']
-
-        # Create services for each container
-        create_container_service(v1, NAMESPACE, mappedName, [{ "port": 80, "target_port": 80, 'name': 'flask-service' }, { "port": 50051, "target_port": 50051, "name": 'grpc-service' }])
 
-        pvc_name = f"{mappedName}-pvc"
-        # Use apps_v1 for creating StatefulSets
-        create_container_statefulset(apps_v1, NAMESPACE, mappedName, pvc_name, kafka_replicas, redis_ip=redis_service_name, container_job=containerJob, replicas=replicas)
+        def deploy_container(containerKeys=containerKeys):
+            create_container(v1, apps_v1, NAMESPACE, containerKeys, bringup.results[kafka][0], bringup.results[redis])
+        bringup.add(f"container {containerKeys['mappedName']}", deploy_container, after=[plans, topics, redis])
 
+    bringup.run()
 
     # Wait for all StatefulSets to be ready (including DB StatefulSets)
-    wait_for_pods_ready(NAMESPACE)
+    wait_for_pods_ready(v1, apps_v1, NAMESPACE)
 
     print("All statefulsets, deployments, and services are up in Kubernetes.")
-    port_forward_and_exec_func(NAMESPACE, redis_service_name, 60892, 6379, funcToExec=set_start_time_redis)
+    port_forward_and_exec_func(NAMESPACE, bringup.results[redis], 60892, 6379, funcToExec=set_start_time_redis)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -6,6 +6,9 @@ from dotenv import load_dotenv
 import sys
 import time
 
+from plan_server_setup import PLAN_SERVER_PVC
+from utils import WatchCache
+
 load_dotenv()  # Load environment variables from .env.
 
 # Load Kubernetes configuration (either incluster or kubeconfig)
@@ -90,26 +93,24 @@ async def ensure_namespace_deleted(namespace):
     await delete_remaining_pods(namespace)
 
 def check_active_pods(namespace):
-    """Check if there are any active pods in the namespace."""
+    """Wait until every pod in the namespace is gone."""
     try:
-        # List all pods in the specified namespace
-        while True:
-            active_pods = v1.list_namespaced_pod(namespace=namespace).items
-            if active_pods:
-                print("Waiting for pods to terminate")
-                time.sleep(2)
-            else:
-                break
+        # Every pod lags until its deletion is seen
+        WatchCache(v1.list_namespaced_pod, namespace).wait_until(lambda pod: False, "pods to terminate")
     except ApiException as e:
         print(f"Failed to check active pods: {e}", file=sys.stderr)
         return False
 
-async def delete_pvc(namespace):
+async def delete_pvc(namespace, delete_plans=False):
     """Delete PVCs in the namespace after ensuring all pods are terminated."""
     try:
         # List all PVCs in the namespace
         pvcs = v1.list_namespaced_persistent_volume_claim(namespace).items
         for pvc in pvcs:
+            # The plan server keeps its stored plans for the next deployment unless asked otherwise
+            if pvc.metadata.name == PLAN_SERVER_PVC and not delete_plans:
+                print(f"Keeping {PLAN_SERVER_PVC} (run with --delete-plans to delete the stored plans)")
+                continue
             await delete_resource(v1, v1.delete_namespaced_persistent_volume_claim, 'pvc', pvc.metadata.name, namespace)
     except ApiException as e:
         print(f"Failed to delete PVCs: {e}", file=sys.stderr)
@@ -124,4 +125,4 @@ if __name__ == '__main__':
     check_active_pods(namespace)
 
     # Delete PVCs after ensuring all pods are terminated
-    asyncio.run(delete_pvc(namespace))
+    asyncio.run(delete_pvc(namespace, delete_plans='--delete-plans' in sys.argv))
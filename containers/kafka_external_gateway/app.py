@@ -131,6 +131,34 @@ def create_topics():
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
+@app.route('/delete_topics', methods=['POST'])
+def delete_topics():
+    """Delete every Kafka topic whose name starts with the prefix of the request payload."""
+    data = request.json
+    prefix = data.get('prefix')
+    namespace = data.get('namespace', 'default')
+    kafka_statefulset_name = data.get('kafka_statefulset_name', 'kafka-instance')
+    kafka_service_name = data.get('kafka_service_name', 'kafka')
+    timeout = data.get('timeout', 60)
+
+    if not prefix:
+        return jsonify({'status': 'error', 'message': 'No topic prefix provided'}), 400
+
+    brokers = get_kafka_brokers(namespace, kafka_statefulset_name, kafka_service_name)
+    if not brokers:
+        return jsonify({'status': 'error', 'message': 'No brokers available'}), 500
+
+    try:
+        admin_client = AdminClient({'bootstrap.servers': ",".join(brokers)})
+        topic_names = [topic for topic in admin_client.list_topics(timeout=10).topics if topic.startswith(prefix)]
+        if topic_names:
+            for future in admin_client.delete_topics(topic_names, request_timeout=timeout).values():
+                future.result()
+        print(f"Kafka Topics deleted: {', '.join(topic_names)}", file=sys.stderr)
+        return jsonify({'status': 'success', 'deleted': topic_names})
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
 @app.route('/send_messages', methods=['POST'])
 def send_messages():
     """Send multiple messages to Kafka topics based on the request payload."""
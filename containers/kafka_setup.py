@@ -2,7 +2,7 @@ import time
 from kubernetes import client, config
 from kubernetes.client import V1Service, V1ObjectMeta, V1ServiceSpec, V1ServicePort, V1StatefulSet, V1StatefulSetSpec, V1PodTemplateSpec, V1PodSpec, V1Container, V1ContainerPort, V1PersistentVolumeClaim, V1EnvVar
 from kubernetes.client.rest import ApiException
-from utils import get_service_external_ip_forwarded_port, wait_for_pods_ready, get_minikube_service_ip_port, get_docker_image_with_pre_suffix
+from utils import get_service_external_ip_forwarded_port, wait_for_pods_ready, wait_for_statefulset_ready, get_minikube_service_ip_port, get_docker_image_with_pre_suffix
 
 import os
 import requests
@@ -59,9 +59,10 @@ def create_kafka_headless_service(v1, namespace):
     return response.metadata.name  # Return the name of the created service
 
 
-def create_kafka_statefulset(apps_v1, namespace):
-    # Ask the user for the number of replicas
-    replicas = int(input("Enter the number of Kafka replicas: "))
+def create_kafka_statefulset(apps_v1, namespace, replicas=None):
+    # Ask the user for the number of replicas, unless given
+    if replicas is None:
+        replicas = int(input("Enter the number of Kafka replicas: "))
 
     container = V1Container(
         name="kafka-instance",
@@ -105,9 +106,10 @@ def create_kafka_statefulset(apps_v1, namespace):
     return replicas, response.metadata.name
 
 
-def create_kafka_external_gateway_deployment(apps_v1, namespace):
-    replicas = int(input("Enter the number of Kafka External Gateway replicas: "))
+def create_kafka_external_gateway_deployment(apps_v1, namespace, replicas=None):
     """Create a Kubernetes Deployment."""
+    if replicas is None:
+        replicas = int(input("Enter the number of Kafka External Gateway replicas: "))
     container = client.V1Container(
         name="kafka-external-gateway",
         image=get_docker_image_with_pre_suffix('kafka-external-gateway'),
@@ -225,8 +227,7 @@ def create_or_update_kafka_external_gateway_role_and_rolebinding(rbac_v1, namesp
             raise
 
 
-def create_topics_http_request(topics, namespace, kafka_statefulset_name, kafka_external_gateway_name ,kafka_service_name, kafka_external_gateway_nodeport, node_ip, timeout=60, poll_interval=5, retries=3):
-
+def kafka_gateway_url(namespace, kafka_external_gateway_name, kafka_external_gateway_nodeport, node_ip):
     kafka_gateway_ip_port = get_minikube_service_ip_port(kafka_external_gateway_name, namespace)
 
     if not kafka_gateway_ip_port[0] or not kafka_gateway_ip_port[1]:
@@ -235,7 +236,39 @@ def create_topics_http_request(topics, namespace, kafka_statefulset_name, kafka_
     kafka_gateway_ip, kafka_gateway_port = kafka_gateway_ip_port
     if not kafka_gateway_ip or not kafka_gateway_port:
         raise RuntimeError("Failed to get Kafka External Gateway IP and port.")
-    
+    return f"http://{kafka_gateway_ip}:{kafka_gateway_port}"
+
+
+def delete_topics_http_request(prefix, namespace, kafka_statefulset_name, kafka_external_gateway_name, kafka_service_name, kafka_external_gateway_nodeport, node_ip, timeout=60):
+    """
+    Delete every topic whose name starts with prefix, through the Kafka External Gateway.
+    """
+    data = {
+        "prefix": prefix,
+        "namespace": namespace,
+        "kafka_statefulset_name": kafka_statefulset_name,
+        "kafka_service_name": kafka_service_name,
+        "timeout": timeout
+    }
+    url = f"{kafka_gateway_url(namespace, kafka_external_gateway_name, kafka_external_gateway_nodeport, node_ip)}/delete_topics"
+
+    attempt = 1
+    while True:
+        print(f"Attempt {attempt} to send HTTP request to delete topics.")
+        try:
+            response = requests.post(url, json=data)
+            if response.status_code == 200:
+                print("Request successful:", response.json())
+                return
+            else:
+                print(f"Failed to delete topics. Status code: {response.status_code}, Response: {response.text}")
+        except requests.exceptions.RequestException as e:
+            print(f"An error occurred: {e}")
+        time.sleep(10)
+        attempt += 1
+
+
+def create_topics_http_request(topics, namespace, kafka_statefulset_name, kafka_external_gateway_name ,kafka_service_name, kafka_external_gateway_nodeport, node_ip, timeout=60, poll_interval=5, retries=3):
 
     data = {
         "topics": topics,
@@ -245,7 +278,7 @@ def create_topics_http_request(topics, namespace, kafka_statefulset_name, kafka_
         "timeout": timeout,
         "poll_interval": poll_interval
     }
-    url = f"http://{kafka_gateway_ip}:{kafka_gateway_port}/create_topics"
+    url = f"{kafka_gateway_url(namespace, kafka_external_gateway_name, kafka_external_gateway_nodeport, node_ip)}/create_topics"
     
     attempt = 1
     while True:
@@ -263,21 +296,27 @@ def create_topics_http_request(topics, namespace, kafka_statefulset_name, kafka_
         attempt += 1
 
 
-def deploy_kafka_environment(namespace, v1, apps_v1, rbac_v1, kafka_external_gateway_nodeport):
-    # Deploy Zookeeper
+def create_zookeeper(v1, apps_v1, namespace):
     create_zookeeper_service(v1, namespace)
     create_zookeeper_statefulset(apps_v1, namespace)
-    wait_for_pods_ready(namespace)
-    # Deploy Kafka
+
+def create_kafka(v1, apps_v1, rbac_v1, namespace, kafka_external_gateway_nodeport, kafka_replicas=None, gateway_replicas=None):
     kafka_headless_service_name = create_kafka_headless_service(v1, namespace)
-    (kafka_replicas, kafka_statefulset_name) = create_kafka_statefulset(apps_v1, namespace)
+    (kafka_replicas, kafka_statefulset_name) = create_kafka_statefulset(apps_v1, namespace, kafka_replicas)
 
     # Deploy Kafka External Gateway
     create_or_update_kafka_external_gateway_role_and_rolebinding(rbac_v1, namespace)
     kafka_gateway_service_name = create_kafka_external_gateway_service(v1, namespace, kafka_external_gateway_nodeport)
-    create_kafka_external_gateway_deployment(apps_v1, namespace)
+    create_kafka_external_gateway_deployment(apps_v1, namespace, gateway_replicas)
     return (kafka_replicas, kafka_statefulset_name, kafka_headless_service_name, kafka_gateway_service_name)
 
+def deploy_kafka_environment(namespace, v1, apps_v1, rbac_v1, kafka_external_gateway_nodeport, kafka_replicas=None, gateway_replicas=None):
+    # Deploy Zookeeper
+    create_zookeeper(v1, apps_v1, namespace)
+    wait_for_statefulset_ready(apps_v1, namespace, "zoo1-instance")
+    # Deploy Kafka
+    return create_kafka(v1, apps_v1, rbac_v1, namespace, kafka_external_gateway_nodeport, kafka_replicas, gateway_replicas)
+
 
 def main():
 # Load Kubernetes configuration
@@ -289,7 +328,7 @@ def main():
 
     create_zookeeper_service(v1, namespace)
     create_zookeeper_statefulset(apps_v1, namespace)
-    wait_for_pods_ready(namespace)
+    wait_for_pods_ready(v1, apps_v1, namespace)
 
     # Deploy Kafka
     create_kafka_headless_service(v1, namespace)
@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 import redis
 import os
 import sys
@@ -13,34 +13,47 @@ app = Flask(__name__)
 redis_client = redis.Redis(host=redis_ip, port=6379)
 start_time = None
 csv_file = 'request_logs.csv'
+# Bumped by /reset; queued entries of an earlier run are dropped instead of written to the new file
+run_generation = 0
 
-# A thread-safe queue to store logs for batch processing
+# A thread-safe queue to store logs for batch processing, as (run generation, entry)
 log_queue = queue.Queue()
+# Held while the queue is drained into the CSV file, and while the file is read or reset
+csv_lock = threading.Lock()
 
-# Ensure the CSV file has headers if it doesn't exist
-if not os.path.exists(csv_file):
+def write_csv_headers():
     with open(csv_file, mode='w', newline='') as file:
         writer = csv.writer(file)
         writer.writerow(['timestamp_actual', 'timestamp_sent', 'timestamp_received', 'dm', 'um', 'communication_type', 'time_delay'])
 
+def append_log_entries(log_entries):
+    with open(csv_file, mode='a', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerows(log_entries)
+
+def drain_log_queue(limit=None):
+    """The queued entries of the current run, at most `limit` of them. Call with csv_lock held."""
+    log_entries = []
+    while (limit is None or len(log_entries) < limit) and not log_queue.empty():
+        generation, log_entry = log_queue.get_nowait()
+        if generation == run_generation:
+            log_entries.append(log_entry)
+    return log_entries
+
+# Ensure the CSV file has headers if it doesn't exist
+if not os.path.exists(csv_file):
+    write_csv_headers()
+
 # Background thread to handle writing log data to the CSV file
 def log_writer():
     while True:
-        log_entries = []
         try:
-            # Collect log entries in batches
-            while len(log_entries) < 100 and not log_queue.empty():
-                log_entries.append(log_queue.get(timeout=1))
-            
-            # Append the batch to the CSV file
-            if log_entries:
-                with open(csv_file, mode='a', newline='') as file:
-                    writer = csv.writer(file)
-                    writer.writerows(log_entries)
+            # Collect log entries in batches and append them to the CSV file, without a reset in between
+            with csv_lock:
+                log_entries = drain_log_queue(limit=100)
+                if log_entries:
+                    append_log_entries(log_entries)
 
-        except queue.Empty:
-            # If the queue is empty, wait for new data
-            pass
         except Exception as e:
             print(f"Error writing logs: {e}", file=sys.stderr)
         time.sleep(1)  # Adjust the sleep time based on your desired batch size/write frequency
@@ -49,8 +62,13 @@ def log_writer():
 @app.route('/logs', methods=['POST'])
 def log_data():
     global start_time
+    generation = run_generation
     if not start_time:
-        start_time = int(redis_client.get('start_time')) // 1_000_000
+        redis_start_time = redis_client.get('start_time')
+        if redis_start_time is None:
+            # Between two runs of a sweep: a late entry of the previous run, which is not logged
+            return jsonify({"message": "No start time set, entry dropped"}), 200
+        start_time = int(redis_start_time) // 1_000_000
     
     data = request.get_json()
     timestamp_received = int(data['timestamp_received']) - start_time
@@ -62,10 +80,30 @@ def log_data():
     print(f"[{timestamp_actual}][{timestamp_sent}][{timestamp_received}] {data['dm']} received request from {data['um']} with communication_type {data['communication_type']}. Time delay: {time_delay} ms. Start time: {start_time}", file=sys.stderr)
     
     # Add the log entry to the queue
-    log_queue.put([timestamp_actual, timestamp_sent, timestamp_received, data['dm'], data['um'], data['communication_type'], time_delay])
+    log_queue.put((generation, [timestamp_actual, timestamp_sent, timestamp_received, data['dm'], data['um'], data['communication_type'], time_delay]))
     
     return jsonify({"message": "Data received"}), 200
 
+@app.route('/logs', methods=['GET'])
+def get_logs():
+    """Every log entry of the current run as CSV, including the ones still queued."""
+    with csv_lock:
+        append_log_entries(drain_log_queue())
+        with open(csv_file, newline='') as file:
+            data = file.read()
+    return Response(data, mimetype='text/csv')
+
+@app.route('/reset', methods=['POST'])
+def reset_logs():
+    """Start a new run: drop the logged entries and read the start time again on the next log."""
+    global start_time, run_generation
+    with csv_lock:
+        run_generation += 1
+        drain_log_queue()
+        write_csv_headers()
+        start_time = None
+    return jsonify({"message": "Logs reset"}), 200
+
 if __name__ == '__main__':
     # Start the background logging thread
     threading.Thread(target=log_writer, daemon=True).start()
@@ -0,0 +1,178 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import yaml
+from kubernetes import client, dynamic
+from kubernetes.client.rest import ApiException
+
+# The deploy code builds every object with the kubernetes models and hands it to create_namespaced_* (or
+# replace_namespaced_*) of an API object. ManifestApi stands in for that API object: those calls become
+# manifests, which are either recorded (ManifestRecorder, no cluster needed) or server-side applied
+# (ServerSideApplier, so reruns update objects instead of failing on conflicts). Every other call goes to
+# the real API object.
+FIELD_MANAGER = "static-application"
+APPLY_WORKERS = int(os.getenv("APPLY_WORKERS", "16"))
+
+# apiVersion and kind of the objects of every create_namespaced_*/replace_namespaced_* method
+KINDS = {
+    'service': ('v1', 'Service'),
+    'persistent_volume_claim': ('v1', 'PersistentVolumeClaim'),
+    'config_map': ('v1', 'ConfigMap'),
+    'secret': ('v1', 'Secret'),
+    'service_account': ('v1', 'ServiceAccount'),
+    'pod': ('v1', 'Pod'),
+    'deployment': ('apps/v1', 'Deployment'),
+    'stateful_set': ('apps/v1', 'StatefulSet'),
+    'job': ('batch/v1', 'Job'),
+    'role': ('rbac.authorization.k8s.io/v1', 'Role'),
+    'role_binding': ('rbac.authorization.k8s.io/v1', 'RoleBinding'),
+}
+# Objects are applied wave by wave, every wave only referencing objects of the earlier ones
+WAVES = [
+    ['Namespace'],
+    ['ServiceAccount', 'Role', 'RoleBinding', 'Secret', 'ConfigMap', 'PersistentVolumeClaim', 'Service'],
+    ['Deployment', 'StatefulSet', 'Pod'],
+    ['Job'],
+]
+WAVE_OF_KIND = {kind: wave for wave, kinds in enumerate(WAVES) for kind in kinds}
+# Kinds whose spec can barely change once created: existing objects are kept as they are, not applied
+CREATE_ONLY_KINDS = {'PersistentVolumeClaim'}
+
+
+def to_manifest(method_suffix, namespace, body):
+    api_version, kind = KINDS[method_suffix]
+    manifest = client.ApiClient().sanitize_for_serialization(body)
+    manifest['apiVersion'] = api_version
+    manifest['kind'] = kind
+    manifest.setdefault('metadata', {})['namespace'] = namespace
+    return manifest
+
+
+def namespace_manifest(namespace):
+    return {'apiVersion': 'v1', 'kind': 'Namespace', 'metadata': {'name': namespace}}
+
+
+def manifest_order(manifest):
+    metadata = manifest['metadata']
+    return WAVE_OF_KIND.get(manifest['kind'], len(WAVES)), manifest['kind'], metadata.get('namespace', ''), metadata['name']
+
+
+class ManifestApi:
+    """
+    Stand-in for a kubernetes API object (CoreV1Api, AppsV1Api, ...) passing the objects of its
+    create_namespaced_* and replace_namespaced_* calls to handle(manifest), and every other call to `api`.
+    """
+
+    def __init__(self, handle, api=None):
+        self.handle = handle
+        self.api = api
+
+    def __getattr__(self, name):
+        for prefix in ('create_namespaced_', 'replace_namespaced_'):
+            if name.startswith(prefix) and name[len(prefix):] in KINDS:
+                method_suffix = name[len(prefix):]
+
+                def write(namespace, body, name=None, **kwargs):
+                    self.handle(to_manifest(method_suffix, namespace, body))
+                    # Callers read the name of the created object from the response
+                    return body
+                return write
+        if self.api is None:
+            raise AttributeError(f"{name} needs a cluster and cannot be rendered offline")
+        return getattr(self.api, name)
+
+
+class ManifestRecorder:
+    """
+    Records the manifests of every object created through its APIs, without touching a cluster.
+    """
+
+    def __init__(self):
+        self.manifests = []
+        self.lock = threading.Lock()
+
+    def record(self, manifest):
+        with self.lock:
+            self.manifests.append(manifest)
+
+    def api(self, real_api=None):
+        return ManifestApi(self.record, real_api)
+
+
+class ServerSideApplier:
+    """
+    Server-side applies every object created through its APIs, so creating an object that already
+    exists updates it instead of failing. Objects of CREATE_ONLY_KINDS are only created.
+    """
+
+    def __init__(self, api_client=None, field_manager=FIELD_MANAGER):
+        self.dynamic_client = dynamic.DynamicClient(api_client or client.ApiClient())
+        self.field_manager = field_manager
+        self.resources = {}
+        self.lock = threading.Lock()
+
+    def resource(self, api_version, kind):
+        # Discovery is cached, but not thread safe
+        with self.lock:
+            if (api_version, kind) not in self.resources:
+                self.resources[(api_version, kind)] = self.dynamic_client.resources.get(api_version=api_version, kind=kind)
+            return self.resources[(api_version, kind)]
+
+    def exists(self, resource, metadata):
+        try:
+            self.dynamic_client.get(resource, name=metadata['name'], namespace=metadata.get('namespace'))
+            return True
+        except ApiException as e:
+            if e.status != 404:
+                raise
+            return False
+
+    def apply(self, manifest):
+        metadata = manifest['metadata']
+        resource = self.resource(manifest['apiVersion'], manifest['kind'])
+        if manifest['kind'] in CREATE_ONLY_KINDS and self.exists(resource, metadata):
+            print(f"{manifest['kind']} '{metadata['name']}' already exists, keeping it.")
+            return
+        self.dynamic_client.server_side_apply(resource, body=manifest, name=metadata['name'], namespace=metadata.get('namespace'),
+                                              field_manager=self.field_manager, force_conflicts=True)
+        print(f"Applied {manifest['kind']} '{metadata['name']}'.")
+
+    def api(self, real_api):
+        return ManifestApi(self.apply, real_api)
+
+
+def write_manifests(manifests, path):
+    """
+    Write the manifests as one YAML stream, in apply order with sorted keys, so renders can be diffed.
+    """
+    with open(path, 'w') as f:
+        yaml.safe_dump_all(sorted(manifests, key=manifest_order), f, sort_keys=True)
+
+
+def read_manifests(path):
+    with open(path) as f:
+        return [manifest for manifest in yaml.safe_load_all(f) if manifest]
+
+
+def apply_manifests(manifests, applier=None, workers=APPLY_WORKERS):
+    """
+    Server-side apply the manifests wave by wave, `workers` objects at a time. Raises if any apply failed.
+    """
+    applier = applier or ServerSideApplier()
+    waves = {}
+    for manifest in manifests:
+        waves.setdefault(manifest_order(manifest)[0], []).append(manifest)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for wave in sorted(waves):
+            futures = {executor.submit(applier.apply, manifest): manifest for manifest in waves[wave]}
+            failures = []
+            for future, manifest in futures.items():
+                try:
+                    future.result()
+                except Exception as e:
+                    failures.append(f"{manifest['kind']} '{manifest['metadata']['name']}' ({e})")
+            if failures:
+                raise RuntimeError(f"Failed to apply {len(failures)} objects: " + ", ".join(failures))
+    print(f"Applied {len(manifests)} objects.")
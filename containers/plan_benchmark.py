@@ -0,0 +1,104 @@
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from create import DEFAULT_PLAN_PATH, extract_remove_memcached_db_containers, get_and_rename_containers, split_calls_to_replicas
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app', 'src'))
+from call_plan import PodCallPlan, compress_shard, encode_call_plan
+
+# Codec and level pairs compared by default; zstd ones are skipped when zstandard is not installed
+DEFAULT_CASES = ['none', 'gzip:1', 'gzip:6', 'gzip:9', 'zstd:1', 'zstd:3', 'zstd:10', 'zstd:19']
+
+
+def parse_case(case):
+    codec, _, level = case.partition(':')
+    return codec, int(level) if level else None
+
+
+def plan_shards(plan_path, choice):
+    """
+    The uncompressed shards {pod name: encoded plan} create.py would write for the plan.
+    """
+    # The renamed plan goes to a scratch directory, not over the files a running create.py reads
+    with tempfile.TemporaryDirectory() as mapped_directory:
+        renamed_containers, calls, graph = get_and_rename_containers(plan_path, os.path.join(mapped_directory, "containers_mapped.json"),
+                                                                     os.path.join(mapped_directory, "calls_mapped.jsonl"))
+        extract_remove_memcached_db_containers(renamed_containers, graph)
+        shards = {}
+        for details in renamed_containers.values():
+            mappedName = details['mappedName']
+            serviceCalls = calls.get(mappedName, {}) if graph.outbound.get(mappedName) else {}
+            split = split_calls_to_replicas(serviceCalls, details['replicas'], mappedName, choice)
+            for pod_name, pod_calls in split.items():
+                shards[pod_name] = encode_call_plan({pod_name: pod_calls})
+    return shards
+
+
+def load_shards(directory, paths):
+    """
+    Open every shard the way a worker does and walk its calls, so lazily mapped pages are read too.
+    """
+    calls = 0
+    for pod_name, file_name in paths.items():
+        plan = PodCallPlan(os.path.join(directory, file_name), pod_name)
+        calls += sum(plan.multiplicities)
+    return calls
+
+
+def run_case(case, shards, bandwidth, directory, min_bytes=0):
+    codec, level = parse_case(case)
+    start = time.perf_counter()
+    compressed = {pod_name: compress_shard(pod_name, data, codec, level, min_bytes) for pod_name, data in shards.items()}
+    compress_time = time.perf_counter() - start
+
+    size = sum(len(data) for _, data in compressed.values())
+    transfer_time = size / (bandwidth * 1024 * 1024)
+
+    case_dir = os.path.join(directory, case.replace(':', '-'))
+    os.makedirs(case_dir)
+    paths = {}
+    for pod_name, (file_name, data) in compressed.items():
+        paths[pod_name] = file_name
+        with open(os.path.join(case_dir, file_name), 'wb') as f:
+            f.write(data)
+
+    start = time.perf_counter()
+    load_shards(case_dir, paths)
+    load_time = time.perf_counter() - start
+
+    raw_size = sum(len(data) for data in shards.values())
+    print(f"{case:<10} size={size / 1024 / 1024:9.2f}MiB ratio={raw_size / max(size, 1):6.2f} compress={compress_time:8.3f}s "
+          f"transfer={transfer_time:8.3f}s load={load_time:8.3f}s transfer+load={transfer_time + load_time:8.3f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare plan shard codecs: size, transfer time from the plan server and worker load time.")
+    parser.add_argument('--plan', default=DEFAULT_PLAN_PATH, help="Plan to shard (default: containers/plan.jsonl).")
+    parser.add_argument('--choice', default='1', choices=['0', '1', '2', '3'], help="Split of the calls between replicas, as asked by create.py.")
+    parser.add_argument('--bandwidth', type=float, default=100.0, help="MiB/s from the plan server, used to estimate transfer times.")
+    parser.add_argument('--cases', nargs='+', default=DEFAULT_CASES, help="codec[:level] pairs to compare.")
+    parser.add_argument('--min-bytes', type=int, default=0, help="Shards smaller than this stay uncompressed, as PLAN_COMPRESSION_MIN_BYTES in create.py.")
+    args = parser.parse_args()
+
+    shards = plan_shards(args.plan, args.choice)
+    sizes = sorted(len(data) for data in shards.values())
+    print(f"{len(shards)} shards, {sum(sizes) / 1024 / 1024:.2f}MiB uncompressed (median {sizes[len(sizes) // 2] / 1024:.1f}KiB, "
+          f"largest {sizes[-1] / 1024:.1f}KiB), {sum(size >= args.min_bytes for size in sizes)} of them compressed")
+
+    directory = tempfile.mkdtemp()
+    try:
+        for case in args.cases:
+            try:
+                run_case(case, shards, args.bandwidth, directory, args.min_bytes)
+            except RuntimeError as e:
+                print(f"{case:<10} skipped: {e}")
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,207 @@
+import base64
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from kubernetes.stream import stream
+
+from plan_server_setup import PLAN_SERVER_ROOT
+
+# Loads the encoded call plan shards onto the plan server, which stores them by content: every shard is
+# objects/<sha256>, and manifests/<service>.json records the hash and length of the shard of every replica.
+# Shards and manifests already on the server are never uploaded again, so redeploying the same trace, or
+# one with a few changed services, only uploads what changed. Files are streamed into the plan server pod
+# over exec stdin (base64, since stdin is a text channel), their sha256 is checked on the volume, and only
+# then are they renamed to their final name; a manifest is published after its shards, so workers never
+# see a partial plan. Services are loaded in parallel. Once every plan is loaded, the manifests of other
+# services and the shards no manifest references are deleted, so the volume only holds the current plans.
+LOADER_WORKERS = int(os.getenv("PLAN_LOADER_WORKERS", "8"))
+LOADER_RETRIES = 3
+STDIN_FRAME_SIZE = 1024 * 1024
+
+
+def exec_in_pod(v1, namespace, pod_name, command, stdin_data=None):
+    """
+    Run command in the pod, writing stdin_data (text) to its stdin. Returns (return code, stdout, stderr).
+    """
+    resp = stream(v1.connect_get_namespaced_pod_exec, pod_name, namespace, command=command,
+                  stderr=True, stdin=stdin_data is not None, stdout=True, tty=False, _preload_content=False)
+    stdout = []
+    stderr = []
+    if stdin_data is not None:
+        for start in range(0, len(stdin_data), STDIN_FRAME_SIZE):
+            resp.write_stdin(stdin_data[start:start + STDIN_FRAME_SIZE])
+            resp.update(timeout=0)
+            if resp.peek_stdout():
+                stdout.append(resp.read_stdout())
+            if resp.peek_stderr():
+                stderr.append(resp.read_stderr())
+    while resp.is_open():
+        resp.update(timeout=1)
+        if resp.peek_stdout():
+            stdout.append(resp.read_stdout())
+        if resp.peek_stderr():
+            stderr.append(resp.read_stderr())
+    resp.close()
+    return resp.returncode, ''.join(stdout), ''.join(stderr)
+
+
+def load_file(v1, namespace, pod_name, file_name, data):
+    """
+    Stream one file into the plan server root and verify it. Returns its sha256.
+    """
+    expected = hashlib.sha256(data).hexdigest()
+    encoded = base64.b64encode(data).decode()
+    part_path = f"{PLAN_SERVER_ROOT}/{file_name}.part"
+
+    for attempt in range(1, LOADER_RETRIES + 1):
+        # head -c reads exactly the file, so the command ends without having to close stdin
+        command = ['sh', '-c', f'head -c {len(encoded)} | base64 -d > {part_path} && sha256sum {part_path}']
+        returncode, stdout, stderr = exec_in_pod(v1, namespace, pod_name, command, encoded)
+        actual = stdout.split()[0] if stdout.strip() else None
+        if returncode in (0, None) and actual == expected:
+            break
+        print(f"{file_name} failed its integrity check (attempt {attempt}): expected {expected}, got {actual}. {stderr.strip()}")
+    else:
+        raise RuntimeError(f"Could not load {file_name} after {LOADER_RETRIES} attempts")
+
+    returncode, _, stderr = exec_in_pod(v1, namespace, pod_name, ['mv', part_path, f"{PLAN_SERVER_ROOT}/{file_name}"])
+    if returncode not in (0, None):
+        raise RuntimeError(f"Could not publish {file_name}: {stderr.strip()}")
+    return expected
+
+
+def list_plan_server(v1, namespace, server_pod):
+    """
+    Hashes of the shards and of the manifests already on the plan server. Returns (objects, {service: sha256}).
+    """
+    command = ['sh', '-c', f'cd {PLAN_SERVER_ROOT} && mkdir -p objects manifests && ls objects && echo --- && cd manifests && sha256sum *.json 2>/dev/null; true']
+    returncode, stdout, stderr = exec_in_pod(v1, namespace, server_pod, command)
+    if returncode not in (0, None):
+        raise RuntimeError(f"Could not list the plan server: {stderr.strip()}")
+    objects, _, manifests = stdout.partition('---')
+    manifest_hashes = {}
+    for line in manifests.splitlines():
+        if line.strip():
+            digest, file_name = line.split()
+            manifest_hashes[file_name[:-len('.json')]] = digest
+    return {name for name in objects.split() if not name.endswith('.part')}, manifest_hashes
+
+
+def remove_from_plan_server(v1, namespace, server_pod, file_names):
+    """
+    Delete the files (relative to the plan server root) and any partial upload left on the plan server.
+    """
+    listing = ''.join(f"{file_name}\n" for file_name in file_names)
+    # head -c reads exactly the listing, so the command ends without having to close stdin
+    command = ['sh', '-c', f'cd {PLAN_SERVER_ROOT} && rm -f objects/*.part manifests/*.part && head -c {len(listing)} | xargs -r rm -f']
+    returncode, _, stderr = exec_in_pod(v1, namespace, server_pod, command, listing)
+    if returncode not in (0, None):
+        raise RuntimeError(f"Could not clean the plan server: {stderr.strip()}")
+
+
+def load_service_plans(v1, namespace, server_pod, service, shards, existing, manifest_hash=None):
+    """
+    Load the plan shards of one service onto the plan server, skipping the shards in `existing` (a
+    PlanObjects) and the manifest if it hashes to manifest_hash. Returns the manifest of the service.
+    """
+    files = {}
+    uploaded = 0
+    for file_name, data in shards.items():
+        digest = hashlib.sha256(data).hexdigest()
+        files[file_name] = {"sha256": digest, "length": len(data)}
+        if existing.claim(digest):
+            try:
+                load_file(v1, namespace, server_pod, f"objects/{digest}", data)
+            except Exception:
+                existing.release(digest)
+                raise
+            uploaded += len(data)
+
+    manifest = {"files": files}
+    encoded_manifest = json.dumps(manifest, sort_keys=True).encode()
+    if hashlib.sha256(encoded_manifest).hexdigest() != manifest_hash:
+        load_file(v1, namespace, server_pod, f"manifests/{service}.json", encoded_manifest)
+    print(f"Loaded the plan of '{service}': {uploaded} of {sum(len(data) for data in shards.values())} bytes uploaded.")
+    return manifest
+
+
+class PlanObjects:
+    """
+    Hashes of the shards stored on the plan server, shared by the loading threads so that a shard is
+    uploaded once even when several services need it at the same time.
+    """
+
+    def __init__(self, hashes):
+        self.hashes = set(hashes)
+        self.lock = threading.Lock()
+
+    def claim(self, digest):
+        """
+        True if the caller has to upload the shard, False if it is stored or being uploaded already.
+        """
+        with self.lock:
+            if digest in self.hashes:
+                return False
+            self.hashes.add(digest)
+            return True
+
+    def release(self, digest):
+        with self.lock:
+            self.hashes.discard(digest)
+
+
+class PlanLoader:
+    """
+    Loads the plan shards of every service onto the plan server in parallel, while the caller is still
+    encoding the next ones. At most twice as many services as there are workers are held in memory at once.
+    """
+
+    def __init__(self, v1, namespace, server_pod, workers=LOADER_WORKERS):
+        self.v1 = v1
+        self.namespace = namespace
+        self.server_pod = server_pod
+        objects, self.manifest_hashes = list_plan_server(v1, namespace, server_pod)
+        self.objects = PlanObjects(objects)
+        print(f"The plan server holds {len(objects)} shards and the manifests of {len(self.manifest_hashes)} services.")
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.slots = threading.BoundedSemaphore(workers * 2)
+        self.futures = {}
+
+    def submit(self, service, shards):
+        self.slots.acquire()
+        future = self.executor.submit(load_service_plans, self.v1, self.namespace, self.server_pod, service, shards,
+                                      self.objects, self.manifest_hashes.get(service))
+        future.add_done_callback(lambda _: self.slots.release())
+        self.futures[service] = future
+
+    def wait(self):
+        """
+        Wait for every plan to be loaded. Returns {service: manifest}; raises if any load failed.
+        """
+        manifests = {}
+        failures = {}
+        for service, future in self.futures.items():
+            try:
+                manifests[service] = future.result()
+            except Exception as e:
+                failures[service] = e
+        self.executor.shutdown()
+        if failures:
+            raise RuntimeError(f"Failed to load the plans of {len(failures)} services: " + ", ".join(f"{name} ({error})" for name, error in failures.items()))
+        print(f"Loaded the plans of {len(manifests)} services.")
+        self.remove_stale(manifests)
+        return manifests
+
+    def remove_stale(self, manifests):
+        """
+        Delete the manifests of the services that are not in `manifests` and the shards none of them references.
+        """
+        referenced = {file['sha256'] for manifest in manifests.values() for file in manifest['files'].values()}
+        stale_objects = sorted(self.objects.hashes - referenced)
+        stale_manifests = sorted(set(self.manifest_hashes) - set(manifests))
+        remove_from_plan_server(self.v1, self.namespace, self.server_pod,
+                                [f"manifests/{service}.json" for service in stale_manifests] + [f"objects/{digest}" for digest in stale_objects])
+        print(f"Removed {len(stale_objects)} shards and {len(stale_manifests)} manifests no longer referenced from the plan server.")
@@ -0,0 +1,93 @@
+import os
+from kubernetes import client, config
+from utils import WatchCache, wait_for_deployment_ready
+from kubernetes.client import V1Container, V1ObjectMeta, V1PodSpec, V1Service, V1ServiceSpec, V1ServicePort, V1Deployment, V1DeploymentSpec, V1PodTemplateSpec, V1LabelSelector, V1Volume, V1VolumeMount, V1PersistentVolumeClaimVolumeSource
+
+# The plan server holds the call plans of every service on one volume and serves them over HTTP, so every
+# worker's init container fetches only its own shard. The volume outlives deployments (destroy.py keeps it
+# unless given --delete-plans), so shards already stored are not uploaded again.
+PLAN_SERVER_NAME = "plan-server"
+PLAN_SERVER_ROOT = "/usr/share/nginx/html"
+PLAN_SERVER_STORAGE = os.getenv("PLAN_SERVER_STORAGE", "10Gi")
+PLAN_SERVER_PVC = f"{PLAN_SERVER_NAME}-pvc"
+PLAN_SERVER_DEPLOYMENT = f"{PLAN_SERVER_NAME}-deployment"
+
+
+def create_plan_server_pvc(v1, namespace, storage_class):
+    pvc = client.V1PersistentVolumeClaim(
+        metadata=V1ObjectMeta(name=PLAN_SERVER_PVC, namespace=namespace),
+        spec=client.V1PersistentVolumeClaimSpec(
+            access_modes=["ReadWriteOnce"],
+            resources=client.V1VolumeResourceRequirements(requests={'storage': PLAN_SERVER_STORAGE}),
+            storage_class_name=storage_class
+        )
+    )
+    # An existing claim, and the plans on it, is kept as it is (see ServerSideApplier)
+    v1.create_namespaced_persistent_volume_claim(namespace=namespace, body=pvc)
+    print(f"PersistentVolumeClaim '{PLAN_SERVER_PVC}' applied in namespace '{namespace}'.")
+
+def create_plan_server_service(v1, namespace):
+    service = V1Service(
+        metadata=V1ObjectMeta(name=PLAN_SERVER_NAME, namespace=namespace),
+        spec=V1ServiceSpec(
+            selector={"app": PLAN_SERVER_NAME},
+            ports=[V1ServicePort(port=80, target_port=80)]
+        ),
+    )
+    response = v1.create_namespaced_service(namespace=namespace, body=service)
+    print(f"Plan server Service created in namespace '{namespace}'.")
+    return response.metadata.name
+
+def create_plan_server_deployment(apps_v1, namespace):
+    container = V1Container(
+        name="nginx",
+        image="nginx:alpine",
+        ports=[client.V1ContainerPort(container_port=80)],
+        volume_mounts=[V1VolumeMount(mount_path=PLAN_SERVER_ROOT, name="plans")],
+        image_pull_policy="IfNotPresent",
+    )
+    volume = V1Volume(name="plans", persistent_volume_claim=V1PersistentVolumeClaimVolumeSource(claim_name=PLAN_SERVER_PVC))
+    pod_spec = V1PodSpec(containers=[container], volumes=[volume])
+    template = V1PodTemplateSpec(metadata=V1ObjectMeta(labels={"app": PLAN_SERVER_NAME}), spec=pod_spec)
+    # The volume is ReadWriteOnce, so the old pod has to release it before the new one starts
+    spec = V1DeploymentSpec(replicas=1, template=template, selector=V1LabelSelector(match_labels={"app": PLAN_SERVER_NAME}),
+                            strategy=client.V1DeploymentStrategy(type="Recreate"))
+    deployment = V1Deployment(metadata=V1ObjectMeta(name=PLAN_SERVER_DEPLOYMENT, namespace=namespace), spec=spec)
+
+    apps_v1.create_namespaced_deployment(namespace=namespace, body=deployment)
+    print(f"Plan server Deployment created in namespace '{namespace}'.")
+
+def wait_for_plan_server_pod(v1, namespace, timeout=600):
+    """
+    Name of the running plan server pod, which the plans are streamed into.
+    """
+    # Once the deployment is ready its pod exists, and the Recreate strategy has stopped the previous one
+    wait_for_deployment_ready(client.AppsV1Api(), namespace, PLAN_SERVER_DEPLOYMENT)
+    pods = WatchCache(v1.list_namespaced_pod, namespace, label_selector=f"app={PLAN_SERVER_NAME}").wait_until(
+        lambda pod: pod.status.phase == 'Running' and not pod.metadata.deletion_timestamp, "plan server pods to be running", timeout=timeout)
+    if not pods:
+        raise RuntimeError(f"The plan server deployment in namespace '{namespace}' has no pod")
+    return next(iter(pods))
+
+def plan_server_url(namespace):
+    return f"http://{PLAN_SERVER_NAME}.{namespace}.svc.cluster.local"
+
+def deploy_plan_server_environment(namespace, v1, apps_v1, storage_class):
+    #Deploy the plan server
+    create_plan_server_pvc(v1, namespace, storage_class)
+    plan_server_service_name = create_plan_server_service(v1, namespace)
+    create_plan_server_deployment(apps_v1, namespace)
+    return (plan_server_service_name, )
+
+def main():
+    config.load_kube_config()
+    v1 = client.CoreV1Api()
+    apps_v1 = client.AppsV1Api()
+    namespace = "default"
+
+    deploy_plan_server_environment(namespace, v1, apps_v1, "nfs-client")
+    print(f"Plan server running in pod {wait_for_plan_server_pod(v1, namespace)}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -16,6 +16,12 @@ def set_start_time_redis(data):
     except Exception as e:
         print(f"Error: {e}")
 
+def clear_start_time_redis(data):
+    r = redis.Redis(host='localhost', port=data['local_port'])
+    # Workers wait for the start time, so new ones do not start replaying before it is set again
+    r.delete('start_time')
+    print("Redis Start Time value is cleared.")
+
 def create_redis_service(v1, namespace):
     service = V1Service(
         metadata=V1ObjectMeta(name="redis-service", namespace=namespace),
@@ -0,0 +1,85 @@
+import argparse
+import os
+import tempfile
+
+from kubernetes import client, config
+
+from create import STORAGE_CLASS, create_container, create_db, create_logging, create_memcached, extract_remove_memcached_db_containers, get_and_rename_containers, parse_container_ranges, assign_container_jobs
+from kafka_setup import create_kafka, create_zookeeper
+from manifests import APPLY_WORKERS, ManifestRecorder, apply_manifests, namespace_manifest, read_manifests, write_manifests
+from plan_server_setup import deploy_plan_server_environment
+from redis_setup import deploy_redis_environment
+
+# Renders every object of an experiment to one YAML file without a cluster, and applies such a file in
+# bulk. The data insert jobs, the plans and the Kafka topics are not objects of the experiment: create.py
+# runs them once the objects are up (and, since it applies its objects server-side, leaves an applied
+# render as it is).
+
+
+def render_experiment(namespace, storage_class, kafka_external_gateway_nodeport, kafka_replicas, gateway_replicas, renamed_containers, db_values, memcached_values):
+    """
+    Manifests of every object of the experiment, in the order create.py creates them.
+    """
+    recorder = ManifestRecorder()
+    v1 = recorder.api()
+    apps_v1 = recorder.api()
+    rbac_v1 = recorder.api()
+
+    recorder.record(namespace_manifest(namespace))
+    create_zookeeper(v1, apps_v1, namespace)
+    create_kafka(v1, apps_v1, rbac_v1, namespace, kafka_external_gateway_nodeport, kafka_replicas, gateway_replicas)
+    (redis_ip, ) = deploy_redis_environment(namespace, v1, apps_v1)
+    deploy_plan_server_environment(namespace, v1, apps_v1, storage_class)
+    create_logging(v1, apps_v1, namespace, redis_ip, storage_class)
+    for container_keys in memcached_values.values():
+        create_memcached(v1, apps_v1, namespace, storage_class, container_keys)
+    for container_keys in db_values.values():
+        create_db(v1, apps_v1, namespace, storage_class, container_keys)
+    for containerKeys in renamed_containers.values():
+        create_container(v1, apps_v1, namespace, containerKeys, kafka_replicas, redis_ip)
+    return recorder.manifests
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render the objects of an experiment offline, or apply a render in bulk")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    render_parser = subparsers.add_parser("render", help="Render the objects of the compiled plan to a YAML file")
+    render_parser.add_argument("--output", default="manifests.yaml")
+    render_parser.add_argument("--kafka-replicas", type=int, default=1)
+    render_parser.add_argument("--gateway-replicas", type=int, default=1)
+    render_parser.add_argument("--working", default=None, help="Containers that are working, in ranges like 1-5,7-10 (default: all)")
+
+    apply_parser = subparsers.add_parser("apply", help="Server-side apply a rendered YAML file")
+    apply_parser.add_argument("manifests", nargs="?", default="manifests.yaml")
+    apply_parser.add_argument("--workers", type=int, default=APPLY_WORKERS)
+    args = parser.parse_args()
+
+    if args.command == "render":
+        NAMESPACE = os.getenv("KUBERNETES_NAMESPACE", "static-application")
+        KAFKA_EXTERNAL_GATEWAY_NODEPORT = int(os.getenv("KAFKA_EXTERNAL_GATEWAY_NODEPORT", "32092"))
+
+        # The renamed plan goes to a scratch directory, not over the files a running create.py reads
+        with tempfile.TemporaryDirectory() as mapped_directory:
+            renamed_containers, calls, graph = get_and_rename_containers(mappedContainersFile=os.path.join(mapped_directory, "containers_mapped.json"),
+                                                                         mappedCallsFile=os.path.join(mapped_directory, "calls_mapped.jsonl"))
+        db_values, memcached_values = extract_remove_memcached_db_containers(renamed_containers, graph)
+        if args.working is None:
+            renamed_containers = {container: {**renamed_containers[container], "containerJob": 1} for container in renamed_containers}
+        else:
+            renamed_containers = assign_container_jobs(renamed_containers, parse_container_ranges(args.working))
+
+        manifests = render_experiment(NAMESPACE, STORAGE_CLASS, KAFKA_EXTERNAL_GATEWAY_NODEPORT, args.kafka_replicas, args.gateway_replicas,
+                                      renamed_containers, db_values, memcached_values)
+        write_manifests(manifests, args.output)
+        print(f"Rendered {len(manifests)} objects to {args.output}.")
+    else:
+        config.load_kube_config()
+        configuration = client.Configuration.get_default_copy()
+        configuration.connection_pool_maxsize = args.workers
+        client.Configuration.set_default(configuration)
+        apply_manifests(read_manifests(args.manifests), workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+import argparse
+import csv
+import heapq
+import json
+import os
+import tempfile
+from collections import defaultdict
+
+from create import DEFAULT_PLAN_PATH, extract_remove_memcached_db_containers, get_and_rename_containers, split_calls_to_replicas
+
+# Offline discrete-event replay of a plan, to predict the load of a deployment before create.py touches
+# the cluster. Every call is sent by a worker pod at its plan timestamp, reaches the destination service
+# after the network latency of its protocol, waits for a free replica and is served in service_ms; the
+# receiver (or the sender, for mc/db) then posts one log to the logging service. Kafka topics are named
+# after the destination service. All times are in milliseconds.
+DEFAULT_COSTS = {
+    "http": {"latency_ms": 2.0, "service_ms": 1.0},
+    "rpc": {"latency_ms": 1.0, "service_ms": 0.5},
+    "mq": {"latency_ms": 5.0, "service_ms": 0.5},
+    "mc": {"latency_ms": 1.0, "service_ms": 0.2},
+    "db": {"latency_ms": 2.0, "service_ms": 2.0},
+    "logging": {"latency_ms": 1.0}
+}
+
+
+def load_costs(path=None):
+    costs = {protocol: dict(model) for protocol, model in DEFAULT_COSTS.items()}
+    if path:
+        with open(path) as f:
+            for protocol, model in json.load(f).items():
+                costs.setdefault(protocol, {}).update(model)
+    return costs
+
+
+def pod_sends(pod_name, pod_calls):
+    for timestamp in sorted(pod_calls, key=int):
+        for entry in pod_calls[timestamp]:
+            yield int(timestamp), pod_name, entry['dm_service'], entry['communication_type'], entry.get('count', 1)
+
+
+def simulate(pod_plans, replicas, costs, bucket_ms=1000):
+    """
+    Replay the split plans {pod_name: {timestamp: [entries]}} against services with `replicas`
+    ({service: replicas}). Returns the per-bucket time series {metric: {key: {bucket: calls}}} for the
+    metrics 'pod_send', 'service_receive', 'kafka_topic' and 'logging_ingest', and the highest queueing
+    delay of every service.
+    """
+    series = {metric: defaultdict(lambda: defaultdict(int)) for metric in ('pod_send', 'service_receive', 'kafka_topic', 'logging_ingest')}
+    queue_delays = defaultdict(float)
+    servers = {}
+    log_latency = costs.get('logging', {}).get('latency_ms', 0.0)
+
+    sends = heapq.merge(*(pod_sends(pod_name, pod_calls) for pod_name, pod_calls in pod_plans.items()))
+    arrivals = []
+    order = 0
+
+    def next_send():
+        return next(sends, None)
+
+    send = next_send()
+    while send is not None or arrivals:
+        if send is not None and (not arrivals or send[0] <= arrivals[0][0]):
+            timestamp, pod_name, service, protocol, count = send
+            series['pod_send'][pod_name][int(timestamp // bucket_ms)] += count
+            if protocol == 'mq':
+                series['kafka_topic'][service][int(timestamp // bucket_ms)] += count
+            latency = costs.get(protocol, {}).get('latency_ms', 0.0)
+            heapq.heappush(arrivals, (timestamp + latency, order, service, protocol, count))
+            order += 1
+            send = next_send()
+            continue
+
+        # The destination serves every call on the replica that frees up first
+        arrival, _, service, protocol, count = heapq.heappop(arrivals)
+        series['service_receive'][service][int(arrival // bucket_ms)] += count
+        free_at = servers.setdefault(service, [0.0] * max(replicas.get(service, 1), 1))
+        service_ms = costs.get(protocol, {}).get('service_ms', 0.0)
+        for _ in range(count):
+            start = max(arrival, heapq.heappop(free_at))
+            queue_delays[service] = max(queue_delays[service], start - arrival)
+            heapq.heappush(free_at, start + service_ms)
+            series['logging_ingest']['logging-service'][int((start + service_ms + log_latency) // bucket_ms)] += 1
+
+    return series, dict(queue_delays)
+
+
+def rate_summary(buckets, span, bucket_ms):
+    """
+    (mean, peak) calls per second of a series, the mean being taken over the whole replay span (in buckets).
+    """
+    if not buckets:
+        return 0.0, 0.0
+    per_second = 1000 / bucket_ms
+    return sum(buckets.values()) / span * per_second, max(buckets.values()) * per_second
+
+
+def print_report(series, queue_delays, bucket_ms, top=10):
+    titles = {
+        'pod_send': "Send rate by pod",
+        'service_receive': "Receive rate by service",
+        'kafka_topic': "Kafka throughput by topic",
+        'logging_ingest': "Logging service ingest"
+    }
+    all_buckets = [bucket for keys in series.values() for buckets in keys.values() for bucket in buckets]
+    span = max(all_buckets) - min(all_buckets) + 1 if all_buckets else 1
+    print(f"Replay span: {span * bucket_ms / 1000:.1f}s")
+    for metric, title in titles.items():
+        rows = sorted(((key, *rate_summary(buckets, span, bucket_ms)) for key, buckets in series[metric].items()), key=lambda row: -row[2])
+        print(f"{title} (calls/s, top {top} by peak):")
+        for key, mean, peak in rows[:top]:
+            delay = f"  max queueing {queue_delays[key]:.1f}ms" if metric == 'service_receive' and key in queue_delays else ""
+            print(f"  {key:<32} mean {mean:10.1f}  peak {peak:10.1f}{delay}")
+
+
+def write_series(path, series, bucket_ms):
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['metric', 'key', 'time_ms', 'calls'])
+        for metric, keys in series.items():
+            for key, buckets in keys.items():
+                for bucket in sorted(buckets):
+                    writer.writerow([metric, key, bucket * bucket_ms, buckets[bucket]])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Predict the load of a plan replay without deploying it.")
+    parser.add_argument('--plan', default=DEFAULT_PLAN_PATH, help="Plan to replay (default: containers/plan.jsonl).")
+    parser.add_argument('--choice', default='1', choices=['0', '1', '2', '3'],
+                        help="Split of the calls between replicas, as asked by create.py (0 random, 1 round robin, 2 least loaded, 3 trace affinity).")
+    parser.add_argument('--costs', default=None, help="JSON file overriding the per-protocol latency_ms/service_ms cost models.")
+    parser.add_argument('--bucket-ms', type=int, default=1000, help="Width of the time series buckets.")
+    parser.add_argument('--csv', default=None, help="Write the time series to this CSV file.")
+    args = parser.parse_args()
+
+    # The renamed plan goes to a scratch directory, not over the files a running create.py reads
+    with tempfile.TemporaryDirectory() as mapped_directory:
+        renamed_containers, calls, graph = get_and_rename_containers(args.plan, os.path.join(mapped_directory, "containers_mapped.json"),
+                                                                     os.path.join(mapped_directory, "calls_mapped.jsonl"))
+        replicas = {details['mappedName']: details['replicas'] for details in renamed_containers.values()}
+        # Services reached over db/mc become database and cache StatefulSets, which make no calls
+        extract_remove_memcached_db_containers(renamed_containers, graph)
+
+        pod_plans = {}
+        for details in renamed_containers.values():
+            mappedName = details['mappedName']
+            serviceCalls = calls.get(mappedName, {}) if graph.outbound.get(mappedName) else {}
+            pod_plans.update(split_calls_to_replicas(serviceCalls, details['replicas'], mappedName, args.choice))
+
+    series, queue_delays = simulate(pod_plans, replicas, load_costs(args.costs), args.bucket_ms)
+    print_report(series, queue_delays, args.bucket_ms)
+    if args.csv:
+        write_series(args.csv, series, args.bucket_ms)
+        print(f"Time series written to {args.csv}.")
+
+
+if __name__ == '__main__':
+    main()
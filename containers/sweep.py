@@ -0,0 +1,221 @@
+import argparse
+import json
+import os
+import time
+
+import requests
+from kubernetes import client, config
+from kubernetes.client.rest import ApiException
+
+from bringup import BRINGUP_WORKERS, BringUp
+from create import (DEFAULT_PLAN_PATH, STORAGE_CLASS, WORKER_COMPONENT, assign_container_jobs, create_container, create_logging, create_topics, delete_topics,
+                    deploy_db, deploy_kafka, deploy_memcached, deploy_redis, extract_remove_memcached_db_containers, get_and_rename_containers,
+                    load_plans, parse_container_ranges)
+from manifests import ServerSideApplier
+from plan_server_setup import deploy_plan_server_environment
+from redis_setup import clear_start_time_redis, set_start_time_redis
+from utils import WatchCache, get_or_create_namespace, port_forward_and_exec_func, wait_for_pods_ready
+
+# Runs a list of experiment variants back to back without questions. Kafka, Zookeeper, Redis, the plan
+# server and the logging service are brought up once and kept; every run only replaces the worker
+# StatefulSets (and the plans they fetch), then collects the logs of the logging service into
+# <output>/<run name>/. Runs that already have results are skipped, so an interrupted sweep picks up where
+# it stopped.
+RUN_DEFAULTS = {"plan": DEFAULT_PLAN_PATH, "choice": "1", "working": None, "duration": 600, "drain": 30}
+# Every run gets topics and consumer groups of its own, named <prefix><run start>-<service>, so messages a
+# run left in Kafka are not replayed into the next one
+SWEEP_TOPIC_PREFIX = "sweep-"
+# StatefulSets of the databases and caches, by kind
+BACKEND_STATEFULSETS = {"memcached": ("master", "replica"), "db": ("primary", "replica")}
+
+
+def read_sweep_config(path):
+    """
+    The sweep config: shared settings, plus a list of runs whose keys override RUN_DEFAULTS and the
+    top-level keys of the same name.
+    """
+    with open(path) as f:
+        sweep = json.load(f)
+    runs = []
+    for index, run in enumerate(sweep.get("runs", [])):
+        run = {**RUN_DEFAULTS, **{key: sweep[key] for key in RUN_DEFAULTS if key in sweep}, **run}
+        run.setdefault("name", f"run-{index + 1}")
+        runs.append(run)
+    names = [run["name"] for run in runs]
+    if len(set(names)) != len(names):
+        raise ValueError("Every run of the sweep needs its own name")
+    return sweep, runs
+
+
+def remove_workers(apps_v1, v1, namespace):
+    """
+    Delete the worker StatefulSets of the previous run and wait for their pods to be gone.
+    """
+    apps_v1.delete_collection_namespaced_stateful_set(namespace, label_selector=f"component={WORKER_COMPONENT}",
+                                                      propagation_policy='Foreground')
+    # Every remaining worker pod lags until its deletion is seen
+    WatchCache(v1.list_namespaced_pod, namespace, label_selector=f"component={WORKER_COMPONENT}").wait_until(
+        lambda pod: False, "worker pods to terminate")
+
+
+def read_backends(path):
+    """
+    The databases and caches deployed by earlier runs: {mappedName: [original service, kind]}.
+    """
+    if os.path.isfile(path):
+        with open(path) as f:
+            return json.load(f)
+    return {}
+
+
+def remove_backend(apps_v1, v1, namespace, mappedName, kind):
+    """
+    Delete the StatefulSets and the claim of a database or cache and wait for them to be gone, so the
+    backend deployed under the same name starts on an empty volume. Its services are applied over.
+    """
+    for suffix in BACKEND_STATEFULSETS[kind]:
+        try:
+            apps_v1.delete_namespaced_stateful_set(f"{mappedName}-{suffix}", namespace, propagation_policy='Foreground')
+        except ApiException as e:
+            if e.status != 404:
+                raise
+    WatchCache(v1.list_namespaced_pod, namespace, label_selector=f"app={mappedName}").wait_until(
+        lambda pod: False, f"pods of the {kind} '{mappedName}' to terminate")
+    try:
+        v1.delete_namespaced_persistent_volume_claim(f"{mappedName}-pvc", namespace)
+    except ApiException as e:
+        if e.status != 404:
+            raise
+    WatchCache(v1.list_namespaced_persistent_volume_claim, namespace, field_selector=f"metadata.name={mappedName}-pvc").wait_until(
+        lambda pvc: False, f"claim of the {kind} '{mappedName}' to be deleted")
+
+
+def reset_logging(data):
+    response = requests.post(f"http://localhost:{data['local_port']}/reset")
+    response.raise_for_status()
+    print("Logging service reset.")
+
+
+def save_logs(data):
+    response = requests.get(f"http://localhost:{data['local_port']}/logs")
+    response.raise_for_status()
+    with open(data['path'], 'w') as f:
+        f.write(response.text)
+    print(f"Logs saved to {data['path']}.")
+
+
+def run_variant(run, run_directory, namespace, v1, apps_v1, batch_v1, kafka_environment, redis_ip, backends, nodeport, node_ip):
+    """
+    Swap the workers for the ones of `run`, replay it and collect its logs.
+    """
+    renamed_containers, calls, graph = get_and_rename_containers(run["plan"])
+    db_values, memcached_values = extract_remove_memcached_db_containers(renamed_containers, graph)
+    if run["working"] is None:
+        renamed_containers = {container: {**renamed_containers[container], "containerJob": 1} for container in renamed_containers}
+    else:
+        renamed_containers = assign_container_jobs(renamed_containers, parse_container_ranges(run["working"]))
+
+    # The workers of the previous run stop before the start time and the logs are cleared, then the topics
+    # of the previous runs, which nothing consumes any more, are deleted
+    remove_workers(apps_v1, v1, namespace)
+    delete_topics(namespace, kafka_environment, SWEEP_TOPIC_PREFIX, nodeport, node_ip)
+    port_forward_and_exec_func(namespace, redis_ip, 60892, 6379, funcToExec=clear_start_time_redis)
+    port_forward_and_exec_func(namespace, "logging-service", 60893, 80, funcToExec=reset_logging)
+
+    swap_start = time.time()
+    topic_prefix = f"{SWEEP_TOPIC_PREFIX}{int(swap_start)}-"
+    bringup = BringUp()
+    plans = bringup.add("plans", lambda: load_plans(v1, namespace, renamed_containers, calls, graph, run["choice"]))
+    topics = bringup.add("topics", lambda: create_topics(namespace, kafka_environment, renamed_containers, nodeport, node_ip, topic_prefix))
+    # Databases and caches hold data, so they are only deployed again when their name now stands for
+    # another service or kind (runs of other plans map names on their own)
+    wanted = {container_keys['mappedName']: [service_name, kind]
+              for kind, values in (("memcached", memcached_values), ("db", db_values)) for service_name, container_keys in values.items()}
+    worker_names = {containerKeys['mappedName'] for containerKeys in renamed_containers.values()}
+    for mappedName, (service_name, kind) in list(backends.items()):
+        if mappedName in worker_names or wanted.get(mappedName, [service_name, kind]) != [service_name, kind]:
+            remove_backend(apps_v1, v1, namespace, mappedName, kind)
+            del backends[mappedName]
+    deploy_backend = {"memcached": deploy_memcached, "db": deploy_db}
+    for kind, values in (("memcached", memcached_values), ("db", db_values)):
+        for service_name, container_keys in values.items():
+            if container_keys['mappedName'] in backends:
+                continue
+
+            def deploy(kind=kind, service_name=service_name, container_keys=container_keys):
+                deploy_backend[kind](v1, apps_v1, batch_v1, namespace, STORAGE_CLASS, container_keys)
+                backends[container_keys['mappedName']] = [service_name, kind]
+            bringup.add(f"{kind} {container_keys['mappedName']}", deploy)
+    for containerKeys in renamed_containers.values():
+        bringup.add(f"container {containerKeys['mappedName']}", lambda containerKeys=containerKeys: create_container(v1, apps_v1, namespace, containerKeys, kafka_environment[0], redis_ip, topic_prefix), after=[plans, topics])
+    try:
+        bringup.run()
+    finally:
+        with open(os.path.join(os.path.dirname(run_directory), "backends.json"), 'w') as f:
+            json.dump(backends, f, indent=4)
+    wait_for_pods_ready(v1, apps_v1, namespace)
+    swap_seconds = time.time() - swap_start
+
+    port_forward_and_exec_func(namespace, redis_ip, 60892, 6379, funcToExec=set_start_time_redis)
+    started = time.time()
+    print(f"Run '{run['name']}' started, collecting its logs in {run['duration'] + run['drain']}s.")
+    time.sleep(run['duration'] + run['drain'])
+
+    os.makedirs(run_directory, exist_ok=True)
+    port_forward_and_exec_func(namespace, "logging-service", 60893, 80, funcToExec=save_logs, data={'path': os.path.join(run_directory, "request_logs.csv")})
+    with open(os.path.join(run_directory, "run.json"), 'w') as f:
+        json.dump({**run, "started": started, "swap_seconds": swap_seconds, "workers": len(renamed_containers), "topic_prefix": topic_prefix}, f, indent=4)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a sweep of experiment variants on shared infrastructure")
+    parser.add_argument("config", help="JSON file with the shared settings and the list of runs")
+    parser.add_argument("--output", default=None, help="Directory of the results (default: the output of the config, or sweep_results)")
+    args = parser.parse_args()
+
+    sweep, runs = read_sweep_config(args.config)
+    output = args.output or sweep.get("output", "sweep_results")
+    NAMESPACE = sweep.get("namespace", os.getenv("KUBERNETES_NAMESPACE", "static-application"))
+    KAFKA_EXTERNAL_GATEWAY_NODEPORT = int(os.getenv("KAFKA_EXTERNAL_GATEWAY_NODEPORT", "32092"))
+    NODE_IP = os.getenv("NODE_IP", "localhost")
+
+    config.load_kube_config()
+    configuration = client.Configuration.get_default_copy()
+    configuration.connection_pool_maxsize = BRINGUP_WORKERS
+    client.Configuration.set_default(configuration)
+    applier = ServerSideApplier()
+    v1 = applier.api(client.CoreV1Api())
+    apps_v1 = applier.api(client.AppsV1Api())
+    rbac_v1 = applier.api(client.RbacAuthorizationV1Api())
+    batch_v1 = applier.api(client.BatchV1Api())
+
+    get_or_create_namespace(v1, NAMESPACE)
+
+    # Shared infrastructure, applied once (and left as it is when it is already up)
+    bringup = BringUp()
+    kafka = bringup.add("kafka", lambda: deploy_kafka(NAMESPACE, v1, apps_v1, rbac_v1, KAFKA_EXTERNAL_GATEWAY_NODEPORT, sweep.get("kafka_replicas", 1), sweep.get("gateway_replicas", 1)))
+    redis = bringup.add("redis", lambda: deploy_redis(NAMESPACE, v1, apps_v1))
+    bringup.add("plan-server", lambda: deploy_plan_server_environment(NAMESPACE, v1, apps_v1, STORAGE_CLASS))
+    bringup.add("logging", lambda: create_logging(v1, apps_v1, NAMESPACE, bringup.results[redis], STORAGE_CLASS), after=[redis])
+    bringup.run()
+    wait_for_pods_ready(v1, apps_v1, NAMESPACE)
+
+    # Kept next to the results, so a resumed sweep knows what the namespace holds
+    os.makedirs(output, exist_ok=True)
+    backends = read_backends(os.path.join(output, "backends.json"))
+    for index, run in enumerate(runs, 1):
+        run_directory = os.path.join(output, run["name"])
+        if os.path.isfile(os.path.join(run_directory, "run.json")):
+            print(f"[sweep {index}/{len(runs)}] {run['name']} already has results, skipping it.")
+            continue
+        print(f"[sweep {index}/{len(runs)}] {run['name']}: {json.dumps(run)}")
+        run_variant(run, run_directory, NAMESPACE, v1, apps_v1, batch_v1, bringup.results[kafka], bringup.results[redis], backends,
+                    KAFKA_EXTERNAL_GATEWAY_NODEPORT, NODE_IP)
+
+    remove_workers(apps_v1, v1, NAMESPACE)
+    delete_topics(NAMESPACE, bringup.results[kafka], SWEEP_TOPIC_PREFIX, KAFKA_EXTERNAL_GATEWAY_NODEPORT, NODE_IP)
+    print(f"Sweep done, results in {output}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,52 +2,114 @@ import json
 import re
 import threading
 import time
-from kubernetes import client, config
+from kubernetes import client, config, watch
 import signal
 import os
 import subprocess
 from kubernetes.client.rest import ApiException
 import asyncio
 
-def wait_for_pods_ready(namespace):
-    config.load_kube_config()
-    v1 = client.CoreV1Api()
-    apps_v1 = client.AppsV1Api()
+WATCH_REPORT_INTERVAL = 10  # Seconds between two reports of the objects a wait is still lagging on
 
-    def are_all_pods_ready(pods):
-        return all(pod.status.phase == 'Running' for pod in pods)
 
-    def are_all_deployments_ready():
-        try:
-            deployments = apps_v1.list_namespaced_deployment(namespace)
-            for deployment in deployments.items:
-                if deployment.status.replicas != deployment.status.ready_replicas:
-                    return False
-            return True
-        except ApiException as e:
-            print(f"Exception when listing deployments: {e}")
-            return False
-
-    def are_all_statefulsets_ready():
-        try:
-            statefulsets = apps_v1.list_namespaced_stateful_set(namespace)
-            for statefulset in statefulsets.items:
-                if statefulset.status.replicas != statefulset.status.ready_replicas:
-                    return False
-            return True
-        except ApiException as e:
-            print(f"Exception when listing statefulsets: {e}")
-            return False
+class WatchCache:
+    """
+    Informer-style local cache of the objects of one kind in a namespace: listed once, then kept up to date
+    from watch events, so waiting on thousands of objects costs one list and a stream of changes instead
+    of a list every few seconds.
+    """
 
-    while True:
-        # Check if all pods are running
-        pods = v1.list_namespaced_pod(namespace)
-        if are_all_pods_ready(pods.items) and are_all_deployments_ready() and are_all_statefulsets_ready():
-            print("All pods, deployments, and statefulsets are ready.")
-            break
-        
-        print("Waiting for all pods, deployments, and statefulsets to be ready...")
-        time.sleep(3)
+    def __init__(self, list_func, namespace, **list_kwargs):
+        self.list_func = list_func
+        self.namespace = namespace
+        self.list_kwargs = list_kwargs
+        self.objects = {}
+        self.resource_version = None
+
+    def relist(self):
+        result = self.list_func(self.namespace, **self.list_kwargs)
+        self.objects = {item.metadata.name: item for item in result.items}
+        self.resource_version = result.metadata.resource_version
+
+    def wait_until(self, is_done, description, names=None, timeout=None, report_interval=WATCH_REPORT_INTERVAL):
+        """
+        Wait until is_done(object) holds for every cached object and every object of `names` exists.
+        Returns as soon as the last object gets there, printing the lagging ones every report_interval
+        seconds. Returns the cached objects {name: object}.
+        """
+        def lagging_objects():
+            lagging = {name for name, item in self.objects.items() if not is_done(item)}
+            return lagging | {name for name in names or () if name not in self.objects}
+
+        self.relist()
+        lagging = lagging_objects()
+        deadline = None if timeout is None else time.time() + timeout
+        last_report = time.time()
+        while lagging:
+            if deadline is not None and time.time() > deadline:
+                raise TimeoutError(f"Timed out waiting for {len(lagging)} {description}: {', '.join(sorted(lagging))}")
+            stream = watch.Watch()
+            try:
+                for event in stream.stream(self.list_func, self.namespace, resource_version=self.resource_version,
+                                           timeout_seconds=report_interval, **self.list_kwargs):
+                    item = event['object']
+                    name = item.metadata.name
+                    self.resource_version = item.metadata.resource_version
+                    if event['type'] == 'DELETED':
+                        self.objects.pop(name, None)
+                        if not names or name not in names:
+                            lagging.discard(name)
+                    else:
+                        self.objects[name] = item
+                        if is_done(item):
+                            lagging.discard(name)
+                        else:
+                            lagging.add(name)
+                    if not lagging:
+                        stream.stop()
+                        break
+            except ApiException as e:
+                # The resource version expired: start again from a fresh list
+                if e.status != 410:
+                    raise
+                self.relist()
+                lagging = lagging_objects()
+
+            if lagging and time.time() - last_report >= report_interval:
+                shown = sorted(lagging)[:10]
+                more = f" and {len(lagging) - len(shown)} more" if len(lagging) > len(shown) else ""
+                print(f"Waiting for {len(lagging)} {description}: {', '.join(shown)}{more}")
+                last_report = time.time()
+        return self.objects
+
+
+def pod_is_running(pod):
+    return pod.status.phase == 'Running'
+
+def workload_is_ready(workload):
+    # Deployments and StatefulSets, compared with the desired replicas so a new workload is not ready yet
+    return (workload.status.ready_replicas or 0) == workload.spec.replicas
+
+def job_is_complete(job):
+    return bool(job.status.succeeded)
+
+def job_is_finished(job):
+    return bool(job.status.succeeded or job.status.failed)
+
+def wait_for_pods_ready(v1, apps_v1, namespace):
+    # Workloads first: once they are ready, their pods are running and the last wait returns at once
+    WatchCache(apps_v1.list_namespaced_deployment, namespace).wait_until(workload_is_ready, "deployments to be ready")
+    WatchCache(apps_v1.list_namespaced_stateful_set, namespace).wait_until(workload_is_ready, "statefulsets to be ready")
+    WatchCache(v1.list_namespaced_pod, namespace).wait_until(pod_is_running, "pods to be running")
+    print("All pods, deployments, and statefulsets are ready.")
+
+def wait_for_statefulset_ready(apps_v1, namespace, name):
+    WatchCache(apps_v1.list_namespaced_stateful_set, namespace, field_selector=f"metadata.name={name}").wait_until(
+        workload_is_ready, f"statefulset '{name}' to be ready", names={name})
+
+def wait_for_deployment_ready(apps_v1, namespace, name):
+    WatchCache(apps_v1.list_namespaced_deployment, namespace, field_selector=f"metadata.name={name}").wait_until(
+        workload_is_ready, f"deployment '{name}' to be ready", names={name})
 
 def wait_for_service_ready(service_name, namespace):
     # Load kube config and create a client
@@ -97,11 +159,7 @@ def kill_process_on_port(local_port):
     except subprocess.CalledProcessError:
         print(f'No process found using port {local_port}')
 
-def get_or_create_namespace(namespace):
-    # Load kube config and create a client
-    config.load_kube_config()
-    v1 = client.CoreV1Api()
-
+def get_or_create_namespace(v1, namespace):
     try:
         v1.read_namespace(name=namespace)
         print(f"Namespace '{namespace}' already exists.")
@@ -226,37 +284,16 @@ def wait_for_job_completion(batch_v1, namespace, job_name):
     """
     Wait for a specific Kubernetes Job to complete.
     """
-    while True:
-        job_status = batch_v1.read_namespaced_job_status(job_name, namespace)
-        if job_status.status.succeeded == 1:
-            print(f"Job '{job_name}' completed successfully.")
-            break
-        elif job_status.status.failed:
-            print(f"Job '{job_name}' failed.")
-            break
-        time.sleep(2)  # Check every 2 seconds
+    jobs = WatchCache(batch_v1.list_namespaced_job, namespace, field_selector=f"metadata.name={job_name}")
+    job = jobs.wait_until(job_is_finished, f"job '{job_name}' to finish", names={job_name})[job_name]
+    if job.status.succeeded:
+        print(f"Job '{job_name}' completed successfully.")
+    else:
+        print(f"Job '{job_name}' failed.")
 
 def wait_for_all_jobs_to_complete(batch_v1, namespace):
-    while True:
-        # List all Jobs in the specified namespace
-        jobs = batch_v1.list_namespaced_job(namespace=namespace)
-        all_jobs_completed = True
-        
-        for job in jobs.items:
-            job_name = job.metadata.name
-            job_status = job.status
-            
-            # Check if the job is completed
-            if job_status.succeeded is None or job_status.succeeded == 0:
-                print(f"Job '{job_name}' is not completed yet.")
-                all_jobs_completed = False
-        
-        if all_jobs_completed:
-            print("All jobs are completed.")
-            return
-        
-        print("Waiting for all jobs to complete...")
-        time.sleep(3)  # Sleep for 3 seconds before checking again
+    WatchCache(batch_v1.list_namespaced_job, namespace).wait_until(job_is_complete, "jobs to complete")
+    print("All jobs are completed.")
 
 def delete_completed_jobs(batch_v1, v1_core, namespace):
     while True:
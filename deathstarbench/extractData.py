@@ -1,8 +1,14 @@
+import argparse
+import os
+import sys
+import time
 import requests
 import datetime
 import json
-import tkinter as tk
-from tkinter import filedialog
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_JAEGER_URL = 'http://localhost:16686'
+DEFAULT_STATE_PATH = 'jaeger_state.json'
 
 # Function to fetch traces from Jaeger's API
 def fetch_traces(service_name, jaeger_host='localhost', jaeger_port=16686):
@@ -11,16 +17,116 @@ def fetch_traces(service_name, jaeger_host='localhost', jaeger_port=16686):
     response.raise_for_status()
     return response.json()
 
+def fetch_services(session, jaeger_url):
+    """Return the names of all services known to Jaeger."""
+    response = session.get(f"{jaeger_url}/api/services")
+    response.raise_for_status()
+    return sorted(response.json()['data'] or [])
+
+def fetch_trace_window(session, jaeger_url, service_name, start, end, limit):
+    """Fetch the traces of a service that started in [start, end] (microseconds since the epoch)."""
+    params = {'service': service_name, 'start': start, 'end': end, 'limit': limit}
+    response = session.get(f"{jaeger_url}/api/traces", params=params)
+    response.raise_for_status()
+    return response.json()['data'] or []
+
+def fetch_service_traces(jaeger_url, service_name, since, until, window, limit, min_window=1_000):
+    """
+    Page through [since, until) in windows of `window` microseconds. A window that returns `limit`
+    traces may have been truncated by Jaeger, so it is split in half and fetched again until it fits
+    (or is down to min_window).
+    """
+    traces = []
+    pending = [(start, min(start + window, until)) for start in range(since, until, window)]
+    with requests.Session() as session:
+        while pending:
+            start, end = pending.pop(0)
+            window_traces = fetch_trace_window(session, jaeger_url, service_name, start, end - 1, limit)
+            if len(window_traces) >= limit and end - start > min_window:
+                middle = (start + end) // 2
+                pending[:0] = [(start, middle), (middle, end)]
+                continue
+            traces.extend(window_traces)
+    print(f"Fetched {len(traces)} traces for service '{service_name}'.")
+    return service_name, traces
+
+def load_fetch_state(state_path):
+    if os.path.isfile(state_path):
+        with open(state_path) as f:
+            return json.load(f)
+    return {"min_timestamp": None, "services": {}}
+
+def save_fetch_state(state, state_path):
+    with open(state_path, 'w') as f:
+        json.dump(state, f, indent=4)
+
+def fetch_new_traces(jaeger_url=DEFAULT_JAEGER_URL, services=None, output_path='traces.json', state_path=DEFAULT_STATE_PATH,
+                     lookback=3_600_000_000, window=60_000_000, limit=1_000, workers=8):
+    """
+    Fetch every service (or the given ones) concurrently from Jaeger and append the spans that are
+    newer than the last run to output_path in the convert_traces_to_custom_format format.
+
+    The state file remembers the end of the window fetched per service and the timestamp the relative
+    timestamps are based on, so re-runs only pull new spans and stay on the same time base. A trace
+    that was still in flight is returned again by a later run; only its spans that are not in
+    output_path yet are appended. Times are in microseconds; lookback bounds how far back a service
+    without state is fetched.
+    """
+    state = load_fetch_state(state_path)
+    incremental = bool(state['services'])
+    until = time.time_ns() // 1_000
+
+    if not services:
+        with requests.Session() as session:
+            services = [service for service in fetch_services(session, jaeger_url) if service != 'jaeger-query']
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(fetch_service_traces, jaeger_url, service, state['services'].get(service, until - lookback - 1) + 1, until, window, limit)
+            for service in services
+        ]
+        results = [future.result() for future in futures]
+
+    # The same trace is returned for every service it touches, keep one copy of each
+    traces = {}
+    for service_name, service_traces in results:
+        for trace in service_traces:
+            traces.setdefault(trace['traceID'], trace)
+        # Every service was fetched up to `until`; spans of other services that started later are
+        # fetched again with their own service
+        state['services'][service_name] = until - 1
+
+    # Append to the output of the previous runs, without the spans it already holds (every span is
+    # written once, with its spanID as 'dm')
+    existing_traces = []
+    if incremental and os.path.isfile(output_path):
+        with open(output_path) as f:
+            existing_traces = json.load(f)
+    written_spans = {span['dm'] for span in existing_traces}
+    for trace in traces.values():
+        trace['spans'] = [span for span in trace['spans'] if span['spanID'] not in written_spans]
+
+    formatted_traces = []
+    if any(trace['spans'] for trace in traces.values()):
+        if state['min_timestamp'] is None:
+            state['min_timestamp'] = min(span['startTime'] for trace in traces.values() for span in trace['spans'])
+        formatted_traces = convert_traces_to_custom_format({'data': list(traces.values())}, state['min_timestamp'])
+    save_traces_to_file(existing_traces + formatted_traces, output_path)
+    save_fetch_state(state, state_path)
+    print(f"Fetched {len(traces)} new traces ({len(formatted_traces)} spans) from {len(services)} services.")
+    return formatted_traces
+
 # Function to read traces from a JSON file
 def read_traces_from_file(file_path):
     with open(file_path, 'r') as file:
         return json.load(file)
 
-def convert_traces_to_custom_format(traces):
+def convert_traces_to_custom_format(traces, min_timestamp=None):
     formatted_data = []
 
     # Find the smallest timestamp
-    min_timestamp = min(span['startTime'] for trace in traces['data'] for span in trace['spans'])
+    if min_timestamp is None:
+        min_timestamp = min(span['startTime'] for trace in traces['data'] for span in trace['spans'])
 
     for trace in traces['data']:
         for span in trace['spans']:
@@ -51,6 +157,9 @@ def save_traces_to_file(formatted_traces, file_path='traces.json'):
 
 # Function to open a file dialog and get the selected file path
 def get_file_path():
+    import tkinter as tk
+    from tkinter import filedialog
+
     root = tk.Tk()
     root.withdraw()  # Hide the root window
     file_path = filedialog.askopenfilename(title="Select a trace file", filetypes=[("JSON files", "*.json"), ("All files", "*.*")])
@@ -91,4 +200,21 @@ def main():
             print("Invalid choice. Please choose 1, 2, or 3.")
 
 if __name__ == "__main__":
-    main()
+    if len(sys.argv) > 1:
+        # Non-interactive: python extractData.py fetch [--jaeger-url ...] [--services ...]
+        parser = argparse.ArgumentParser(description="Fetch traces from Jaeger into traces.json.")
+        subparsers = parser.add_subparsers(dest='command', required=True)
+        fetch_parser = subparsers.add_parser('fetch', help="Fetch new traces of every service concurrently.")
+        fetch_parser.add_argument('--jaeger-url', default=DEFAULT_JAEGER_URL)
+        fetch_parser.add_argument('--services', nargs='*', help="Services to fetch (default: all services known to Jaeger).")
+        fetch_parser.add_argument('--output', default='traces.json')
+        fetch_parser.add_argument('--state', default=DEFAULT_STATE_PATH, help="File remembering the last fetched timestamp per service.")
+        fetch_parser.add_argument('--lookback', type=int, default=3600, help="Seconds fetched for a service seen for the first time.")
+        fetch_parser.add_argument('--window', type=int, default=60, help="Seconds per paged request.")
+        fetch_parser.add_argument('--limit', type=int, default=1000, help="Traces per request; full windows are split and fetched again.")
+        fetch_parser.add_argument('--workers', type=int, default=8)
+        args = parser.parse_args()
+        fetch_new_traces(args.jaeger_url.rstrip('/'), args.services, args.output, args.state,
+                         args.lookback * 1_000_000, args.window * 1_000_000, args.limit, args.workers)
+    else:
+        main()
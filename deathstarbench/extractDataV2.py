@@ -1,45 +1,131 @@
+import argparse
 import json
+import os
+import re
+import tempfile
 
 # Load the JSON data from the uploaded file
 file_path = './data/deathstarbench.json'
 output_calls_path = 'traces.json'
 
-def extract_data(file_path, output_calls_path):
-    with open(file_path, 'r') as file:
-        data = json.load(file)
+READ_SIZE = 1 << 16
+WHITESPACE = ' \t\r\n'
+
+
+def iter_json_array(file, key='data'):
+    """
+    Incrementally yield the items of the top level array `key` of a JSON document
+    ({"data": [trace, trace, ...], ...} for Jaeger exports) so only one item is held in memory.
+    """
+    decoder = json.JSONDecoder()
+    array_start = re.compile(r'"' + re.escape(key) + r'"\s*:\s*\[')
+    buffer = ''
+
+    # Find the opening bracket of the array
+    while True:
+        match = array_start.search(buffer)
+        if match:
+            buffer = buffer[match.end():]
+            break
+        data = file.read(READ_SIZE)
+        if not data:
+            raise ValueError(f"Array '{key}' not found in the JSON document")
+        # Keep a tail in case the key is split across two reads
+        buffer = buffer[-len(key) - 16:] + data
+
+    position = 0
+    eof = False
+    while True:
+        while position < len(buffer) and buffer[position] in WHITESPACE + ',':
+            position += 1
+        if position < len(buffer) and buffer[position] == ']':
+            return
+        try:
+            item, end = decoder.raw_decode(buffer, position)
+            # A number may go on in the next read ("-3." decodes as -3): the item is complete once it is
+            # followed by a separator of the array
+            complete = eof or (end < len(buffer) and buffer[end] in WHITESPACE + ',]')
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            complete = False
+        if not complete:
+            # The item is not fully buffered yet: drop what was consumed and read at least as much
+            # again as is buffered, so a large item is re-parsed only a logarithmic number of times
+            buffer = buffer[position:]
+            position = 0
+            data = file.read(max(READ_SIZE, len(buffer)))
+            eof = not data
+            buffer += data
+            continue
+        yield item
+        position = end
+
+
+def extract_trace_calls(trace):
+    """
+    Yield (upstream_service, downstream_service, start_time, duration) for every CHILD_OF reference of
+    a trace whose parent span is part of the trace. Parents are looked up in a spanID index.
+    """
+    processes = trace['processes']
+    parents = {}
+    for span in trace['spans']:
+        parents.setdefault(span['spanID'], []).append(span['processID'])
+
+    for span in trace['spans']:
+        upstream_service = processes[span['processID']]['serviceName']
+        for ref in span['references']:
+            if ref['refType'] != 'CHILD_OF':
+                continue
+            for parent_process_id in parents.get(ref['spanID'], ()):
+                downstream_service = processes[parent_process_id]['serviceName']
+                yield upstream_service, downstream_service, span['startTime'], span['duration']
 
-    # Extract the global minimum timestamp
+
+def write_json_list(items, file):
+    """
+    Write items the way json.dump(list(items), file, indent=4) would, without building the list.
+    """
+    first = True
+    for item in items:
+        file.write('[\n    ' if first else ',\n    ')
+        file.write(json.dumps(item, indent=4).replace('\n', '\n    '))
+        first = False
+    file.write('[]' if first else '\n]')
+
+
+def extract_data(file_path, output_calls_path):
+    # Single pass over the traces: calls are spooled with absolute timestamps while the global
+    # minimum timestamp is tracked, then normalized while being written out
     min_timestamp = float('inf')
-    for trace in data['data']:
-        for span in trace['spans']:
-            for ref in span['references']:
-                if ref['refType'] == 'CHILD_OF':
-                    for parent_span in trace['spans']:
-                        if parent_span['spanID'] == ref['spanID']:
-                            if span['startTime'] < min_timestamp:
-                                min_timestamp = span['startTime']
-    print(min_timestamp) 
-    # Extract calls and normalize timestamps
-    calls = []
-    for trace in data['data']:
-        for span in trace['spans']:
-            upstream_service = trace['processes'][span['processID']]['serviceName']
-            for ref in span['references']:
-                if ref['refType'] == 'CHILD_OF':
-                    for parent_span in trace['spans']:
-                        if parent_span['spanID'] == ref['spanID']:
-                            downstream_service = trace['processes'][parent_span['processID']]['serviceName']
-                            print(span['startTime'], min_timestamp, span['startTime'] - min_timestamp)
-                            call = {
-                                "um": upstream_service,
-                                "dm": downstream_service,
-                                "timestamp": span['startTime'] - min_timestamp,
-                                "duration": span['duration']
-                            }
-                            calls.append(call)
-
-    # Write calls to calls.json
-    with open(output_calls_path, 'w') as file:
-        json.dump(calls, file, indent=4)
-
-extract_data(file_path, output_calls_path)
\ No newline at end of file
+    output_dir = os.path.dirname(os.path.abspath(output_calls_path))
+
+    with tempfile.TemporaryFile('w+', dir=output_dir) as spool:
+        with open(file_path, 'r') as file:
+            for trace in iter_json_array(file, 'data'):
+                for call in extract_trace_calls(trace):
+                    min_timestamp = min(min_timestamp, call[2])
+                    spool.write(json.dumps(call) + '\n')
+        print(min_timestamp)
+
+        spool.seek(0)
+        calls = (
+            {
+                "um": upstream_service,
+                "dm": downstream_service,
+                "timestamp": start_time - min_timestamp,
+                "duration": duration
+            }
+            for upstream_service, downstream_service, start_time, duration in map(json.loads, spool)
+        )
+        # Write calls to calls.json
+        with open(output_calls_path, 'w') as file:
+            write_json_list(calls, file)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Extract service to service calls from a Jaeger JSON export.")
+    parser.add_argument('file_path', nargs='?', default=file_path, help="Jaeger export to read.")
+    parser.add_argument('output_calls_path', nargs='?', default=output_calls_path, help="Where the calls are written.")
+    args = parser.parse_args()
+    extract_data(args.file_path, args.output_calls_path)
@@ -1,36 +1,15 @@
 import json
+import os
+import sys
 
-def convertJSON(data):
-    containers = []
-    result = {}
-    for row in data:  
-        timestamp = row['timestamp']
-        um = row['um']
-        dm = row['dm']
-        rpctype = 'http'
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from trace_compiler import DEFAULT_PLAN_PATH, PlanCache, cache_key, cached_plan, compile_trace, read_jaeger_calls, write_plan
 
-        if '?' in um or '?' in dm:
-            continue
-        if um not in containers:
-            containers.append(um)
-        if dm not in containers:
-            containers.append(dm)
-
-        if um not in result:
-            result[um] = {}
-
-        if timestamp not in result[um]:
-            result[um][timestamp] = []
-        result[um][timestamp].append({
-            "dm_service": dm,
-            "communication_type": rpctype
-        })
-    
-    with open('../containers/calls.json', 'w') as f:
-        json.dump(result, f)
-    # containers.append(containers.pop(0))
-    with open('../containers/containers.txt', 'w') as f:
-        f.writelines(f"{container}\n" for container in containers)
+def convertJSON(data, plan_path=DEFAULT_PLAN_PATH):
+    # Every call is replayed over http and every service gets one replica
+    trace = read_jaeger_calls(data)
+    containers, result = compile_trace(trace)
+    write_plan(plan_path, containers, result, trace.source)
 
 def read_json_from_file(file_path):
     try:
@@ -44,9 +23,13 @@ def read_json_from_file(file_path):
         print(f"Error decoding JSON from the file: {file_path}")
 
 def main():
-    data = read_json_from_file('traces.json')
-    convertJSON(data)
+    file_path = 'traces.json'
+    if not os.path.exists(file_path):
+        print(f"File not found: {file_path}")
+        return
+    # Re-running on the same traces.json restores the plan from the cache instead of converting again
+    key = cache_key([file_path], {"source": "jaeger"})
+    cached_plan(PlanCache(), key, DEFAULT_PLAN_PATH, lambda plan_path: convertJSON(read_json_from_file(file_path), plan_path))
 
 if __name__ == "__main__":
     main()
-
@@ -0,0 +1,76 @@
+import argparse
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Minimal stand-in for the Jaeger query API (/api/services and /api/traces) serving a Jaeger JSON
+# export, so extractData.py fetch can be run without a Jaeger deployment.
+
+
+def trace_services(trace):
+    return {process['serviceName'] for process in trace['processes'].values()}
+
+
+def trace_start(trace):
+    return min(span['startTime'] for span in trace['spans'])
+
+
+def make_handler(traces, time_shift=0):
+    services = sorted({service for trace in traces for service in trace_services(trace)})
+
+    class JaegerStubHandler(BaseHTTPRequestHandler):
+        def send_json(self, data, status=200):
+            body = json.dumps({"data": data, "total": len(data), "limit": 0, "offset": 0, "errors": None}).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = {key: values[0] for key, values in parse_qs(url.query).items()}
+            if url.path == '/api/services':
+                self.send_json(services)
+            elif url.path == '/api/traces':
+                service = query.get('service')
+                start = int(query.get('start', 0)) - time_shift
+                end = int(query.get('end', 2 ** 63)) - time_shift
+                limit = int(query.get('limit', 20))
+                matches = [
+                    trace for trace in traces
+                    if service in trace_services(trace) and start <= trace_start(trace) <= end
+                ][:limit]
+                self.send_json([shift_trace(trace, time_shift) for trace in matches])
+            else:
+                self.send_json([], status=404)
+
+        def log_message(self, format, *args):
+            pass
+
+    return JaegerStubHandler
+
+
+def shift_trace(trace, time_shift):
+    if not time_shift:
+        return trace
+    return {**trace, 'spans': [{**span, 'startTime': span['startTime'] + time_shift} for span in trace['spans']]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a Jaeger JSON export over the Jaeger query API.")
+    parser.add_argument('export', nargs='?', default='./data/deathstarbench.json')
+    parser.add_argument('--port', type=int, default=16686)
+    parser.add_argument('--time-shift', type=int, default=0,
+                        help="Microseconds added to every span start time, e.g. to move an old export into the fetch lookback.")
+    args = parser.parse_args()
+
+    with open(args.export) as f:
+        traces = json.load(f)['data']
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), make_handler(traces, args.time_shift))
+    print(f"Serving {len(traces)} traces on http://127.0.0.1:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+import json
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+import extractData
+from stub_jaeger import make_handler
+
+TRACE_COUNT = 40
+
+
+def make_traces(now):
+    """Traces of two spans (compose -> storage), one per second over the last TRACE_COUNT seconds."""
+    processes = {'p1': {'serviceName': 'compose-post-service'}, 'p2': {'serviceName': 'post-storage-service'}}
+    traces = []
+    for index in range(TRACE_COUNT):
+        trace_id = f"trace{index:04d}"
+        start = now - (index + 1) * 1_000_000
+        traces.append({
+            'traceID': trace_id,
+            'processes': processes,
+            'spans': [
+                {'traceID': trace_id, 'spanID': f"{trace_id}-root", 'processID': 'p1', 'references': [],
+                 'startTime': start, 'duration': 900},
+                {'traceID': trace_id, 'spanID': f"{trace_id}-child", 'processID': 'p2',
+                 'references': [{'refType': 'CHILD_OF', 'traceID': trace_id, 'spanID': f"{trace_id}-root"}],
+                 'startTime': start + 100, 'duration': 500},
+            ],
+        })
+    return traces
+
+
+@pytest.fixture
+def jaeger_url():
+    traces = make_traces(time.time_ns() // 1_000)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(traces))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_fetch_is_incremental(jaeger_url, tmp_path, monkeypatch):
+    output_path = tmp_path / 'traces.json'
+    state_path = tmp_path / 'jaeger_state.json'
+    requested_windows = []
+    fetch_trace_window = extractData.fetch_trace_window
+
+    def counting_fetch_trace_window(session, url, service_name, start, end, limit):
+        requested_windows.append((service_name, start, end))
+        return fetch_trace_window(session, url, service_name, start, end, limit)
+    monkeypatch.setattr(extractData, 'fetch_trace_window', counting_fetch_trace_window)
+
+    # One window of the whole lookback holds more traces than the limit, so it has to be split
+    fetch_options = dict(lookback=3_600_000_000, window=3_600_000_000, limit=5, workers=2)
+    first = extractData.fetch_new_traces(jaeger_url, output_path=str(output_path), state_path=str(state_path), **fetch_options)
+
+    assert len(requested_windows) > 2
+    assert len(first) == 2 * TRACE_COUNT
+    assert {span['dm'] for span in first} == {f"trace{index:04d}-{kind}" for index in range(TRACE_COUNT) for kind in ('root', 'child')}
+    with open(output_path) as f:
+        assert json.load(f) == first
+    with open(state_path) as f:
+        state = json.load(f)
+    assert set(state['services']) == {'compose-post-service', 'post-storage-service'}
+
+    second = extractData.fetch_new_traces(jaeger_url, output_path=str(output_path), state_path=str(state_path), **fetch_options)
+
+    assert second == []
+    with open(output_path) as f:
+        assert json.load(f) == first
@@ -0,0 +1,16 @@
+"""
+Compiles call traces into the plan that containers/create.py deploys and replays.
+
+    trace = read_alibaba_2022('filtered_um_100.csv')
+    containers, calls = compile_trace(trace)
+    write_plan(DEFAULT_PLAN_PATH, containers, calls, trace.source)
+"""
+from .cache import CACHE_DIR, PlanCache, cache_key, cached_plan
+from .core import build_calls, compile_trace, count_replicas, drop_unknown_services, expand_counts
+from .graph import ServiceGraph
+from .plan import (DEFAULT_PLAN_PATH, PlanCalls, PlanWriter, collapse_entries, index_plan, iter_plan_services, load_plan,
+                   read_plan_header, rename_plan, update_plan_containers, validate_header, validate_service_calls,
+                   write_plan)
+from .sampling import print_sampling_report, sample_services, sample_stride, sample_traces, sampling_report
+from .sources import SOURCES, Trace, read_alibaba_2021, read_alibaba_2022, read_jaeger_calls
+from .transforms import amplify
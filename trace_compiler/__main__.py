@@ -0,0 +1,80 @@
+import argparse
+
+from .cache import PlanCache, cache_key, cached_plan
+from .core import compile_trace
+from .plan import DEFAULT_PLAN_PATH, read_plan_header, write_plan
+from .sampling import print_sampling_report, sample_services, sample_stride, sample_traces, sampling_report
+from .sources import SOURCES
+from .transforms import amplify
+
+
+def main():
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('-o', '--output', default=DEFAULT_PLAN_PATH, help="Plan file to write (default: containers/plan.jsonl).")
+    common.add_argument('--keep-trace-ids', action='store_true',
+                        help="Keep the trace ID of every call, for the trace affinity split of create.py.")
+    common.add_argument('--no-cache', action='store_true', help="Always compile, without reading or filling the plan cache.")
+    amplification = common.add_argument_group('load amplification')
+    amplification.add_argument('--speedup', type=float, default=1, help="Compress the time axis of the trace by this factor.")
+    amplification.add_argument('--overlay', type=int, default=1, help="Overlay this many time-shifted copies of the trace.")
+    amplification.add_argument('--overlay-shift', type=int, default=None,
+                               help="Shift between overlaid copies, in trace time units (default: the trace span divided by --overlay).")
+    sampling = common.add_argument_group('sampling')
+    sampling.add_argument('--sample-traces', type=float, default=None, metavar='FRACTION', help="Keep this fraction of the trace IDs.")
+    sampling.add_argument('--sample-services', default=None, metavar='FRACTION|MS_1,MS_2',
+                          help="Keep the calls of a fraction of the upstream services, or of a comma separated list of them.")
+    sampling.add_argument('--sample-stride', type=int, default=None, metavar='N', help="Keep every N-th call of every edge.")
+    sampling.add_argument('--seed', type=int, default=0, help="Seed of the samplers.")
+
+    parser = argparse.ArgumentParser(prog='python -m trace_compiler', description="Compile a trace into the plan read by containers/create.py.")
+    subparsers = parser.add_subparsers(dest='source', required=True)
+
+    alibaba_2021 = subparsers.add_parser('alibaba-2021', parents=[common], help="Alibaba 2021 call graph and msName/msinstanceid CSVs.")
+    alibaba_2021.add_argument('calls_file')
+    alibaba_2021.add_argument('instances_file')
+
+    alibaba_2022 = subparsers.add_parser('alibaba-2022', parents=[common], help="Alibaba 2022 call graph CSV.")
+    alibaba_2022.add_argument('file')
+
+    jaeger = subparsers.add_parser('jaeger', parents=[common], help="DeathStarBench traces.json extracted from Jaeger.")
+    jaeger.add_argument('file')
+
+    args = parser.parse_args()
+    if args.source == 'alibaba-2021':
+        input_files = [args.calls_file, args.instances_file]
+    else:
+        input_files = [args.file]
+
+    def build(plan_path):
+        trace = SOURCES[args.source](*input_files)
+
+        sampled = trace
+        if args.sample_traces is not None:
+            sampled = sample_traces(sampled, args.sample_traces, args.seed)
+        if args.sample_services is not None:
+            if args.sample_services.replace('.', '', 1).isdigit():
+                sampled = sample_services(sampled, fraction=float(args.sample_services), seed=args.seed)
+            else:
+                sampled = sample_services(sampled, services=args.sample_services.split(','), seed=args.seed)
+        if args.sample_stride is not None:
+            sampled = sample_stride(sampled, args.sample_stride, args.seed)
+        if sampled is not trace:
+            print_sampling_report(*sampling_report(trace, sampled))
+
+        trace = amplify(sampled, args.speedup, args.overlay, args.overlay_shift)
+        containers, calls = compile_trace(trace, args.keep_trace_ids)
+        write_plan(plan_path, containers, calls, trace.source)
+
+    if args.no_cache:
+        build(args.output)
+    else:
+        # Inputs are keyed by content; every other option but the output path changes the plan
+        ignored = ('output', 'no_cache', 'file', 'calls_file', 'instances_file')
+        options = {key: value for key, value in vars(args).items() if key not in ignored}
+        cached_plan(PlanCache(), cache_key(input_files, options), args.output, build)
+
+    header = read_plan_header(args.output)
+    print(f"Wrote a plan with {len(header['containers'])} containers to {args.output}.")
+
+if __name__ == '__main__':
+    main()
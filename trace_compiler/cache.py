@@ -0,0 +1,110 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+from .plan import COMPILER_VERSION, PLAN_VERSION
+
+# Content-addressed cache of compiled plans and of the artifacts derived from them (the *_mapped.json
+# files of containers/create.py). Every entry is a directory named after the hash of its inputs and
+# options; the least recently used entries are evicted once the cache grows past its size limit.
+CACHE_DIR = os.getenv("PLAN_CACHE_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.plan_cache'))
+CACHE_MAX_BYTES = int(os.getenv("PLAN_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+
+READ_SIZE = 1 << 20
+
+
+def cache_key(paths, options=None):
+    """
+    sha256 of the plan and compiler versions, the contents of the input files (in order) and the JSON
+    encoded options.
+    """
+    digest = hashlib.sha256(f"{PLAN_VERSION}:{COMPILER_VERSION}\0".encode())
+    for path in paths:
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(READ_SIZE), b''):
+                digest.update(block)
+        digest.update(b'\0')
+    digest.update(json.dumps(options, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+class PlanCache:
+    def __init__(self, directory=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def entry_path(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, key):
+        """
+        Path of the entry directory for key, or None on a miss. A hit marks the entry as recently used.
+        """
+        path = self.entry_path(key)
+        if not os.path.isdir(path):
+            return None
+        os.utime(path)
+        return path
+
+    def restore(self, key, files):
+        """
+        Copy the cached files {name: destination} of key into place. Returns False on a miss.
+        """
+        path = self.get(key)
+        if path is None or not all(os.path.isfile(os.path.join(path, name)) for name in files):
+            return False
+        for name, destination in files.items():
+            shutil.copyfile(os.path.join(path, name), destination)
+        return True
+
+    def put(self, key, files):
+        """
+        Store the files {name: source path} under key, then evict entries past the size limit.
+        """
+        staging = tempfile.mkdtemp(dir=self.directory, prefix='.staging-')
+        for name, source in files.items():
+            shutil.copyfile(source, os.path.join(staging, name))
+        try:
+            os.rename(staging, self.entry_path(key))
+        except OSError:
+            # Another process stored the same key first
+            shutil.rmtree(staging, ignore_errors=True)
+        self.evict(keep=key)
+
+    def evict(self, keep=None):
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.startswith('.') or not os.path.isdir(path):
+                continue
+            entries.append((os.path.getmtime(path), directory_size(path), name))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if name == keep:
+                continue
+            shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+            total -= size
+            print(f"Evicted cached plan {name} ({size} bytes).")
+
+
+def cached_plan(cache, key, plan_path, build):
+    """
+    Restore the plan cached under key into plan_path, or call build(plan_path) to write it and cache the
+    result. Returns True on a cache hit.
+    """
+    if cache.restore(key, {'plan.jsonl': plan_path}):
+        print(f"Plan restored from the cache ({key[:12]}).")
+        return True
+    build(plan_path)
+    cache.put(key, {'plan.jsonl': plan_path})
+    return False
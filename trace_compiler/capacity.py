@@ -0,0 +1,125 @@
+import argparse
+import math
+
+import numpy as np
+
+from .plan import DEFAULT_PLAN_PATH, iter_plan_services, read_plan_header, update_plan_containers
+
+# Plan timestamps are replayed as milliseconds
+TIMESTAMPS_PER_SECOND = 1000
+STATISTICS = ('p99', 'peak')
+
+
+def per_second_calls(plan_path):
+    """
+    Count the outbound and inbound calls of every service in every second of the plan.
+    Returns (first second, {service: outbound counts by second}, {service: inbound counts by second}),
+    the counts being dicts of {second: calls}.
+    """
+    outbound = {}
+    inbound = {}
+    first_second = None
+    for service, calls in iter_plan_services(plan_path):
+        service_outbound = outbound.setdefault(service, {})
+        for timestamp, entries in calls.items():
+            second = int(timestamp) // TIMESTAMPS_PER_SECOND
+            first_second = second if first_second is None else min(first_second, second)
+            for entry in entries:
+                count = entry.get('count', 1)
+                service_outbound[second] = service_outbound.get(second, 0) + count
+                service_inbound = inbound.setdefault(entry['dm_service'], {})
+                service_inbound[second] = service_inbound.get(second, 0) + count
+    return first_second, outbound, inbound
+
+
+def rate_statistics(counts, first_second, seconds):
+    """
+    Peak and p99 of the per-second rate over the whole plan span, idle seconds included.
+    """
+    if not counts:
+        return 0.0, 0.0
+    rates = np.zeros(seconds)
+    for second, calls in counts.items():
+        rates[second - first_second] = calls
+    return float(rates.max()), float(np.percentile(rates, 99))
+
+
+def plan_capacity(plan_path, budget, statistic='p99', min_replicas=1, max_replicas=None):
+    """
+    Recommend replicas for every container of a plan so that no pod handles more than `budget` calls per
+    second (inbound plus outbound) at the chosen rate statistic. Returns the plan containers with their
+    recommended "replicas", the "traceReplicas" they had and their "callRates".
+    """
+    if budget <= 0:
+        raise ValueError(f"budget must be positive, got {budget}")
+    if statistic not in STATISTICS:
+        raise ValueError(f"statistic must be one of {STATISTICS}, got {statistic}")
+
+    containers = read_plan_header(plan_path)['containers']
+    first_second, outbound, inbound = per_second_calls(plan_path)
+    last_second = max((second for counts in outbound.values() for second in counts), default=first_second)
+    seconds = 0 if first_second is None else last_second - first_second + 1
+
+    planned = []
+    for container in containers:
+        service = container['msName']
+        outbound_peak, outbound_p99 = rate_statistics(outbound.get(service), first_second, seconds)
+        inbound_peak, inbound_p99 = rate_statistics(inbound.get(service), first_second, seconds)
+
+        # Combined per-second load of the service, taken at the chosen statistic
+        total = {}
+        for counts in (outbound.get(service, {}), inbound.get(service, {})):
+            for second, calls in counts.items():
+                total[second] = total.get(second, 0) + calls
+        total_peak, total_p99 = rate_statistics(total, first_second, seconds)
+        load = total_p99 if statistic == 'p99' else total_peak
+
+        replicas = max(min_replicas, math.ceil(load / budget))
+        if max_replicas is not None:
+            replicas = min(replicas, max_replicas)
+
+        planned.append({
+            **container,
+            "replicas": replicas,
+            "traceReplicas": container.get('traceReplicas', container['replicas']),
+            "callRates": {
+                "outboundPeak": outbound_peak,
+                "outboundP99": outbound_p99,
+                "inboundPeak": inbound_peak,
+                "inboundP99": inbound_p99
+            }
+        })
+    return planned
+
+
+def print_capacity(containers, budget):
+    print(f"{'service':<24}{'out peak':>10}{'out p99':>10}{'in peak':>10}{'in p99':>10}{'trace':>8}{'planned':>9}")
+    for container in containers:
+        rates = container['callRates']
+        print(f"{container['msName']:<24}{rates['outboundPeak']:>10.1f}{rates['outboundP99']:>10.1f}"
+              f"{rates['inboundPeak']:>10.1f}{rates['inboundP99']:>10.1f}{container['traceReplicas']:>8}{container['replicas']:>9}")
+    trace_pods = sum(container['traceReplicas'] for container in containers)
+    planned_pods = sum(container['replicas'] for container in containers)
+    print(f"Pods: {trace_pods} in the trace, {planned_pods} planned at {budget} calls/s per pod.")
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m trace_compiler.capacity',
+                                     description="Size the replicas of a plan from its per-second call rates.")
+    parser.add_argument('plan', nargs='?', default=DEFAULT_PLAN_PATH, help="Plan to size (default: containers/plan.jsonl).")
+    parser.add_argument('--budget', type=float, required=True, help="Calls per second (inbound plus outbound) one pod can handle.")
+    parser.add_argument('--statistic', choices=STATISTICS, default='p99', help="Per-second rate the replicas are sized for.")
+    parser.add_argument('--min-replicas', type=int, default=1)
+    parser.add_argument('--max-replicas', type=int, default=None)
+    parser.add_argument('--apply', action='store_true', help="Write the planned replicas into the plan.")
+    args = parser.parse_args()
+
+    containers = plan_capacity(args.plan, args.budget, args.statistic, args.min_replicas, args.max_replicas)
+    print_capacity(containers, args.budget)
+    if args.apply:
+        update_plan_containers(args.plan, containers)
+        print(f"Updated the containers of {args.plan}.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+import numpy as np
+import pandas as pd
+
+
+def drop_unknown_services(df):
+    """
+    Drop the calls whose upstream or downstream service is unknown ('?' in its name).
+    """
+    unknown = df['um'].str.contains('?', regex=False, na=True) | df['dm'].str.contains('?', regex=False, na=True)
+    return df[~unknown.to_numpy(dtype=bool)]
+
+
+def build_calls(df, keep_trace_ids=False):
+    """
+    Build the plan calls {um: {timestamp: [{dm_service, communication_type[, count][, traceid]}]}} from a
+    timestamp sorted and filtered call frame. With keep_trace_ids (and a traceid column), every entry
+    keeps the trace it belongs to, for trace affinity when calls are split between replicas.
+
+    Identical (um, timestamp, dm, rpctype) rows are collapsed into one entry with their count (omitted
+    when 1); the worker fans them out again at dispatch time. Rows are then grouped by (um, timestamp)
+    with a single stable argsort over the group codes, so every group becomes one contiguous slice of
+    the entries. Services, timestamps and entries keep the order in which they first appear in the
+    sorted trace. Timestamps are stored as strings, the way they come back from JSON.
+    """
+    if df.empty:
+        return {}
+
+    keep_trace_ids = keep_trace_ids and 'traceid' in df
+    keys = ['um', 'timestamp', 'dm', 'rpctype'] + (['traceid'] if keep_trace_ids else [])
+    counts = df.groupby(keys, sort=False, dropna=False).size().tolist()
+    df = df[~df.duplicated(keys).to_numpy()]
+
+    codes = df.groupby(['um', 'timestamp'], sort=False).ngroup().to_numpy()
+    order = np.argsort(codes, kind='stable')
+    sorted_codes = codes[order]
+
+    bounds = np.flatnonzero(np.diff(sorted_codes)) + 1
+    starts = np.concatenate(([0], bounds)).tolist()
+    ends = np.concatenate((bounds, [len(sorted_codes)])).tolist()
+
+    ums = df['um'].to_numpy()[order].tolist()
+    timestamps = df['timestamp'].to_numpy()[order].tolist()
+    entries = [
+        {"dm_service": dm, "communication_type": rpctype, "count": count} if count > 1 else
+        {"dm_service": dm, "communication_type": rpctype}
+        for dm, rpctype, count in zip(df['dm'].to_numpy()[order].tolist(), df['rpctype'].to_numpy()[order].tolist(),
+                                      np.asarray(counts)[order].tolist())
+    ]
+    if keep_trace_ids:
+        for entry, traceid in zip(entries, df['traceid'].astype(str).to_numpy()[order].tolist()):
+            entry["traceid"] = traceid
+
+    result = {}
+    for start, end in zip(starts, ends):
+        result.setdefault(ums[start], {})[str(timestamps[start])] = entries[start:end]
+    return result
+
+
+def expand_counts(calls):
+    """
+    Undo the collapsing of build_calls: repeat every entry `count` times, without the count.
+    """
+    return {
+        um: {
+            timestamp: [
+                {"dm_service": entry["dm_service"], "communication_type": entry["communication_type"]}
+                for entry in entries for _ in range(entry.get("count", 1))
+            ]
+            for timestamp, entries in service_calls.items()
+        }
+        for um, service_calls in calls.items()
+    }
+
+
+def count_replicas(services, instances):
+    """
+    Count the distinct instance IDs of every service and return them as plan containers
+    [{msName, replicas}]. Services are listed in the order they first appear.
+    """
+    replicas = pd.Series(np.asarray(instances), dtype=object).groupby(np.asarray(services), sort=False).nunique(dropna=False)
+    return [
+        {"msName": msname, "replicas": int(count)}
+        for msname, count in zip(replicas.index.tolist(), replicas.tolist())
+    ]
+
+
+def call_instances(df):
+    """
+    (services, instances) of both ends of every call, interleaved per row (um first) so services are
+    counted in the order they are first seen. Sources without instance IDs count one replica per service.
+    """
+    services = np.column_stack((df['um'].to_numpy(), df['dm'].to_numpy())).ravel()
+    if 'uminstanceid' in df and 'dminstanceid' in df:
+        instances = np.column_stack((df['uminstanceid'].to_numpy(), df['dminstanceid'].to_numpy())).ravel()
+    else:
+        instances = services
+    return services, instances
+
+
+def compile_trace(trace, keep_trace_ids=False):
+    """
+    Compile a Trace from one of the source adapters into plan (containers, calls).
+    """
+    df = drop_unknown_services(trace.calls.sort_values(by='timestamp'))
+    calls = build_calls(df, keep_trace_ids)
+
+    if trace.instances is not None:
+        containers = count_replicas(trace.instances['service'].to_numpy(), trace.instances['instance'].to_numpy())
+    else:
+        containers = count_replicas(*call_instances(df))
+    return containers, calls
@@ -0,0 +1,60 @@
+class ServiceGraph:
+    """
+    Index of the service graph of a plan, built in one pass over its service lines so later stages can
+    answer questions about services without rescanning the calls. Counts include the multiplicity of
+    collapsed entries.
+      edges: {um: {dm: {communication_type: calls}}}
+      outbound / inbound: {service: calls made / received}
+      inbound_types: {dm: {communication_type: calls}}, types in the order they are first seen
+    """
+
+    def __init__(self):
+        self.edges = {}
+        self.outbound = {}
+        self.inbound = {}
+        self.inbound_types = {}
+
+    @classmethod
+    def from_calls(cls, calls):
+        """
+        Build the index of a {service: calls} mapping (a loaded plan or a PlanCalls).
+        """
+        graph = cls()
+        for service, service_calls in calls.items():
+            graph.add_service_calls(service, service_calls)
+        return graph
+
+    def add_service_calls(self, service, calls):
+        service_edges = self.edges.setdefault(service, {})
+        outbound = self.outbound.get(service, 0)
+        for entries in calls.values():
+            for entry in entries:
+                dm = entry['dm_service']
+                communication_type = entry['communication_type']
+                count = entry.get('count', 1)
+
+                edge = service_edges.setdefault(dm, {})
+                edge[communication_type] = edge.get(communication_type, 0) + count
+                inbound_types = self.inbound_types.setdefault(dm, {})
+                inbound_types[communication_type] = inbound_types.get(communication_type, 0) + count
+                self.inbound[dm] = self.inbound.get(dm, 0) + count
+                outbound += count
+        self.outbound[service] = outbound
+
+    def edge_weights(self, communication_type=None):
+        """
+        {(um, dm): calls} of every edge, optionally counting only one communication type.
+        """
+        weights = {}
+        for um, service_edges in self.edges.items():
+            for dm, types in service_edges.items():
+                calls = sum(types.values()) if communication_type is None else types.get(communication_type, 0)
+                if calls:
+                    weights[(um, dm)] = calls
+        return weights
+
+    def callees(self, service):
+        return list(self.edges.get(service, {}))
+
+    def callers(self, service):
+        return [um for um, service_edges in self.edges.items() if service in service_edges]
@@ -0,0 +1,251 @@
+import json
+import os
+from collections.abc import Mapping
+
+# A plan is a JSON lines file: a header line with the containers to deploy, then one line per
+# upstream service with the calls it replays. Identical calls at one timestamp are stored once, with
+# their count (version 2; the count is omitted when 1, so version 1 plans are read as they are).
+#   {"format": "capstone-plan", "version": 2, "source": "alibaba-2022", "containers": [{"msName": "MS_1", "replicas": 2}, ...]}
+#   {"service": "MS_1", "calls": {"<timestamp>": [{"dm_service": "MS_2", "communication_type": "rpc", "count": 3}, ...], ...}}
+PLAN_FORMAT = 'capstone-plan'
+PLAN_VERSION = 2
+SUPPORTED_VERSIONS = (1, 2)
+# Part of every plan cache key: bump it whenever the compiler writes different plans (or create.py
+# different renamed calls) for the same input, so entries of older compilers are no longer hits
+COMPILER_VERSION = 1
+DEFAULT_PLAN_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'containers', 'plan.jsonl')
+
+SEPARATORS = (',', ':')
+
+
+def validate_containers(containers):
+    if not isinstance(containers, list):
+        raise ValueError("Plan containers must be a list")
+    names = set()
+    for container in containers:
+        if not isinstance(container, dict) or not isinstance(container.get('msName'), str):
+            raise ValueError(f"Invalid plan container {container!r}: msName must be a string")
+        replicas = container.get('replicas')
+        if not isinstance(replicas, int) or isinstance(replicas, bool) or replicas < 1:
+            raise ValueError(f"Invalid plan container {container['msName']}: replicas must be a positive integer")
+        if container['msName'] in names:
+            raise ValueError(f"Duplicate plan container {container['msName']}")
+        names.add(container['msName'])
+
+
+def validate_service_calls(service, calls):
+    if not isinstance(service, str):
+        raise ValueError(f"Invalid plan service {service!r}: must be a string")
+    if not isinstance(calls, dict):
+        raise ValueError(f"Invalid calls for service {service}: must be a mapping of timestamps")
+    for timestamp, entries in calls.items():
+        if not timestamp.lstrip('-').isdigit():
+            raise ValueError(f"Invalid timestamp {timestamp!r} for service {service}")
+        if not isinstance(entries, list):
+            raise ValueError(f"Invalid calls at {timestamp} for service {service}: must be a list")
+        for entry in entries:
+            if not isinstance(entry, dict) or not isinstance(entry.get('dm_service'), str) or not isinstance(entry.get('communication_type'), str):
+                raise ValueError(f"Invalid call {entry!r} at {timestamp} for service {service}")
+            count = entry.get('count', 1)
+            if not isinstance(count, int) or isinstance(count, bool) or count < 1:
+                raise ValueError(f"Invalid count of call {entry!r} at {timestamp} for service {service}")
+
+
+def validate_header(header):
+    if not isinstance(header, dict) or header.get('format') != PLAN_FORMAT:
+        raise ValueError("Not a plan file: missing the plan header")
+    if header.get('version') not in SUPPORTED_VERSIONS:
+        raise ValueError(f"Unsupported plan version {header.get('version')} (expected one of {SUPPORTED_VERSIONS})")
+    validate_containers(header.get('containers'))
+
+
+def collapse_entries(calls):
+    """
+    Plan entries of the (dm_service, communication_type) calls made at one timestamp, with identical
+    calls collapsed into one entry and their count, in order of first appearance.
+    """
+    counts = {}
+    for call in calls:
+        counts[call] = counts.get(call, 0) + 1
+    return [
+        {"dm_service": dm, "communication_type": rpctype, "count": count} if count > 1 else
+        {"dm_service": dm, "communication_type": rpctype}
+        for (dm, rpctype), count in counts.items()
+    ]
+
+
+class PlanWriter:
+    """
+    Writes a plan file one service at a time. Services can be written whole with write_service or, when
+    they do not fit in memory, streamed one timestamp at a time between begin_service and end_service.
+    The byte offset of every service line is recorded in `offsets`.
+    """
+
+    def __init__(self, path, containers, source, validate=True):
+        if validate:
+            validate_containers(containers)
+        self.validate = validate
+        self.file = open(path, 'w')
+        self.file.write(json.dumps({"format": PLAN_FORMAT, "version": PLAN_VERSION, "source": source, "containers": containers}, separators=SEPARATORS) + '\n')
+        self.first_timestamp = None
+        self.offsets = {}
+
+    def write_service(self, service, calls):
+        if self.validate:
+            validate_service_calls(service, calls)
+        self.offsets[service] = self.file.tell()
+        self.file.write(json.dumps({"service": service, "calls": calls}, separators=SEPARATORS) + '\n')
+
+    def begin_service(self, service):
+        self.offsets[service] = self.file.tell()
+        self.file.write('{"service":' + json.dumps(service) + ',"calls":{')
+        self.first_timestamp = True
+
+    def write_timestamp(self, timestamp, entries):
+        if self.validate:
+            validate_service_calls('', {str(timestamp): entries})
+        if not self.first_timestamp:
+            self.file.write(',')
+        self.file.write(json.dumps(str(timestamp)) + ':' + json.dumps(entries, separators=SEPARATORS))
+        self.first_timestamp = False
+
+    def end_service(self):
+        self.file.write('}}\n')
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def write_plan(path, containers, calls, source):
+    """
+    Validate and write a whole plan.
+    """
+    with PlanWriter(path, containers, source) as writer:
+        for service, service_calls in calls.items():
+            writer.write_service(service, service_calls)
+
+
+def read_plan_header(path):
+    with open(path) as f:
+        header = json.loads(f.readline())
+    validate_header(header)
+    return header
+
+
+def iter_plan_services(path):
+    """
+    Yield (service, calls) for every service line of a plan, one line in memory at a time.
+    """
+    with open(path) as f:
+        validate_header(json.loads(f.readline()))
+        for line_number, line in enumerate(f, 2):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if not isinstance(record, dict) or 'service' not in record or not isinstance(record.get('calls'), dict):
+                raise ValueError(f"Invalid plan line {line_number} in {path}")
+            yield record['service'], record['calls']
+
+
+class PlanCalls(Mapping):
+    """
+    Read-only {service: calls} view of a plan that reads a service line only when it is looked up, so
+    the whole plan is never held in memory. offsets maps every service to the byte offset of its line.
+    """
+
+    def __init__(self, path, offsets):
+        self.path = path
+        self.offsets = offsets
+
+    def __getitem__(self, service):
+        with open(self.path) as f:
+            f.seek(self.offsets[service])
+            return json.loads(f.readline())['calls']
+
+    def __iter__(self):
+        return iter(self.offsets)
+
+    def __len__(self):
+        return len(self.offsets)
+
+
+def index_plan(path):
+    """
+    PlanCalls of a plan, indexed with a single scan that only decodes the service name of every line.
+    """
+    decoder = json.JSONDecoder()
+    prefix = '{"service":'
+    offsets = {}
+    with open(path, 'rb') as f:
+        validate_header(json.loads(f.readline()))
+        offset = f.tell()
+        for line in f:
+            text = line.decode()
+            if text.startswith(prefix):
+                service, _ = decoder.raw_decode(text, len(prefix))
+            elif text.strip():
+                service = json.loads(text)['service']
+            else:
+                service = None
+            if service is not None:
+                offsets[service] = offset
+            offset += len(line)
+    return PlanCalls(path, offsets)
+
+
+def rename_plan(path, output_path, names, graph=None):
+    """
+    Stream a plan into output_path with every service renamed through names ({name: new name}), one
+    service line in memory at a time. Services missing from names keep their name, with a warning.
+    When a ServiceGraph is given, the renamed calls are indexed into it in the same pass.
+    Returns the PlanCalls of the renamed plan.
+    """
+    def rename(service):
+        if service not in names:
+            print(f"Warning: {service} not found in the renamed containers. Skipping.")
+            return service
+        return names[service]
+
+    header = read_plan_header(path)
+    containers = [{**container, "msName": rename(container['msName'])} for container in header['containers']]
+    with PlanWriter(output_path, containers, header.get('source'), validate=False) as writer:
+        for service, calls in iter_plan_services(path):
+            service = rename(service)
+            calls = {
+                timestamp: [{**entry, "dm_service": rename(entry['dm_service'])} for entry in entries]
+                for timestamp, entries in calls.items()
+            }
+            writer.write_service(service, calls)
+            if graph is not None:
+                graph.add_service_calls(service, calls)
+    return PlanCalls(output_path, writer.offsets)
+
+
+def update_plan_containers(path, containers):
+    """
+    Replace the containers in the header of a plan, copying its service lines as they are.
+    """
+    validate_containers(containers)
+    staging_path = f"{path}.tmp"
+    with open(path) as source, open(staging_path, 'w') as target:
+        header = json.loads(source.readline())
+        validate_header(header)
+        target.write(json.dumps({**header, "containers": containers}, separators=SEPARATORS) + '\n')
+        for line in source:
+            target.write(line)
+    os.replace(staging_path, path)
+
+
+def load_plan(path=DEFAULT_PLAN_PATH):
+    """
+    Load a whole plan as (containers, calls).
+    """
+    containers = read_plan_header(path)['containers']
+    calls = dict(iter_plan_services(path))
+    return containers, calls
@@ -0,0 +1,114 @@
+import pandas as pd
+
+from .core import drop_unknown_services
+
+EDGE_COLUMNS = ['um', 'dm', 'rpctype']
+FAN_OUT_QUANTILES = [0.5, 0.9, 0.99, 1.0]
+
+
+def hash_fraction(values, seed):
+    """
+    Map values to deterministic pseudo-random numbers in [0, 1), the same for a value wherever it appears.
+    """
+    hashes = pd.util.hash_pandas_object(values.astype(str), index=False, hash_key=f"{seed:016d}"[-16:])
+    return (hashes.to_numpy() >> 11) / float(1 << 53)
+
+
+def restrict_instances(trace, calls):
+    """
+    Replace the calls of a trace, dropping the instances of services that no longer appear in them.
+    """
+    instances = trace.instances
+    if instances is not None:
+        services = pd.unique(pd.concat([calls['um'], calls['dm']]))
+        instances = instances[instances['service'].isin(services)]
+    return trace._replace(calls=calls, instances=instances)
+
+
+def sample_traces(trace, fraction, seed=0):
+    """
+    Keep whole traces: a trace ID is kept with probability `fraction`, so every kept request keeps its
+    complete call tree and the fan-out of its services.
+    """
+    if not 0 < fraction <= 1:
+        raise ValueError(f"fraction must be in (0, 1], got {fraction}")
+    if 'traceid' not in trace.calls:
+        raise ValueError(f"{trace.source} traces have no trace IDs to sample by")
+    calls = trace.calls
+    return restrict_instances(trace, calls[hash_fraction(calls['traceid'], seed) < fraction])
+
+
+def sample_services(trace, services=None, fraction=None, seed=0):
+    """
+    Keep the calls made by a subset of the upstream services, either the given `services` or a
+    `fraction` of them. Kept services replay all of their calls, at their recorded rates.
+    """
+    calls = trace.calls
+    if services is not None:
+        keep = calls['um'].isin(services)
+    elif fraction is not None and 0 < fraction <= 1:
+        keep = hash_fraction(calls['um'], seed) < fraction
+    else:
+        raise ValueError("sample_services needs services or a fraction in (0, 1]")
+    return restrict_instances(trace, calls[keep])
+
+
+def sample_stride(trace, stride, seed=0):
+    """
+    Keep every `stride`-th call of each (um, dm, rpctype) edge in time order, which scales the rate of
+    every edge by 1/stride. Every edge starts at its own pseudo-random phase, so edges with fewer than
+    `stride` calls are kept in proportion to their size rather than always keeping their first call.
+    """
+    if stride < 1:
+        raise ValueError(f"stride must be at least 1, got {stride}")
+    calls = trace.calls.sort_values(by='timestamp', kind='stable')
+    edges = calls['um'].astype(str) + ' ' + calls['dm'].astype(str) + ' ' + calls['rpctype'].astype(str)
+    phase = (hash_fraction(edges, seed) * stride).astype('int64')
+    keep = calls.groupby(EDGE_COLUMNS, sort=False).cumcount().to_numpy() % stride == phase
+    return restrict_instances(trace, calls[keep])
+
+
+def edge_counts(calls):
+    return drop_unknown_services(calls).groupby(EDGE_COLUMNS).size()
+
+
+def fan_out(calls):
+    """
+    Number of downstream calls an upstream service makes at every timestamp it calls at.
+    """
+    return drop_unknown_services(calls).groupby(['um', 'timestamp']).size()
+
+
+def sampling_report(original, sampled):
+    """
+    Compare a sampled trace with its source. Returns (edges, fan_out):
+      edges: calls of every edge before and after, the fraction kept and the share of all calls it has
+      fan_out: quantiles of the per-timestamp fan-out before and after
+    """
+    before = edge_counts(original.calls)
+    after = edge_counts(sampled.calls).reindex(before.index, fill_value=0)
+    edges = pd.DataFrame({'calls_before': before, 'calls_after': after})
+    edges['kept'] = after / before
+    edges['share_before'] = before / max(before.sum(), 1)
+    edges['share_after'] = after / max(after.sum(), 1)
+
+    fan_out_quantiles = pd.DataFrame({
+        'before': fan_out(original.calls).quantile(FAN_OUT_QUANTILES),
+        'after': fan_out(sampled.calls).quantile(FAN_OUT_QUANTILES),
+    })
+    return edges, fan_out_quantiles
+
+
+def print_sampling_report(edges, fan_out_quantiles, top=10):
+    total_before = int(edges['calls_before'].sum())
+    total_after = int(edges['calls_after'].sum())
+    # Total variation distance between the edge mixes: 0 when every edge keeps its share of the calls
+    distance = (edges['share_before'] - edges['share_after']).abs().sum() / 2
+
+    print(f"Kept {total_after} of {total_before} calls ({total_after / max(total_before, 1):.1%}).")
+    print(f"Edges kept: {int((edges['calls_after'] > 0).sum())} of {len(edges)}, edge mix distance: {distance:.4f}")
+    print("Largest edge share deviations:")
+    deviation = (edges['share_after'] - edges['share_before']).abs().sort_values(ascending=False)
+    print(edges.loc[deviation.index[:top]].to_string(float_format=lambda value: f"{value:.4f}"))
+    print("Fan-out per (um, timestamp) quantiles:")
+    print(fan_out_quantiles.to_string())
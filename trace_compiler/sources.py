@@ -0,0 +1,50 @@
+import json
+from collections import namedtuple
+
+import pandas as pd
+
+# A trace normalized by a source adapter.
+#   calls: one row per call with the CALL_COLUMNS (traceid may be missing) and, when the source has
+#          them, the uminstanceid/dminstanceid columns
+#   instances: (service, instance) rows to count replicas from, or None to count them from the calls
+Trace = namedtuple('Trace', ['source', 'calls', 'instances'])
+
+CALL_COLUMNS = ['timestamp', 'traceid', 'um', 'dm', 'rpctype']
+
+
+def read_alibaba_2021(calls_file, instances_file):
+    """
+    Alibaba 2021 call graph plus its msName/msinstanceid table (the /upload form).
+    """
+    calls = pd.read_csv(calls_file)
+    instances = pd.read_csv(instances_file, usecols=['msName', 'msinstanceid'])
+    instances = instances.rename(columns={'msName': 'service', 'msinstanceid': 'instance'})
+    return Trace('alibaba-2021', calls, instances)
+
+
+def read_alibaba_2022(file):
+    """
+    Alibaba 2022 call graph (the /v2022 form); replicas come from uminstanceid/dminstanceid.
+    """
+    return Trace('alibaba-2022', pd.read_csv(file), None)
+
+
+def read_jaeger_calls(data):
+    """
+    DeathStarBench calls extracted from Jaeger ([{um, dm, timestamp, duration}], the traces.json
+    written by extractData.py/extractDataV2.py), given as a path or as the loaded list. Jaeger does not
+    record a protocol, so every call is replayed over http, and every service gets one replica.
+    """
+    if isinstance(data, str):
+        with open(data) as f:
+            data = json.load(f)
+    calls = pd.DataFrame(data, columns=['timestamp', 'um', 'dm'])
+    calls['rpctype'] = 'http'
+    return Trace('jaeger', calls, None)
+
+
+SOURCES = {
+    'alibaba-2021': read_alibaba_2021,
+    'alibaba-2022': read_alibaba_2022,
+    'jaeger': read_jaeger_calls,
+}
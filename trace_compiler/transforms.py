@@ -0,0 +1,41 @@
+import pandas as pd
+
+
+def amplify(trace, speedup=1, copies=1, shift=None):
+    """
+    Amplify the load of a trace for stress replays: compress its time axis by `speedup`, then overlay
+    `copies` copies of it, each shifted by `shift` (defaults to the compressed span divided by copies, so
+    the copies interleave evenly over the same window).
+
+    Every copy holds the same calls, so per-edge ratios and the communication type mix are unchanged;
+    only the offered rate grows, by about speedup * copies. Instances are not touched, so the replica
+    counts stay those of the source trace. Trace IDs of the copies get a '-<copy>' suffix.
+    """
+    if speedup <= 0:
+        raise ValueError(f"speedup must be positive, got {speedup}")
+    if copies < 1:
+        raise ValueError(f"copies must be at least 1, got {copies}")
+
+    calls = trace.calls
+    if calls.empty or (speedup == 1 and copies == 1):
+        return trace
+
+    timestamps = pd.to_numeric(calls['timestamp'])
+    start = timestamps.min()
+    if speedup != 1:
+        compressed = start + (timestamps - start) // speedup
+        timestamps = compressed.astype(timestamps.dtype) if timestamps.dtype.kind in 'iu' else compressed
+    calls = calls.assign(timestamp=timestamps)
+
+    if copies > 1:
+        if shift is None:
+            shift = max((timestamps.max() - start + 1) // copies, 1)
+        overlays = [calls]
+        for copy in range(1, copies):
+            overlay = calls.assign(timestamp=timestamps + copy * shift)
+            if 'traceid' in overlay:
+                overlay['traceid'] = overlay['traceid'].astype(str) + f"-{copy}"
+            overlays.append(overlay)
+        calls = pd.concat(overlays, ignore_index=True)
+
+    return trace._replace(calls=calls)